@@ -1,16 +1,33 @@
 #!/usr/bin/env python3
 # Basic example
 import sqlite3
+import collections
+
+from common import apply_profile, insert_many, iter_rows, record_factory
+
+
+# Row types for records=True: tuple subclasses, so row[0] keeps working next to row.name
+Student = collections.namedtuple("Student", "id name age")
+
 
 class StudentDatabase:
-    def __init__(self, db_name):
+    def __init__(self, db_name, records=False):
         self.db_name = db_name
         self.conn = None
+        self.arraysize = 1000
+        self.records = records
+        self.settings = None
 
-    def connect(self):
+    def connect(self, profile=None, **overrides):
+        # profile is one of PROFILES; keyword arguments override single settings, e.g. synchronous="OFF"
         try:
             self.conn = sqlite3.connect(self.db_name)
+            if self.records:
+                self.conn.row_factory = record_factory((Student,))
+            self.settings = apply_profile(self.conn, profile, **overrides)
             print("Connected to the database")
+            if profile or overrides:
+                print("Connection settings: " + ", ".join(f"{name}={value}" for name, value in self.settings.items()))
         except sqlite3.Error as e:
             print(f"An error occurred while connecting to the database: {e}")
 
@@ -34,12 +51,24 @@ class StudentDatabase:
         except sqlite3.Error as e:
             print(f"An error occurred while inserting data: {e}")
 
+    def insert_students_many(self, students, chunk_size=1000):
+        # students is an iterable of (name, age) pairs; returns the (first_id, last_id) range
+        try:
+            id_range = insert_many(self.conn, "INSERT INTO students (name, age) VALUES (?, ?)", students, chunk_size)
+            print("Students inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting students: {e}")
+
+    def iter_query(self, sql, params=(), arraysize=None):
+        return iter_rows(self.conn, sql, params, arraysize or self.arraysize)
+
+    def iter_students(self):
+        return self.iter_query("SELECT * FROM students")
+
     def retrieve_data(self):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM students")
-            rows = cursor.fetchall()
-            for row in rows:
+            for row in self.iter_students():
                 print(f"ID: {row[0]}, Name: {row[1]}, Age: {row[2]}")
         except sqlite3.Error as e:
             print(f"An error occurred while retrieving data: {e}")
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# Connection pool - several threads sharing one database file
+# A sqlite3 connection should only be used by one thread at a time, so the pool hands each
+# thread its own connection (or lends one out with checkout/checkin). The database is switched
+# to WAL mode so that readers do not block the writer and vice versa.
+import sqlite3
+import collections
+import threading
+import time
+from contextlib import contextmanager
+
+from common import apply_profile, insert_many, iter_rows, query_plan, record_factory
+
+
+# Row types for records=True: tuple subclasses, so row[0] keeps working next to row.name
+Student = collections.namedtuple("Student", "id name age")
+Course = collections.namedtuple("Course", "id name student_id")
+
+
+class ConnectionPool:
+    def __init__(self, db_name, max_size=8, timeout=30.0, records=False, profile=None, overrides=None):
+        self.db_name = db_name
+        self.max_size = max_size
+        self.timeout = timeout
+        self.records = records
+        self.profile = profile
+        self.overrides = dict(overrides or {})
+        self._idle = []  # LIFO: the most recently used connection goes out first
+        self._lock = threading.Lock()
+        # Signalled whenever a connection is checked in or a slot in _created is given back
+        self._available = threading.Condition(self._lock)
+        self._local = threading.local()
+        self._created = 0
+        self._closed = False
+        self._checked_out = {}
+        self._started = time.perf_counter()
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._busy_total = 0.0
+        self._replaced = 0
+
+        # WAL is persistent, so setting it once on the first connection covers the whole pool.
+        # Readers and the writer only run side by side in WAL mode, so profiles cannot change it;
+        # an explicit journal_mode override still does.
+        conn = self._open()
+        self.settings = apply_profile(conn, journal_mode=self.overrides.get("journal_mode", "WAL"))
+        self._created = 1
+        self._idle.append(conn)
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_name, timeout=self.timeout, check_same_thread=False)
+        try:
+            if self.records:
+                # A factory per connection, so threads do not keep resetting each other's cached row type
+                conn.row_factory = record_factory((Student, Course))
+            # The per-connection settings; journal_mode is left to __init__
+            apply_profile(conn, self.profile, **dict(self.overrides, journal_mode=None))
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def _open_counted(self):
+        # _open() for a connection already counted in _created; a failure gives the slot back,
+        # otherwise the pool could never grow to max_size again
+        try:
+            return self._open()
+        except BaseException:
+            with self._available:
+                self._created -= 1
+                self._available.notify()
+            raise
+
+    def _healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def checkout(self, timeout=None):
+        start = time.perf_counter()
+        with self._available:
+            # Wait for either an idle connection or a free slot to open a new one in
+            ready = self._available.wait_for(
+                lambda: self._closed or self._idle or self._created < self.max_size,
+                self.timeout if timeout is None else timeout)
+            if self._closed:
+                raise sqlite3.ProgrammingError("connection pool is closed")
+            if not ready:
+                raise sqlite3.OperationalError("timed out waiting for a pooled connection")
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._created += 1
+        if conn is None:
+            conn = self._open_counted()
+
+        # Health check: replace a connection that can no longer run a query
+        if not self._healthy(conn):
+            conn.close()
+            conn = self._open_counted()
+            with self._lock:
+                self._replaced += 1
+
+        now = time.perf_counter()
+        with self._lock:
+            wait = now - start
+            self._checkouts += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._checked_out[id(conn)] = now
+        return conn
+
+    def checkin(self, conn):
+        # Never hand out a connection with a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+        with self._available:
+            self._busy_total += time.perf_counter() - self._checked_out.pop(id(conn))
+            if not self._closed:
+                self._idle.append(conn)
+                self._available.notify()
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.checkout(timeout)
+        try:
+            yield conn
+        finally:
+            self.checkin(conn)
+
+    def thread_connection(self):
+        # The calling thread keeps the same connection until release_thread_connection()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self.checkout()
+        return conn
+
+    def release_thread_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            self.checkin(conn)
+
+    def stats(self):
+        with self._lock:
+            now = time.perf_counter()
+            busy = self._busy_total + sum(now - since for since in self._checked_out.values())
+            return {
+                "size": self._created,
+                "max_size": self.max_size,
+                "in_use": len(self._checked_out),
+                "idle": len(self._idle),
+                "checkouts": self._checkouts,
+                "replaced": self._replaced,
+                "wait_total": self._wait_total,
+                "wait_avg": self._wait_total / self._checkouts if self._checkouts else 0.0,
+                "wait_max": self._wait_max,
+                "utilization": busy / (self.max_size * (now - self._started)),
+            }
+
+    def close(self):
+        # Idle connections are closed now, checked-out ones when they are checked in
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            # Waiting checkouts fail with "connection pool is closed" instead of timing out
+            self._available.notify_all()
+        for conn in idle:
+            conn.close()
+
+
+class StudentDatabase:
+    def __init__(self, db_name, pool_size=8, records=False):
+        self.db_name = db_name
+        self.pool_size = pool_size
+        self.pool = None
+        self.arraysize = 1000
+        self.records = records
+
+    @property
+    def conn(self):
+        # Every method below runs on the calling thread's pooled connection
+        return self.pool.thread_connection()
+
+    def connect(self, profile=None, **overrides):
+        # profile is one of PROFILES; keyword arguments override single settings, e.g. synchronous="OFF"
+        try:
+            self.pool = ConnectionPool(self.db_name, max_size=self.pool_size, records=self.records,
+                                       profile=profile, overrides=overrides)
+            print("Connected to the database")
+            if profile or overrides:
+                print("Connection settings: " + ", ".join(f"{name}={value}" for name, value in self.pool.settings.items()))
+        except sqlite3.Error as e:
+            print(f"An error occurred while connecting to the database: {e}")
+
+    def release_connection(self):
+        # Worker threads call this when they are done so the connection returns to the pool
+        self.pool.release_thread_connection()
+
+    def create_tables(self):
+        try:
+            cursor = self.conn.cursor()
+
+            # Create the students table
+            cursor.execute('''CREATE TABLE IF NOT EXISTS students
+                              (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                               name TEXT,
+                               age INTEGER)''')
+
+            # Create the courses table
+            cursor.execute('''CREATE TABLE IF NOT EXISTS courses
+                              (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                               name TEXT,
+                               student_id INTEGER,
+                               FOREIGN KEY (student_id) REFERENCES students(id))''')
+
+            print("Tables created successfully")
+            self.ensure_indexes()
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the tables: {e}")
+
+    def ensure_indexes(self):
+        # Indexes for the access paths the queries use: joins and lookups on courses.student_id,
+        # courses deleted with their student, name lookups and age filters/aggregates
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_courses_student_id_name ON courses (student_id, name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_name ON students (name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_age ON students (age)")
+            self.conn.commit()
+            print("Indexes created successfully")
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the indexes: {e}")
+
+    def query_plan(self, sql, params=()):
+        return query_plan(self.conn, sql, params)
+
+    def insert_student(self, name, age):
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("INSERT INTO students (name, age) VALUES (?, ?)", (name, age))
+            self.conn.commit()
+            print("Student inserted successfully")
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting student: {e}")
+
+    def insert_course(self, name, student_id):
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("INSERT INTO courses (name, student_id) VALUES (?, ?)", (name, student_id))
+            self.conn.commit()
+            print("Course inserted successfully")
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting course: {e}")
+
+    def insert_students_many(self, students, chunk_size=1000):
+        # students is an iterable of (name, age) pairs; returns the (first_id, last_id) range
+        try:
+            id_range = insert_many(self.conn, "INSERT INTO students (name, age) VALUES (?, ?)", students, chunk_size)
+            print("Students inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting students: {e}")
+
+    def insert_courses_many(self, courses, chunk_size=1000):
+        # courses is an iterable of (name, student_id) pairs; returns the (first_id, last_id) range
+        try:
+            id_range = insert_many(self.conn, "INSERT INTO courses (name, student_id) VALUES (?, ?)", courses, chunk_size)
+            print("Courses inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting courses: {e}")
+
+    def iter_query(self, sql, params=(), arraysize=None):
+        return iter_rows(self.conn, sql, params, arraysize or self.arraysize)
+
+    def iter_students(self):
+        return self.iter_query("SELECT * FROM students")
+
+    def iter_courses(self, student_id=None):
+        if student_id is None:
+            return self.iter_query("SELECT * FROM courses")
+        return self.iter_query("SELECT * FROM courses WHERE student_id = ?", (student_id,))
+
+    def retrieve_data(self):
+        try:
+            for row in self.iter_students():
+                print(f"ID: {row[0]}, Name: {row[1]}, Age: {row[2]}")
+
+            for row in self.iter_courses():
+                print(f"ID: {row[0]}, Name: {row[1]}, Student ID: {row[2]}")
+        except sqlite3.Error as e:
+            print(f"An error occurred while retrieving data: {e}")
+
+    def update_student(self, student_id, name):
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("UPDATE students SET name = ? WHERE id = ?", (name, student_id))
+            self.conn.commit()
+            print("Student updated successfully")
+        except sqlite3.Error as e:
+            print(f"An error occurred while updating student: {e}")
+
+    def delete_student(self, student_id):
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("DELETE FROM students WHERE id = ?", (student_id,))
+            self.conn.commit()
+            print("Student deleted successfully")
+        except sqlite3.Error as e:
+            print(f"An error occurred while deleting student: {e}")
+
+    def close_connection(self):
+        if self.pool:
+            self.pool.release_thread_connection()
+            self.pool.close()
+            print("Connection closed")
+
+
+def main():
+    # Create an instance of StudentDatabase backed by a pool of 4 connections
+    database = StudentDatabase('example.db', pool_size=4)
+
+    # Connect to the database (creates the pool and switches the file to WAL mode)
+    database.connect()
+
+    # Create tables
+    database.create_tables()
+
+    # One writer and several readers run concurrently, each on its own pooled connection
+    def writer():
+        try:
+            for i in range(5):
+                database.insert_student(f'Pooled Student {i}', 20 + i)
+        finally:
+            database.release_connection()
+
+    def reader():
+        try:
+            for _ in range(5):
+                count = sum(1 for _ in database.iter_students())
+                print(f"Reader {threading.current_thread().name} saw {count} students")
+        finally:
+            database.release_connection()
+
+    threads = [threading.Thread(target=writer)]
+    threads += [threading.Thread(target=reader, name=f"reader-{i}") for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Checkout/checkin style for a one-off query
+    with database.pool.connection() as conn:
+        print(f"Total students: {conn.execute('SELECT COUNT(*) FROM students').fetchone()[0]}")
+
+    # Pool statistics
+    for name, value in database.pool.stats().items():
+        print(f"{name}: {value}")
+
+    # Close the database connection
+    database.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# asyncio facade - StudentDatabase calls without blocking the event loop
+# Each AsyncStudentDatabase owns one connection and one worker thread. Every call on the
+# connection runs on that thread, so the event loop stays free while SQLite works, and
+# several instances can serve concurrent requests side by side.
+import asyncio
+import functools
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+
+
+# The blocking StudentDatabase is the one from 7.py; the facade only moves its calls off the event loop
+StudentDatabase = importlib.import_module("7").StudentDatabase
+
+
+class AsyncStudentDatabase:
+    def __init__(self, db_name, records=False):
+        self.database = StudentDatabase(db_name, records)
+        # A single worker thread, so the connection is only ever used by the thread that opened it
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    async def _run(self, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(function, *args, **kwargs))
+
+    async def connect(self, profile=None, **overrides):
+        await self._run(self.database.connect, profile, **overrides)
+
+    async def create_tables(self):
+        await self._run(self.database.create_tables)
+
+    async def insert_student(self, name, age):
+        await self._run(self.database.insert_student, name, age)
+
+    async def insert_course(self, name, student_id):
+        await self._run(self.database.insert_course, name, student_id)
+
+    async def insert_students_many(self, students, chunk_size=1000):
+        return await self._run(self.database.insert_students_many, students, chunk_size)
+
+    async def insert_courses_many(self, courses, chunk_size=1000):
+        return await self._run(self.database.insert_courses_many, courses, chunk_size)
+
+    async def update_student(self, student_id, name):
+        await self._run(self.database.update_student, student_id, name)
+
+    async def delete_student(self, student_id):
+        await self._run(self.database.delete_student, student_id)
+
+    async def replace_student(self, name, age):
+        await self._run(self.database.replace_student, name, age)
+
+    async def execute_transaction(self):
+        await self._run(self.database.execute_transaction)
+
+    async def retrieve_data(self):
+        await self._run(self.database.retrieve_data)
+
+    async def fetch_query(self, sql, params=()):
+        return await self._run(lambda: list(self.database.iter_query(sql, params)))
+
+    async def iter_query(self, sql, params=(), arraysize=None):
+        # Each batch of arraysize rows is fetched on the worker thread. The cursor is closed when
+        # the iteration ends, including a break out of an 'async with aclosing(...)' block, so an
+        # abandoned query does not keep its read lock
+        def execute():
+            cursor = self.database.conn.cursor()
+            cursor.arraysize = arraysize or self.database.arraysize
+            return cursor.execute(sql, params)
+
+        cursor = await self._run(execute)
+        try:
+            while True:
+                rows = await self._run(cursor.fetchmany)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            await self._run(cursor.close)
+
+    def iter_students(self):
+        return self.iter_query("SELECT * FROM students")
+
+    def iter_courses(self, student_id=None):
+        if student_id is None:
+            return self.iter_query("SELECT * FROM courses")
+        return self.iter_query("SELECT * FROM courses WHERE student_id = ?", (student_id,))
+
+    async def close_connection(self):
+        await self._run(self.database.close_connection)
+        self._executor.shutdown()
+
+
+async def run():
+    # Create an instance of AsyncStudentDatabase
+    database = AsyncStudentDatabase('example.db')
+
+    # Connect to the database and create tables
+    await database.connect()
+    await database.create_tables()
+
+    # Insert student and course data concurrently
+    await asyncio.gather(
+        database.insert_student('John Doe', 20),
+        database.insert_student('Jane Smith', 22),
+    )
+    await database.insert_courses_many([('Mathematics', 1), ('Physics', 1), ('Chemistry', 2)])
+
+    # Iterate over query results without blocking the event loop
+    async for row in database.iter_students():
+        print(f"ID: {row[0]}, Name: {row[1]}, Age: {row[2]}")
+
+    async for row in database.iter_courses(1):
+        print(f"ID: {row[0]}, Name: {row[1]}, Student ID: {row[2]}")
+
+    # Update, delete and run a transaction
+    await database.update_student(1, "John Smith")
+    await database.delete_student(2)
+    await database.execute_transaction()
+
+    # Close the database connection
+    await database.close_connection()
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
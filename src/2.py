@@ -1,50 +1,251 @@
 #!/usr/bin/env python3
 # In memory db
+# With a backing file the database is warm-loaded from it on connect and written back to it
+# by a background thread (write-behind), so at most checkpoint_interval seconds or
+# checkpoint_writes writes are lost on a crash.
+# With a shared_name the database is a named shared-cache in-memory database that every thread
+# reaches through its own connection, instead of one private copy per connection.
 import sqlite3
+import collections
+import os
+import tempfile
+import threading
+
+from common import apply_profile, insert_many, iter_rows, record_factory
+
+# synchronous setting for the checkpoint file, and whether the directory is fsynced after the rename
+DURABILITY = {
+    "off": ("OFF", False),
+    "normal": ("NORMAL", False),
+    "full": ("FULL", True),
+}
+
+
+# Row types for records=True: tuple subclasses, so row[0] keeps working next to row.name
+Student = collections.namedtuple("Student", "id name age")
+
 
 class StudentDatabase:
-    def __init__(self):
+    def __init__(self, backing_file=None, checkpoint_interval=30.0, checkpoint_writes=1000, durability="normal",
+                 shared_name=None, read_uncommitted=True, records=False):
+        if durability not in DURABILITY:
+            raise ValueError(f"durability must be one of {', '.join(DURABILITY)}")
         self.conn = None
+        self.arraysize = 1000
+        self.records = records
+        self.backing_file = backing_file
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_writes = checkpoint_writes
+        self.durability = durability
+        self._write_lock = threading.RLock()
+        self._checkpoint_lock = threading.Lock()
+        self._dirty = 0
+        self._wake = threading.Event()
+        self._stopping = False
+        self._checkpointer = None
+        self.checkpoints = 0
+        self.shared_name = shared_name
+        self.read_uncommitted = read_uncommitted
+        self._owner = None
+        self._local = threading.local()
+        self._thread_conns = []
+        self._thread_conns_lock = threading.Lock()
+        self.settings = None
+        self._profile = (None, {})
 
-    def connect(self):
+    def connect(self, profile=None, **overrides):
+        # profile is one of PROFILES; keyword arguments override single settings, e.g. cache_size=-65536.
+        # The database lives in memory, so journal_mode ends up MEMORY (or OFF) and mmap_size has no effect.
         try:
-            self.conn = sqlite3.connect(':memory:')
+            # The checkpoint thread reads the connection too; SQLite serializes the calls
+            if self.shared_name:
+                # This connection keeps the shared database alive until close_connection()
+                self.conn = sqlite3.connect(self._shared_uri(), uri=True, check_same_thread=False)
+            else:
+                self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+            if self.records:
+                self.conn.row_factory = record_factory((Student,))
+            self._profile = (profile, overrides)
+            self.settings = apply_profile(self.conn, profile, **overrides)
+            self._owner = threading.get_ident()
+            if self.backing_file and os.path.exists(self.backing_file):
+                source = sqlite3.connect(self.backing_file)
+                try:
+                    source.backup(self.conn)
+                finally:
+                    source.close()
+                print(f"Loaded the in-memory database from '{self.backing_file}'")
+            if self.backing_file:
+                self._checkpointer = threading.Thread(target=self._checkpoint_loop, name="checkpointer", daemon=True)
+                self._checkpointer.start()
             print("Connected to the in-memory database")
+            if profile or overrides:
+                print("Connection settings: " + ", ".join(f"{name}={value}" for name, value in self.settings.items()))
         except sqlite3.Error as e:
             print(f"An error occurred while connecting to the database: {e}")
 
+    def _shared_uri(self):
+        return f"file:{self.shared_name}?mode=memory&cache=shared"
+
+    def thread_connection(self):
+        # The calling thread's own connection to the shared database, opened on first use.
+        # Connections sharing a cache lock whole tables and fail with 'database table is locked'
+        # rather than wait. With read_uncommitted (the default) readers take no table locks, so
+        # they never block or get blocked by the writer, but they can see rows of a transaction
+        # that is still open or later rolled back. read_uncommitted=False keeps reads isolated;
+        # a read that meets an open write transaction then fails with 'database table is locked'.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not self.shared_name:
+                raise sqlite3.ProgrammingError("thread connections need a shared in-memory database (shared_name)")
+            conn = sqlite3.connect(self._shared_uri(), uri=True, check_same_thread=False)
+            if self.read_uncommitted:
+                conn.execute("PRAGMA read_uncommitted=1")
+            if self.records:
+                conn.row_factory = record_factory((Student,))
+            profile, overrides = self._profile
+            apply_profile(conn, profile, **overrides)
+            self._local.conn = conn
+            with self._thread_conns_lock:
+                self._thread_conns.append(conn)
+        return conn
+
+    def release_thread_connection(self):
+        # Worker threads call this when they are done with the database
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            with self._thread_conns_lock:
+                self._thread_conns.remove(conn)
+            conn.close()
+
+    def _reader(self):
+        # Reads from threads other than the one that connected use their own connection
+        if self.shared_name and threading.get_ident() != self._owner:
+            return self.thread_connection()
+        return self.conn
+
+    def _wrote(self, count=1):
+        # Called after a committed write; wakes the checkpoint thread after checkpoint_writes writes
+        self._dirty += count
+        if self._dirty >= self.checkpoint_writes:
+            self._wake.set()
+
+    def _checkpoint_loop(self):
+        while not self._stopping:
+            self._wake.wait(self.checkpoint_interval)
+            self._wake.clear()
+            if self._dirty and not self._stopping:
+                try:
+                    self.checkpoint()
+                except (sqlite3.Error, OSError) as e:
+                    print(f"An error occurred while checkpointing the database: {e}")
+
+    def checkpoint(self):
+        # Copy the database to a second in-memory database while holding the write lock - a RAM to RAM
+        # copy, so writers are only blocked briefly - then write that copy to a temporary file next to
+        # the backing file and rename it over the backing file, which is replaced atomically
+        with self._checkpoint_lock:
+            copy = sqlite3.connect(':memory:')
+            try:
+                with self._write_lock:
+                    self.conn.backup(copy)
+                    dirty, self._dirty = self._dirty, 0
+                synchronous, sync_directory = DURABILITY[self.durability]
+                directory = os.path.dirname(os.path.abspath(self.backing_file))
+                fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                os.close(fd)
+                try:
+                    target = sqlite3.connect(temp_path)
+                    try:
+                        target.execute(f"PRAGMA synchronous={synchronous}")
+                        target.execute("PRAGMA journal_mode=OFF")  # The rename is the commit
+                        copy.backup(target)
+                    finally:
+                        target.close()
+                    os.replace(temp_path, self.backing_file)
+                except BaseException:
+                    with self._write_lock:
+                        self._dirty += dirty
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    raise
+                if sync_directory and hasattr(os, "O_DIRECTORY"):
+                    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+            finally:
+                copy.close()
+            self.checkpoints += 1
+
     def create_table(self):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('''CREATE TABLE IF NOT EXISTS students
-                              (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                               name TEXT,
-                               age INTEGER)''')
+            # Schema changes are writes too, or a session that only creates tables is never saved
+            with self._write_lock:
+                cursor = self.conn.cursor()
+                cursor.execute('''CREATE TABLE IF NOT EXISTS students
+                                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                   name TEXT,
+                                   age INTEGER)''')
+                self._wrote()
             print("Table created successfully")
         except sqlite3.Error as e:
             print(f"An error occurred while creating the table: {e}")
 
     def insert_data(self, name, age):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("INSERT INTO students (name, age) VALUES (?, ?)", (name, age))
-            self.conn.commit()
+            with self._write_lock:
+                cursor = self.conn.cursor()
+                cursor.execute("INSERT INTO students (name, age) VALUES (?, ?)", (name, age))
+                self.conn.commit()
+                self._wrote()
             print("Data inserted successfully")
         except sqlite3.Error as e:
             print(f"An error occurred while inserting data: {e}")
 
+    def _insert_many(self, sql, rows, chunk_size):
+        # The write lock is held per chunk, so a checkpoint can run between chunks
+        return insert_many(self.conn, sql, rows, chunk_size, lock=self._write_lock, on_commit=self._wrote)
+
+    def insert_students_many(self, students, chunk_size=1000):
+        # students is an iterable of (name, age) pairs; returns the (first_id, last_id) range
+        try:
+            id_range = self._insert_many("INSERT INTO students (name, age) VALUES (?, ?)", students, chunk_size)
+            print("Students inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting students: {e}")
+
+    def iter_query(self, sql, params=(), arraysize=None):
+        return iter_rows(self._reader(), sql, params, arraysize or self.arraysize)
+
+    def iter_students(self):
+        return self.iter_query("SELECT * FROM students")
+
     def retrieve_data(self):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM students")
-            rows = cursor.fetchall()
-            for row in rows:
+            for row in self.iter_students():
                 print(f"ID: {row[0]}, Name: {row[1]}, Age: {row[2]}")
         except sqlite3.Error as e:
             print(f"An error occurred while retrieving data: {e}")
 
     def close_connection(self):
         if self.conn:
+            # Clean shutdown: stop the checkpoint thread and write any remaining changes
+            if self._checkpointer:
+                self._stopping = True
+                self._wake.set()
+                self._checkpointer.join()
+                self._checkpointer = None
+                if self._dirty:
+                    self.checkpoint()
+                    print(f"In-memory database saved to '{self.backing_file}'")
+            with self._thread_conns_lock:
+                for conn in self._thread_conns:
+                    conn.close()
+                self._thread_conns.clear()
             self.conn.close()
             print("Connection closed")
 
@@ -70,7 +271,35 @@ def main():
     # Close the database connection
     database.close_connection()
 
+    # In-memory database persisted to a file: loaded on connect, checkpointed every 5 seconds
+    # or 100 writes in the background, and saved on close
+    database = StudentDatabase('memory_backing.db', checkpoint_interval=5.0, checkpoint_writes=100)
+    database.connect()
+    database.create_table()
+    database.insert_students_many((f'Student {i}', 18 + i % 10) for i in range(250))
+    print(f"Checkpoints written so far: {database.checkpoints}")
+    database.close_connection()
+
+    # Shared-cache in-memory database: worker threads read the same data through their own connections
+    database = StudentDatabase(shared_name='students')
+    database.connect()
+    database.create_table()
+    database.insert_students_many((f'Student {i}', 18 + i % 10) for i in range(1000))
+
+    def reader():
+        try:
+            count = sum(1 for _ in database.iter_query("SELECT * FROM students WHERE age = ?", (20,)))
+            print(f"{threading.current_thread().name} saw {count} students aged 20")
+        finally:
+            database.release_thread_connection()
+
+    threads = [threading.Thread(target=reader, name=f"reader-{i}") for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    database.close_connection()
+
 
 if __name__ == "__main__":
     main()
-
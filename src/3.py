@@ -1,16 +1,34 @@
 #!/usr/bin/env python3
 # In memory db - foreign key 
 import sqlite3
+import collections
+
+from common import apply_profile, insert_many, iter_rows, query_plan, record_factory
+
+
+# Row types for records=True: tuple subclasses, so row[0] keeps working next to row.name
+Student = collections.namedtuple("Student", "id name age")
+Course = collections.namedtuple("Course", "id name student_id")
+
 
 class StudentDatabase:
-    def __init__(self, db_name):
+    def __init__(self, db_name, records=False):
         self.db_name = db_name
         self.conn = None
+        self.arraysize = 1000
+        self.records = records
+        self.settings = None
 
-    def connect(self):
+    def connect(self, profile=None, **overrides):
+        # profile is one of PROFILES; keyword arguments override single settings, e.g. synchronous="OFF"
         try:
             self.conn = sqlite3.connect(self.db_name)
+            if self.records:
+                self.conn.row_factory = record_factory((Student, Course))
+            self.settings = apply_profile(self.conn, profile, **overrides)
             print("Connected to the database")
+            if profile or overrides:
+                print("Connection settings: " + ", ".join(f"{name}={value}" for name, value in self.settings.items()))
         except sqlite3.Error as e:
             print(f"An error occurred while connecting to the database: {e}")
 
@@ -32,9 +50,26 @@ class StudentDatabase:
                                FOREIGN KEY (student_id) REFERENCES students(id))''')
 
             print("Tables created successfully")
+            self.ensure_indexes()
         except sqlite3.Error as e:
             print(f"An error occurred while creating the tables: {e}")
 
+    def ensure_indexes(self):
+        # Indexes for the access paths the queries use: joins and lookups on courses.student_id,
+        # courses deleted with their student, name lookups and age filters/aggregates
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_courses_student_id_name ON courses (student_id, name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_name ON students (name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_age ON students (age)")
+            self.conn.commit()
+            print("Indexes created successfully")
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the indexes: {e}")
+
+    def query_plan(self, sql, params=()):
+        return query_plan(self.conn, sql, params)
+
     def insert_student(self, name, age):
         try:
             cursor = self.conn.cursor()
@@ -53,17 +88,41 @@ class StudentDatabase:
         except sqlite3.Error as e:
             print(f"An error occurred while inserting course: {e}")
 
+    def insert_students_many(self, students, chunk_size=1000):
+        # students is an iterable of (name, age) pairs; returns the (first_id, last_id) range
+        try:
+            id_range = insert_many(self.conn, "INSERT INTO students (name, age) VALUES (?, ?)", students, chunk_size)
+            print("Students inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting students: {e}")
+
+    def insert_courses_many(self, courses, chunk_size=1000):
+        # courses is an iterable of (name, student_id) pairs; returns the (first_id, last_id) range
+        try:
+            id_range = insert_many(self.conn, "INSERT INTO courses (name, student_id) VALUES (?, ?)", courses, chunk_size)
+            print("Courses inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting courses: {e}")
+
+    def iter_query(self, sql, params=(), arraysize=None):
+        return iter_rows(self.conn, sql, params, arraysize or self.arraysize)
+
+    def iter_students(self):
+        return self.iter_query("SELECT * FROM students")
+
+    def iter_courses(self, student_id=None):
+        if student_id is None:
+            return self.iter_query("SELECT * FROM courses")
+        return self.iter_query("SELECT * FROM courses WHERE student_id = ?", (student_id,))
+
     def retrieve_data(self):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM students")
-            rows = cursor.fetchall()
-            for row in rows:
+            for row in self.iter_students():
                 print(f"ID: {row[0]}, Name: {row[1]}, Age: {row[2]}")
 
-            cursor.execute("SELECT * FROM courses")
-            rows = cursor.fetchall()
-            for row in rows:
+            for row in self.iter_courses():
                 print(f"ID: {row[0]}, Name: {row[1]}, Student ID: {row[2]}")
         except sqlite3.Error as e:
             print(f"An error occurred while retrieving data: {e}")
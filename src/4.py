@@ -1,15 +1,77 @@
 #!/usr/bin/env python3
 import sqlite3
+import collections
+import json
+
+from common import apply_profile, insert_many, iter_rows, query_plan, record_factory
+
+
+def _fts5_tokenizer():
+    # trigram (SQLite 3.34+) indexes every 3-character substring, so it can answer LIKE '%Joh%';
+    # unicode61 only matches whole words and word prefixes. None when SQLite has no FTS5.
+    conn = sqlite3.connect(":memory:")
+    try:
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                conn.execute(f"CREATE VIRTUAL TABLE probe USING fts5(name, tokenize='{tokenizer}')")
+                return tokenizer
+            except sqlite3.OperationalError:
+                pass
+        return None
+    finally:
+        conn.close()
+
+
+FTS_TOKENIZER = _fts5_tokenizer()
+
+# filter_students_in: lists up to this long are bound as IN (...) lists, longer ones are loaded
+# into a temporary table. 999 is SQLITE_MAX_VARIABLE_NUMBER before SQLite 3.32.
+IN_LIST_MAX = 999
+FILTER_COLUMNS = ("id", "name", "age")
+
+
+def _has_json_each():
+    # JSON1 is built in from SQLite 3.38 and optional before
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.execute("SELECT * FROM json_each('[]')")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+JSON_EACH = _has_json_each()
+
+
+# Row types for records=True: tuple subclasses, so row[0] keeps working next to row.name
+Student = collections.namedtuple("Student", "id name age")
+Course = collections.namedtuple("Course", "id name student_id")
+
 
 class StudentDatabase:
-    def __init__(self, db_name):
+    def __init__(self, db_name, records=False):
         self.db_name = db_name
         self.conn = None
-
-    def connect(self):
+        self.arraysize = 1000
+        self.records = records
+        self.settings = None
+        self._filter_tables = []
+        self._filter_table_count = 0
+        self._active_filters = 0
+        self._filters_own_transaction = False
+
+    def connect(self, profile=None, **overrides):
+        # profile is one of PROFILES; keyword arguments override single settings, e.g. synchronous="OFF"
         try:
             self.conn = sqlite3.connect(self.db_name)
+            if self.records:
+                self.conn.row_factory = record_factory((Student, Course))
+            self.settings = apply_profile(self.conn, profile, **overrides)
             print("Connected to the database")
+            if profile or overrides:
+                print("Connection settings: " + ", ".join(f"{name}={value}" for name, value in self.settings.items()))
         except sqlite3.Error as e:
             print(f"An error occurred while connecting to the database: {e}")
 
@@ -31,9 +93,78 @@ class StudentDatabase:
                                FOREIGN KEY (student_id) REFERENCES students(id))''')
 
             print("Tables created successfully")
+            self.ensure_indexes()
+            self.ensure_search_index()
         except sqlite3.Error as e:
             print(f"An error occurred while creating the tables: {e}")
 
+    def ensure_indexes(self):
+        # Indexes for the access paths the queries use: joins and lookups on courses.student_id,
+        # courses deleted with their student, name lookups and age filters/aggregates
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_courses_student_id_name ON courses (student_id, name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_name ON students (name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_age ON students (age)")
+            self.conn.commit()
+            print("Indexes created successfully")
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the indexes: {e}")
+
+    def ensure_search_index(self):
+        # FTS5 shadow indexes over students.name and courses.name. They are external-content tables
+        # (the names are stored only once, in the real table) kept in sync by triggers.
+        if FTS_TOKENIZER is None:
+            print("FTS5 is not available, name searches will scan the table")
+            return
+        try:
+            cursor = self.conn.cursor()
+            for table in ("students", "courses"):
+                exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (f"{table}_fts",)).fetchone()
+                cursor.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts
+                                   USING fts5(name, content='{table}', content_rowid='id', tokenize='{FTS_TOKENIZER}')""")
+                cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                                       INSERT INTO {table}_fts (rowid, name) VALUES (new.id, new.name);
+                                   END""")
+                cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                                       INSERT INTO {table}_fts ({table}_fts, rowid, name) VALUES ('delete', old.id, old.name);
+                                   END""")
+                cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF id, name ON {table} BEGIN
+                                       INSERT INTO {table}_fts ({table}_fts, rowid, name) VALUES ('delete', old.id, old.name);
+                                       INSERT INTO {table}_fts (rowid, name) VALUES (new.id, new.name);
+                                   END""")
+                if not exists:
+                    # Index rows inserted before the search index existed
+                    cursor.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+            self.conn.commit()
+            print(f"Search indexes created successfully ({FTS_TOKENIZER} tokenizer)")
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the search indexes: {e}")
+
+    def _search(self, table, columns, term, limit, ranked):
+        # Best matches first when ranked, else id order without scoring; no usable match falls back to LIKE
+        limit_sql = "" if limit is None else f" LIMIT {int(limit)}"
+        if FTS_TOKENIZER == "trigram" and len(term) >= 3:
+            match = '"' + term.replace('"', '""') + '"'
+        elif FTS_TOKENIZER == "unicode61" and term.split():
+            match = " ".join('"' + word.replace('"', '""') + '"*' for word in term.split())
+        else:
+            return self.iter_query(f"SELECT {columns} FROM {table} WHERE name LIKE ?{limit_sql}", (f"%{term}%",))
+        return self.iter_query(f"""SELECT {', '.join(f'{table}.{column.strip()}' for column in columns.split(','))}
+                                   FROM {table}_fts JOIN {table} ON {table}.id = {table}_fts.rowid
+                                   WHERE {table}_fts MATCH ?{f' ORDER BY {table}_fts.rank' if ranked else ''}{limit_sql}""", (match,))
+
+    def search_students(self, term, limit=None, ranked=True):
+        # Students whose name contains term, as (id, name, age) rows
+        return self._search("students", "id, name, age", term, limit, ranked)
+
+    def search_courses(self, term, limit=None, ranked=True):
+        # Courses whose name contains term, as (id, name, student_id) rows
+        return self._search("courses", "id, name, student_id", term, limit, ranked)
+
+    def query_plan(self, sql, params=()):
+        return query_plan(self.conn, sql, params)
+
     def insert_student(self, name, age):
         try:
             cursor = self.conn.cursor()
@@ -52,72 +183,130 @@ class StudentDatabase:
         except sqlite3.Error as e:
             print(f"An error occurred while inserting course: {e}")
 
-    def retrieve_data(self):
+    def insert_students_many(self, students, chunk_size=1000):
+        # students is an iterable of (name, age) pairs; returns the (first_id, last_id) range
         try:
-            cursor = self.conn.cursor()
+            id_range = insert_many(self.conn, "INSERT INTO students (name, age) VALUES (?, ?)", students, chunk_size)
+            print("Students inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting students: {e}")
+
+    def insert_courses_many(self, courses, chunk_size=1000):
+        # courses is an iterable of (name, student_id) pairs; returns the (first_id, last_id) range
+        try:
+            id_range = insert_many(self.conn, "INSERT INTO courses (name, student_id) VALUES (?, ?)", courses, chunk_size)
+            print("Courses inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting courses: {e}")
+
+    def iter_query(self, sql, params=(), arraysize=None):
+        return iter_rows(self.conn, sql, params, arraysize or self.arraysize)
+
+    def iter_students(self):
+        return self.iter_query("SELECT * FROM students")
+
+    def iter_courses(self, student_id=None):
+        if student_id is None:
+            return self.iter_query("SELECT * FROM courses")
+        return self.iter_query("SELECT * FROM courses WHERE student_id = ?", (student_id,))
+
+    def filter_students_in(self, column, values):
+        # Students whose column is one of values. Long lists are inserted into an indexed temporary
+        # table instead, which has no SQLITE_MAX_VARIABLE_NUMBER limit.
+        if column not in FILTER_COLUMNS:
+            raise ValueError(f"column must be one of {', '.join(FILTER_COLUMNS)}")
+        values = list(dict.fromkeys(values))
+        if len(values) > IN_LIST_MAX:
+            return self._filter_in_temp_table(column, values)
+        placeholders = ", ".join(["?"] * len(values))
+        return self.iter_query(f"SELECT * FROM students WHERE {column} IN ({placeholders})", values)
+
+    def _filter_in_temp_table(self, column, values):
+        # Temporary tables are reused rather than dropped: DROP fails while another statement is
+        # running and, like CREATE, changes the schema, which recompiles every cached statement.
+        # Filters iterated at the same time each get their own table. IN (SELECT ...) is the
+        # semi-join form, so each student comes back once.
+        if self._filter_tables:
+            table = self._filter_tables.pop()
+        else:
+            self._filter_table_count += 1
+            table = f"temp.filter_values_{self._filter_table_count}"
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (value PRIMARY KEY) WITHOUT ROWID")
+        if not self._active_filters:
+            self._filters_own_transaction = not self.conn.in_transaction
+        self._active_filters += 1
+        cursor = self.conn.cursor()
+        try:
+            try:
+                payload = json.dumps(values) if JSON_EACH else None
+            except (TypeError, ValueError):
+                payload = None
+            if payload is not None:
+                # One statement and one parameter for the whole list, instead of a step per value
+                cursor.execute(f"INSERT OR IGNORE INTO {table} (value) SELECT value FROM json_each(?)", (payload,))
+            else:
+                cursor.executemany(f"INSERT OR IGNORE INTO {table} (value) VALUES (?)", ((value,) for value in values))
+            yield from self.iter_query(f"SELECT * FROM students WHERE {column} IN (SELECT value FROM {table})")
+        finally:
+            cursor.execute(f"DELETE FROM {table}")
+            self._filter_tables.append(table)
+            self._active_filters -= 1
+            if not self._active_filters and self._filters_own_transaction:
+                # End the transaction the inserts opened so it does not hold a read lock on the database
+                self.conn.commit()
 
+    def retrieve_data(self):
+        try:
             # Select all students
-            cursor.execute("SELECT * FROM students")
-            rows = cursor.fetchall()
             print("All students:")
-            for row in rows:
+            for row in self.iter_students():
                 print(f"ID: {row[0]}, Name: {row[1]}, Age: {row[2]}")
 
             print("\n")
 
             # Select courses for a specific student
             student_id = 1
-            cursor.execute("SELECT * FROM courses WHERE student_id = ?", (student_id,))
-            rows = cursor.fetchall()
             print(f"Courses for student with ID {student_id}:")
-            for row in rows:
+            for row in self.iter_courses(student_id):
                 print(f"ID: {row[0]}, Name: {row[1]}, Student ID: {row[2]}")
 
             print("\n")
 
             # Select distinct ages of students
-            cursor.execute("SELECT DISTINCT age FROM students")
-            rows = cursor.fetchall()
             print("Distinct ages of students:")
-            for row in rows:
+            for row in self.iter_query("SELECT DISTINCT age FROM students"):
                 print(f"Age: {row[0]}")
 
             print("\n")
 
             # Select students with age between 20 and 25
-            cursor.execute("SELECT * FROM students WHERE age BETWEEN 20 AND 25")
-            rows = cursor.fetchall()
             print("Students with age between 20 and 25:")
-            for row in rows:
+            for row in self.iter_query("SELECT * FROM students WHERE age BETWEEN 20 AND 25"):
                 print(f"ID: {row[0]}, Name: {row[1]}, Age: {row[2]}")
 
             print("\n")
 
             # Select students with names in a list
             names = ['John Doe', 'Jane Smith']
-            cursor.execute("SELECT * FROM students WHERE name IN ({})".format(','.join(['?'] * len(names))), tuple(names))
-            rows = cursor.fetchall()
             print("Students with names in the list:")
-            for row in rows:
+            for row in self.filter_students_in('name', names):
                 print(f"ID: {row[0]}, Name: {row[1]}, Age: {row[2]}")
 
             print("\n")
 
             # Select students with names containing 'Joh'
             keyword = 'Joh'
-            cursor.execute("SELECT * FROM students WHERE name LIKE ?", (f'%{keyword}%',))
-            rows = cursor.fetchall()
             print(f"Students with names containing '{keyword}':")
-            for row in rows:
+            for row in self.search_students(keyword):
                 print(f"ID: {row[0]}, Name: {row[1]}, Age: {row[2]}")
 
             print("\n")
 
             # Select students with NULL age
-            cursor.execute("SELECT * FROM students WHERE age IS NULL")
-            rows = cursor.fetchall()
             print("Students with NULL age:")
-            for row in rows:
+            for row in self.iter_query("SELECT * FROM students WHERE age IS NULL"):
                 print(f"ID: {row[0]}, Name: {row[1]}, Age: {row[2]}")
 
         except sqlite3.Error as e:
@@ -155,6 +344,16 @@ def main():
     # Retrieve data using different SQLite operations
     database.retrieve_data()
 
+    # Show that the filters are answered from indexes (SEARCH ... USING INDEX) instead of full scans
+    print("\nQuery plans:")
+    for sql, params in [("SELECT * FROM courses WHERE student_id = ?", (1,)),
+                        ("SELECT * FROM students WHERE age BETWEEN 20 AND 25", ()),
+                        ("SELECT * FROM students WHERE name IN (?, ?)", ('John Doe', 'Jane Smith')),
+                        ("SELECT * FROM students WHERE age IS NULL", ()),
+                        ("SELECT students.* FROM students_fts JOIN students ON students.id = students_fts.rowid "
+                         "WHERE students_fts MATCH ? ORDER BY students_fts.rank", ('"Joh"',))]:
+        print(f"{sql}: {'; '.join(database.query_plan(sql, params))}")
+
     # Close the database connection
     database.close_connection()
 
@@ -1,15 +1,43 @@
 #!/usr/bin/env python3
 import sqlite3
+import collections
+import string
+
+from common import apply_profile, insert_many, iter_rows, query_plan, record_factory
+
+# NOCASE folds ASCII letters only, so the bounds of a NOCASE range must be folded the same way
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _reverse(value):
+    return value[::-1] if isinstance(value, str) else value
+
+
+# Row types for records=True: tuple subclasses, so row[0] keeps working next to row.name
+Student = collections.namedtuple("Student", "id name age")
+Course = collections.namedtuple("Course", "id name student_id")
+
 
 class StudentDatabase:
-    def __init__(self, db_name):
+    def __init__(self, db_name, records=False):
         self.db_name = db_name
         self.conn = None
+        self.arraysize = 1000
+        self.records = records
+        self.settings = None
 
-    def connect(self):
+    def connect(self, profile=None, **overrides):
+        # profile is one of PROFILES; keyword arguments override single settings, e.g. synchronous="OFF"
         try:
             self.conn = sqlite3.connect(self.db_name)
+            if self.records:
+                self.conn.row_factory = record_factory((Student, Course))
+            self.settings = apply_profile(self.conn, profile, **overrides)
+            # Only used when refreshing student_names_reversed; the schema itself never calls it
+            self.conn.create_function("reverse", 1, _reverse, deterministic=True)
             print("Connected to the database")
+            if profile or overrides:
+                print("Connection settings: " + ", ".join(f"{name}={value}" for name, value in self.settings.items()))
         except sqlite3.Error as e:
             print(f"An error occurred while connecting to the database: {e}")
 
@@ -31,9 +59,75 @@ class StudentDatabase:
                                FOREIGN KEY (student_id) REFERENCES students(id))''')
 
             print("Tables created successfully")
+            self.ensure_indexes()
         except sqlite3.Error as e:
             print(f"An error occurred while creating the tables: {e}")
 
+    def ensure_indexes(self):
+        # Indexes for the access paths the queries use: joins and lookups on courses.student_id,
+        # courses deleted with their student, name lookups and age filters/aggregates
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_courses_student_id_name ON courses (student_id, name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_name ON students (name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_age ON students (age)")
+            self.ensure_reversed_names(cursor)
+            self.conn.commit()
+            print("Indexes created successfully")
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the indexes: {e}")
+
+    def ensure_reversed_names(self, cursor):
+        # Suffix searches ('*son') become prefix ranges on the reversed names in a side table.
+        # The schema uses built-in SQL only, so every script (and a restored dump) can write
+        # students without the reverse() function: the triggers just queue changed ids in
+        # student_names_reversed_pending, and _refresh_reversed_names() reverses them here.
+        # An older expression index on reverse(name) needed the function on every connection.
+        cursor.execute("DROP INDEX IF EXISTS idx_students_name_reversed")
+        created = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'student_names_reversed'").fetchone() is None
+        cursor.execute('''CREATE TABLE IF NOT EXISTS student_names_reversed
+                          (id INTEGER PRIMARY KEY,
+                           name_reversed TEXT COLLATE NOCASE)''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_student_names_reversed ON student_names_reversed (name_reversed)")
+        cursor.execute("CREATE TABLE IF NOT EXISTS student_names_reversed_pending (id INTEGER PRIMARY KEY)")
+        cursor.execute('''CREATE TRIGGER IF NOT EXISTS students_name_reversed_insert AFTER INSERT ON students
+                          BEGIN
+                              INSERT OR IGNORE INTO student_names_reversed_pending VALUES (NEW.id);
+                          END''')
+        cursor.execute('''CREATE TRIGGER IF NOT EXISTS students_name_reversed_update AFTER UPDATE OF id, name ON students
+                          BEGIN
+                              DELETE FROM student_names_reversed WHERE id = OLD.id;
+                              INSERT OR IGNORE INTO student_names_reversed_pending VALUES (NEW.id);
+                          END''')
+        cursor.execute('''CREATE TRIGGER IF NOT EXISTS students_name_reversed_delete AFTER DELETE ON students
+                          BEGIN
+                              DELETE FROM student_names_reversed WHERE id = OLD.id;
+                              DELETE FROM student_names_reversed_pending WHERE id = OLD.id;
+                          END''')
+        if created:
+            cursor.execute("INSERT OR IGNORE INTO student_names_reversed_pending SELECT id FROM students")
+
+    def _refresh_reversed_names(self):
+        # Reverses the names queued since the last suffix search
+        cursor = self.conn.cursor()
+        if cursor.execute("SELECT 1 FROM student_names_reversed_pending LIMIT 1").fetchone() is None:
+            return
+        # A savepoint rather than a commit: inside the caller's transaction it only becomes part of it
+        cursor.execute("SAVEPOINT refresh_reversed_names")
+        try:
+            cursor.execute('''INSERT OR REPLACE INTO student_names_reversed (id, name_reversed)
+                              SELECT students.id, reverse(students.name)
+                              FROM student_names_reversed_pending JOIN students USING (id)''')
+            cursor.execute("DELETE FROM student_names_reversed_pending")
+        except sqlite3.Error:
+            cursor.execute("ROLLBACK TO refresh_reversed_names")
+            raise
+        finally:
+            cursor.execute("RELEASE refresh_reversed_names")
+
+    def query_plan(self, sql, params=()):
+        return query_plan(self.conn, sql, params)
+
     def insert_student(self, name, age):
         try:
             cursor = self.conn.cursor()
@@ -52,24 +146,74 @@ class StudentDatabase:
         except sqlite3.Error as e:
             print(f"An error occurred while inserting course: {e}")
 
-    def retrieve_data(self):
+    def insert_students_many(self, students, chunk_size=1000):
+        # students is an iterable of (name, age) pairs; returns the (first_id, last_id) range
         try:
-            cursor = self.conn.cursor()
+            id_range = insert_many(self.conn, "INSERT INTO students (name, age) VALUES (?, ?)", students, chunk_size)
+            print("Students inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting students: {e}")
+
+    def insert_courses_many(self, courses, chunk_size=1000):
+        # courses is an iterable of (name, student_id) pairs; returns the (first_id, last_id) range
+        try:
+            id_range = insert_many(self.conn, "INSERT INTO courses (name, student_id) VALUES (?, ?)", courses, chunk_size)
+            print("Courses inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting courses: {e}")
+
+    def iter_query(self, sql, params=(), arraysize=None):
+        return iter_rows(self.conn, sql, params, arraysize or self.arraysize)
 
+    def iter_students(self):
+        return self.iter_query("SELECT * FROM students")
+
+    def iter_courses(self, student_id=None):
+        if student_id is None:
+            return self.iter_query("SELECT * FROM courses")
+        return self.iter_query("SELECT * FROM courses WHERE student_id = ?", (student_id,))
+
+    def _name_query(self, pattern, operator):
+        # (sql, params) for name GLOB/LIKE pattern. A pattern whose only wildcard is a leading one
+        # ('*son', '%son') is a suffix search and becomes a range on idx_student_names_reversed.
+        # The range is case-insensitive and may be wider than the pattern, so the pattern is
+        # rechecked on the rows in it. SQLite handles other patterns itself, using
+        # idx_students_name for prefixes.
+        operator = operator.upper()
+        if operator not in ("GLOB", "LIKE"):
+            raise ValueError("operator must be GLOB or LIKE")
+        wildcards = "*?[" if operator == "GLOB" else "%_"
+        suffix = pattern[1:]
+        if pattern[:1] == wildcards[0] and suffix and not any(character in wildcards for character in suffix):
+            sql = "SELECT students.* FROM student_names_reversed AS reversed JOIN students USING (id) WHERE reversed.name_reversed >= ? "
+            low = suffix[::-1].translate(ASCII_LOWER)
+            if ord(low[-1]) < 0x10FFFF:
+                high = low[:-1] + chr(ord(low[-1]) + 1)
+                return sql + f"AND reversed.name_reversed < ? AND students.name {operator} ?", (low, high, pattern)
+            return sql + f"AND students.name {operator} ?", (low, pattern)
+        return f"SELECT * FROM students WHERE name {operator} ?", (pattern,)
+
+    def find_students_by_name(self, pattern, operator="GLOB"):
+        # Students whose name matches a GLOB (case-sensitive) or LIKE (case-insensitive) pattern
+        sql, params = self._name_query(pattern, operator)
+        if "student_names_reversed" in sql:
+            self._refresh_reversed_names()
+        return self.iter_query(sql, params)
+
+    def retrieve_data(self):
+        try:
             # Select all students
-            cursor.execute("SELECT * FROM students")
-            rows = cursor.fetchall()
             print("All students:")
-            for row in rows:
+            for row in self.iter_students():
                 print(f"ID: {row[0]}, Name: {row[1]}, Age: {row[2]}")
 
             print("\n")
 
             # Select students with names ending in 'n'
-            cursor.execute("SELECT * FROM students WHERE name GLOB '*n'")
-            rows = cursor.fetchall()
             print("Students with names ending in 'n':")
-            for row in rows:
+            for row in self.find_students_by_name('*n'):
                 print(f"ID: {row[0]}, Name: {row[1]}, Age: {row[2]}")
 
         except sqlite3.Error as e:
@@ -104,6 +248,12 @@ def main():
     # Retrieve data using GLOB operator
     database.retrieve_data()
 
+    # Suffix patterns are answered from the reversed-name index instead of a full scan
+    print("\nQuery plans:")
+    for pattern, operator in [('*n', 'GLOB'), ('%son', 'LIKE'), ('J*', 'GLOB'), ('*o*', 'GLOB')]:
+        sql, params = database._name_query(pattern, operator)
+        print(f"name {operator} '{pattern}': {'; '.join(database.query_plan(sql, params))}")
+
     # Close the database connection
     database.close_connection()
 
@@ -1,20 +1,41 @@
 #!/usr/bin/env python3
 """
-The program continues to simulate the RIGHT JOIN and FULL OUTER JOIN operations using alternative techniques. The approach for the FULL OUTER JOIN is to combine a LEFT JOIN with a separate query to include unmatched rows from the left table.
+The program demonstrates RIGHT JOIN and FULL OUTER JOIN. SQLite supports both natively from version 3.39.0, and they can be requested with native=True when the linked SQLite library is new enough.
 
-Please note that while these techniques simulate the behavior of RIGHT JOIN and FULL OUTER JOIN, they may not be as efficient as the native implementations available in other database systems.
+By default they are rewritten: a RIGHT JOIN becomes a LEFT JOIN with the tables swapped, and a FULL OUTER JOIN combines a LEFT JOIN with the unmatched rows from the right table using UNION ALL and a NOT EXISTS anti-join. UNION ALL avoids sorting the whole result to remove duplicates, and NOT EXISTS, unlike NOT IN, stays correct when courses.student_id is NULL and needs only one primary key lookup per course. On SQLite 3.40 the rewritten forms also measure faster than the native joins, which track matched rows and then rescan the right table (see the outer_join benchmark in benchmark.py).
 """
 import sqlite3
+import collections
+
+from common import apply_profile, insert_many, iter_rows, query_plan, record_factory
+
+# RIGHT JOIN and FULL OUTER JOIN are available from SQLite 3.39.0
+NATIVE_OUTER_JOINS = sqlite3.sqlite_version_info >= (3, 39, 0)
+
+
+# Row types for records=True: tuple subclasses, so row[0] keeps working next to row.name
+Student = collections.namedtuple("Student", "id name age")
+Course = collections.namedtuple("Course", "id name student_id")
+
 
 class StudentDatabase:
-    def __init__(self, db_name):
+    def __init__(self, db_name, records=False):
         self.db_name = db_name
         self.conn = None
+        self.arraysize = 1000
+        self.records = records
+        self.settings = None
 
-    def connect(self):
+    def connect(self, profile=None, **overrides):
+        # profile is one of PROFILES; keyword arguments override single settings, e.g. synchronous="OFF"
         try:
             self.conn = sqlite3.connect(self.db_name)
+            if self.records:
+                self.conn.row_factory = record_factory((Student, Course))
+            self.settings = apply_profile(self.conn, profile, **overrides)
             print("Connected to the database")
+            if profile or overrides:
+                print("Connection settings: " + ", ".join(f"{name}={value}" for name, value in self.settings.items()))
         except sqlite3.Error as e:
             print(f"An error occurred while connecting to the database: {e}")
 
@@ -36,9 +57,26 @@ class StudentDatabase:
                                FOREIGN KEY (student_id) REFERENCES students(id))''')
 
             print("Tables created successfully")
+            self.ensure_indexes()
         except sqlite3.Error as e:
             print(f"An error occurred while creating the tables: {e}")
 
+    def ensure_indexes(self):
+        # Indexes for the access paths the queries use: joins and lookups on courses.student_id,
+        # courses deleted with their student, name lookups and age filters/aggregates
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_courses_student_id_name ON courses (student_id, name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_name ON students (name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_age ON students (age)")
+            self.conn.commit()
+            print("Indexes created successfully")
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the indexes: {e}")
+
+    def query_plan(self, sql, params=()):
+        return query_plan(self.conn, sql, params)
+
     def insert_student(self, name, age):
         try:
             cursor = self.conn.cursor()
@@ -57,54 +95,87 @@ class StudentDatabase:
         except sqlite3.Error as e:
             print(f"An error occurred while inserting course: {e}")
 
+    def insert_students_many(self, students, chunk_size=1000):
+        # students is an iterable of (name, age) pairs; returns the (first_id, last_id) range
+        try:
+            id_range = insert_many(self.conn, "INSERT INTO students (name, age) VALUES (?, ?)", students, chunk_size)
+            print("Students inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting students: {e}")
+
+    def insert_courses_many(self, courses, chunk_size=1000):
+        # courses is an iterable of (name, student_id) pairs; returns the (first_id, last_id) range
+        try:
+            id_range = insert_many(self.conn, "INSERT INTO courses (name, student_id) VALUES (?, ?)", courses, chunk_size)
+            print("Courses inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting courses: {e}")
+
+    def iter_query(self, sql, params=(), arraysize=None):
+        return iter_rows(self.conn, sql, params, arraysize or self.arraysize)
+
+    def iter_students(self):
+        return self.iter_query("SELECT * FROM students")
+
+    def iter_courses(self, student_id=None):
+        if student_id is None:
+            return self.iter_query("SELECT * FROM courses")
+        return self.iter_query("SELECT * FROM courses WHERE student_id = ?", (student_id,))
+
+    def right_join(self, native=False):
+        # Every course, with its student's name or NULL when the student does not exist
+        if native and NATIVE_OUTER_JOINS:
+            return self.iter_query("SELECT students.name, courses.name FROM students RIGHT JOIN courses ON students.id = courses.student_id")
+        return self.iter_query("SELECT students.name, courses.name FROM courses LEFT JOIN students ON students.id = courses.student_id")
+
+    def full_outer_join(self, native=False):
+        # Matched pairs, students without courses and courses without a student
+        if native and NATIVE_OUTER_JOINS:
+            return self.iter_query("SELECT students.name, courses.name FROM students FULL OUTER JOIN courses ON students.id = courses.student_id")
+        return self.iter_query("SELECT students.name, courses.name FROM students LEFT JOIN courses ON students.id = courses.student_id "
+                               "UNION ALL "
+                               "SELECT NULL, courses.name FROM courses WHERE NOT EXISTS (SELECT 1 FROM students WHERE students.id = courses.student_id)")
+
     def retrieve_data(self):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM students")
-            rows = cursor.fetchall()
-            for row in rows:
+            for row in self.iter_students():
                 print(f"ID: {row[0]}, Name: {row[1]}, Age: {row[2]}")
 
-            cursor.execute("SELECT * FROM courses")
-            rows = cursor.fetchall()
-            for row in rows:
-                print(f"ID: {row[0]}, Student ID: {row[1]}")
+            for row in self.iter_courses():
+                print(f"ID: {row[0]}, Name: {row[1]}, Student ID: {row[2]}")
 
             # Perform JOIN operations
 
             # Inner Join - Students and Courses
-            cursor.execute("SELECT students.name, courses.name FROM students INNER JOIN courses ON students.id = courses.student_id")
-            rows = cursor.fetchall()
             print("\nInner Join - Students and Courses:")
-            for row in rows:
+            for row in self.iter_query("SELECT students.name, courses.name FROM students INNER JOIN courses ON students.id = courses.student_id"):
                 print(f"Student Name: {row[0]}, Course Name: {row[1]}")
 
             # Left Join - Students and Courses
-            cursor.execute("SELECT students.name, courses.name FROM students LEFT JOIN courses ON students.id = courses.student_id")
-            rows = cursor.fetchall()
             print("\nLeft Join - Students and Courses:")
-            for row in rows:
+            for row in self.iter_query("SELECT students.name, courses.name FROM students LEFT JOIN courses ON students.id = courses.student_id"):
                 print(f"Student Name: {row[0]}, Course Name: {row[1]}")
 
             # Cross Join - Students and Courses (Cartesian Product)
-            cursor.execute("SELECT students.name, courses.name FROM students CROSS JOIN courses")
-            rows = cursor.fetchall()
             print("\nCross Join - Students and Courses:")
-            for row in rows:
+            for row in self.iter_query("SELECT students.name, courses.name FROM students CROSS JOIN courses"):
                 print(f"Student Name: {row[0]}, Course Name: {row[1]}")
 
             # Self-Join - Students and Courses
-            cursor.execute("SELECT s.name, c.name FROM students s, courses c WHERE s.id = c.student_id")
-            rows = cursor.fetchall()
             print("\nSelf-Join - Students and Courses:")
-            for row in rows:
+            for row in self.iter_query("SELECT s.name, c.name FROM students s, courses c WHERE s.id = c.student_id"):
+                print(f"Student Name: {row[0]}, Course Name: {row[1]}")
+
+            # Right Join - Students and Courses
+            print("\nRight Join - Students and Courses:")
+            for row in self.right_join():
                 print(f"Student Name: {row[0]}, Course Name: {row[1]}")
 
-            # Full Outer Join - Students and Courses (Simulated)
-            cursor.execute("SELECT students.name, courses.name FROM students LEFT JOIN courses ON students.id = courses.student_id UNION SELECT students.name, NULL FROM students WHERE students.id NOT IN (SELECT student_id FROM courses)")
-            rows = cursor.fetchall()
+            # Full Outer Join - Students and Courses
             print("\nFull Outer Join - Students and Courses:")
-            for row in rows:
+            for row in self.full_outer_join():
                 print(f"Student Name: {row[0]}, Course Name: {row[1]}")
 
         except sqlite3.Error as e:
@@ -134,6 +205,7 @@ def main():
     database.insert_course('Mathematics', 1)
     database.insert_course('Physics', 1)
     database.insert_course('Chemistry', 2)
+    database.insert_course('Biology', None)
 
     # Retrieve data from the tables and perform join operations
     database.retrieve_data()
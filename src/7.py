@@ -1,15 +1,310 @@
 #!/usr/bin/env python3
 import sqlite3
+import array
+import bisect
+import collections
+import contextlib
+import math
+import re
+import sys
+import time
+
+from common import apply_profile, insert_many, iter_rows, query_plan, record_factory
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# fetch_columns dtypes and the array.array typecodes used for them when NumPy is not installed
+ARRAY_TYPECODES = {"int8": "b", "int16": "h", "int32": "i", "int64": "q", "float32": "f", "float64": "d"}
+
+
+# Row types for records=True: tuple subclasses, so row[0] keeps working next to row.name
+Student = collections.namedtuple("Student", "id name age")
+Course = collections.namedtuple("Course", "id name student_id")
+
+
+class QueryStats:
+    # Upper bounds of the latency histogram buckets, in milliseconds
+    BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, float("inf"))
+
+    def __init__(self, slow_query_ms=100.0, on_slow=None):
+        self.slow_query_ms = slow_query_ms
+        self.on_slow = on_slow
+        self.statements = {}
+        self.slow_queries = []
+        self._current = None
+        self._calls = 0
+        self._call = None
+
+    @staticmethod
+    def normalize(sql):
+        # Literals become ? and whitespace collapses, so statements differing only in values share stats
+        sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+        sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+        return re.sub(r"\s+", " ", sql).strip()
+
+    # A statement starts when SQLite reports it to the trace callback. It ends when the execute
+    # call that ran it returns, or at its last row if rows are fetched after that. Within one call
+    # (executescript, executemany, the BEGIN sqlite3 issues before an INSERT) a statement ends
+    # where the next one starts; idle time between calls is never charged to a statement.
+    def trace(self, sql):
+        if sql.startswith("--"):
+            return  # Statements run by triggers are part of the statement that fired them
+        now = time.perf_counter()
+        current = self._current
+        if current is not None:
+            self._finish(now if current["call"] is not None and current["call"] == self._call else current["last"])
+        self._current = {"sql": sql, "start": now, "last": now, "rows": 0, "steps": 0, "flagged": False,
+                         "call": self._call}
+
+    @contextlib.contextmanager
+    def call(self):
+        # Wraps an execute/commit call of an InstrumentedConnection; _call identifies the running call
+        self._calls += 1
+        self._call = self._calls
+        try:
+            yield
+        finally:
+            self._call = None
+            current = self._current
+            if current is not None:
+                current["last"] = max(current["last"], time.perf_counter())
+
+    def progress(self, interval):
+        # Called by SQLite every interval VM instructions; flags slow statements while they still run
+        def handler():
+            current = self._current
+            if current is not None:
+                current["last"] = time.perf_counter()
+                current["steps"] += interval
+                if not current["flagged"] and (current["last"] - current["start"]) * 1000 >= self.slow_query_ms:
+                    current["flagged"] = True
+                    print(f"Slow query still running: {self.normalize(current['sql'])}")
+            return 0
+        return handler
+
+    def row_factory(self, wrapped=None):
+        def factory(cursor, row):
+            current = self._current
+            if current is not None:
+                current["rows"] += 1
+                current["last"] = time.perf_counter()
+            return wrapped(cursor, row) if wrapped else row
+        return factory
+
+    def flush(self):
+        if self._current is not None:
+            self._finish(self._current["last"])
+
+    def _finish(self, end):
+        current, self._current = self._current, None
+        elapsed_ms = (end - current["start"]) * 1000
+        key = self.normalize(current["sql"])
+        stats = self.statements.get(key)
+        if stats is None:
+            stats = self.statements[key] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "vm_steps": 0,
+                                            "slow": 0, "histogram": [0] * len(self.BUCKETS_MS)}
+        stats["count"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        stats["rows"] += current["rows"]
+        stats["vm_steps"] += current["steps"]
+        stats["histogram"][bisect.bisect_left(self.BUCKETS_MS, elapsed_ms)] += 1
+        if elapsed_ms >= self.slow_query_ms:
+            stats["slow"] += 1
+            slow_query = {"sql": current["sql"], "elapsed_ms": elapsed_ms, "rows": current["rows"]}
+            self.slow_queries.append(slow_query)
+            if self.on_slow:
+                self.on_slow(slow_query)
+
+    def export(self, callback):
+        # Hand each statement's stats to callback, e.g. to push them to a metrics system
+        self.flush()
+        for sql, stats in self.statements.items():
+            callback(sql, dict(stats, avg_ms=stats["total_ms"] / stats["count"]))
+
+    def report(self):
+        self.flush()
+        print(f"{'count':>6} {'total ms':>10} {'avg ms':>8} {'max ms':>8} {'rows':>7} {'slow':>5}  statement")
+        for sql, stats in sorted(self.statements.items(), key=lambda item: item[1]["total_ms"], reverse=True):
+            print(f"{stats['count']:>6} {stats['total_ms']:>10.3f} {stats['total_ms'] / stats['count']:>8.3f} "
+                  f"{stats['max_ms']:>8.3f} {stats['rows']:>7} {stats['slow']:>5}  {sql}")
+
+
+class InstrumentedCursor:
+    # Stands in for a cursor of an InstrumentedConnection and tells QueryStats when each call
+    # returns (see QueryStats.trace); everything else goes to the wrapped cursor
+    def __init__(self, cursor, query_stats):
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "_query_stats", query_stats)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, sql, parameters=()):
+        with self._query_stats.call():
+            self._cursor.execute(sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        with self._query_stats.call():
+            self._cursor.executemany(sql, seq_of_parameters)
+        return self
+
+    def executescript(self, sql_script):
+        with self._query_stats.call():
+            self._cursor.executescript(sql_script)
+        return self
+
+
+class InstrumentedConnection:
+    # Takes the place of StudentDatabase.conn while instrumentation is enabled, so a connection
+    # without instrumentation has no Python-level wrapping at all
+    def __init__(self, conn, query_stats):
+        object.__setattr__(self, "wrapped", conn)
+        object.__setattr__(self, "_query_stats", query_stats)
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.wrapped, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._query_stats.call():
+            return self.wrapped.__exit__(*exc_info)
+
+    def cursor(self, factory=sqlite3.Cursor):
+        return InstrumentedCursor(self.wrapped.cursor(factory), self._query_stats)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        with self._query_stats.call():
+            self.wrapped.commit()
+
+    def rollback(self):
+        with self._query_stats.call():
+            self.wrapped.rollback()
+
+
+class ResultCache:
+    # LRU cache of query results, bounded by entry count and by an estimate of the rows' memory.
+    # Each entry remembers the tables it was read from so a write can drop exactly those entries.
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()  # key -> (rows, tables, size)
+        self.keys_by_table = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(sql, params):
+        # Whitespace differences do not matter; literals do, so unlike QueryStats.normalize they stay
+        if isinstance(params, dict):
+            params = tuple(sorted(params.items()))
+        return re.sub(r"\s+", " ", sql).strip(), tuple(params)
+
+    @staticmethod
+    def size(rows):
+        return sys.getsizeof(rows) + sum(sys.getsizeof(row) + sum(map(sys.getsizeof, row)) for row in rows)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, rows, tables):
+        size = self.size(rows)
+        if size > self.max_bytes:
+            return  # Would evict everything else and still not fit
+        self._remove(key)
+        self.entries[key] = (rows, tables, size)
+        self.bytes += size
+        for table in tables:
+            self.keys_by_table.setdefault(table, set()).add(key)
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def invalidate(self, tables):
+        for table in tables:
+            for key in self.keys_by_table.pop(table, ()):
+                if self._remove(key):
+                    self.invalidations += 1
+
+    def clear(self):
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+        self.keys_by_table.clear()
+        self.bytes = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        self.bytes -= entry[2]
+        for table in entry[1]:
+            keys = self.keys_by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+        return True
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self.entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0, "evictions": self.evictions,
+                "invalidations": self.invalidations}
+
 
 class StudentDatabase:
-    def __init__(self, db_name):
+    def __init__(self, db_name, records=False):
         self.db_name = db_name
         self.conn = None
-
-    def connect(self):
+        self.arraysize = 1000
+        self.records = records
+        self.settings = None
+        self.query_stats = None
+        self.course_summary = False
+        self.result_cache = None
+
+    def connect(self, profile=None, **overrides):
+        # profile is one of PROFILES; keyword arguments override single settings, e.g. synchronous="OFF"
         try:
             self.conn = sqlite3.connect(self.db_name)
+            if self.records:
+                self.conn.row_factory = record_factory((Student, Course))
+            self.settings = apply_profile(self.conn, profile, **overrides)
             print("Connected to the database")
+            if profile or overrides:
+                print("Connection settings: " + ", ".join(f"{name}={value}" for name, value in self.settings.items()))
         except sqlite3.Error as e:
             print(f"An error occurred while connecting to the database: {e}")
 
@@ -31,14 +326,33 @@ class StudentDatabase:
                                FOREIGN KEY (student_id) REFERENCES students(id))''')
 
             print("Tables created successfully")
+            self.ensure_indexes()
         except sqlite3.Error as e:
             print(f"An error occurred while creating the tables: {e}")
 
+    def ensure_indexes(self):
+        # Indexes for the access paths the queries use: joins and lookups on courses.student_id,
+        # courses deleted with their student, name lookups and age filters/aggregates
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_courses_student_id_name ON courses (student_id, name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_courses_name_student_id ON courses (name, student_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_name ON students (name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_age ON students (age)")
+            self.conn.commit()
+            print("Indexes created successfully")
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the indexes: {e}")
+
+    def query_plan(self, sql, params=()):
+        return query_plan(self.conn, sql, params)
+
     def insert_student(self, name, age):
         try:
             cursor = self.conn.cursor()
             cursor.execute("INSERT INTO students (name, age) VALUES (?, ?)", (name, age))
             self.conn.commit()
+            self._invalidate("students")
             print("Student inserted successfully")
         except sqlite3.Error as e:
             print(f"An error occurred while inserting student: {e}")
@@ -48,83 +362,318 @@ class StudentDatabase:
             cursor = self.conn.cursor()
             cursor.execute("INSERT INTO courses (name, student_id) VALUES (?, ?)", (name, student_id))
             self.conn.commit()
+            self._invalidate("courses")
             print("Course inserted successfully")
         except sqlite3.Error as e:
             print(f"An error occurred while inserting course: {e}")
 
-    def retrieve_data(self):
+    def _insert_many(self, sql, rows, chunk_size):
+        table = re.match(r"\s*INSERT\s+INTO\s+(\w+)", sql, re.IGNORECASE).group(1)
+        return insert_many(self.conn, sql, rows, chunk_size, on_commit=lambda count: self._invalidate(table))
+
+    def insert_students_many(self, students, chunk_size=1000):
+        # students is an iterable of (name, age) pairs; returns the (first_id, last_id) range
         try:
-            cursor = self.conn.cursor()
+            id_range = self._insert_many("INSERT INTO students (name, age) VALUES (?, ?)", students, chunk_size)
+            print("Students inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting students: {e}")
+
+    def insert_courses_many(self, courses, chunk_size=1000):
+        # courses is an iterable of (name, student_id) pairs; returns the (first_id, last_id) range
+        try:
+            id_range = self._insert_many("INSERT INTO courses (name, student_id) VALUES (?, ?)", courses, chunk_size)
+            print("Courses inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting courses: {e}")
+
+    def iter_query(self, sql, params=(), arraysize=None):
+        # With the result cache enabled, results come from (and go to) the cache
+        if self.result_cache is not None:
+            return iter(self._cached_rows(sql, params, arraysize))
+        return iter_rows(self.conn, sql, params, arraysize or self.arraysize)
+
+    def iter_students(self):
+        return self.iter_query("SELECT * FROM students")
 
+    def iter_courses(self, student_id=None):
+        if student_id is None:
+            return self.iter_query("SELECT * FROM courses")
+        return self.iter_query("SELECT * FROM courses WHERE student_id = ?", (student_id,))
+
+    def retrieve_data(self):
+        try:
             # Group By and Having - Average age by course
-            cursor.execute("SELECT courses.name, AVG(students.age) FROM students JOIN courses ON students.id = courses.student_id GROUP BY courses.name HAVING AVG(students.age) > 20")
-            rows = cursor.fetchall()
             print("Average age by course (Having age > 20):")
-            for row in rows:
+            for row in self.average_age_by_course(20):
                 print(f"Course Name: {row[0]}, Average Age: {row[1]}")
 
             print("\n")
 
             # Union - Students and Courses
-            cursor.execute("SELECT name FROM students UNION SELECT name FROM courses")
-            rows = cursor.fetchall()
             print("Union of student names and course names:")
-            for row in rows:
+            for row in self.iter_query("SELECT name FROM students UNION SELECT name FROM courses"):
                 print(f"Name: {row[0]}")
 
             print("\n")
 
-            # Except - Students not enrolled in any course
-            cursor.execute("SELECT name FROM students EXCEPT SELECT students.name FROM students JOIN courses ON students.id = courses.student_id")
-            rows = cursor.fetchall()
+            # Except - Students not enrolled in any course (anti-join on student id)
             print("Students not enrolled in any course:")
-            for row in rows:
-                print(f"Name: {row[0]}")
+            for row in self.students_not_enrolled():
+                print(f"Name: {row[1]}")
 
             print("\n")
 
-            # Intersect - Students enrolled in both Math and Physics courses
-            cursor.execute("SELECT students.name FROM students JOIN courses ON students.id = courses.student_id WHERE courses.name = 'Mathematics' INTERSECT SELECT students.name FROM students JOIN courses ON students.id = courses.student_id WHERE courses.name = 'Physics'")
-            rows = cursor.fetchall()
+            # Intersect - Students enrolled in both Math and Physics courses (semi-join on student id)
             print("Students enrolled in both Math and Physics courses:")
-            for row in rows:
-                print(f"Name: {row[0]}")
+            for row in self.students_enrolled_in_all(['Mathematics', 'Physics']):
+                print(f"Name: {row[1]}")
 
             print("\n")
 
             # Subquery - Students younger than the average age
-            cursor.execute("SELECT name FROM students WHERE age < (SELECT AVG(age) FROM students)")
-            rows = cursor.fetchall()
             print("Students younger than the average age:")
-            for row in rows:
+            for row in self.iter_query("SELECT name FROM students WHERE age < (SELECT AVG(age) FROM students)"):
                 print(f"Name: {row[0]}")
 
             print("\n")
 
             # EXISTS - Students with enrolled courses
-            cursor.execute("SELECT name FROM students WHERE EXISTS (SELECT 1 FROM courses WHERE students.id = courses.student_id)")
-            rows = cursor.fetchall()
             print("Students with enrolled courses:")
-            for row in rows:
+            for row in self.iter_query("SELECT name FROM students WHERE EXISTS (SELECT 1 FROM courses WHERE students.id = courses.student_id)"):
                 print(f"Name: {row[0]}")
 
             print("\n")
 
             # Case - Displaying course names with age conditions
-            cursor.execute("SELECT courses.name, CASE WHEN students.age < 18 THEN 'Under 18' WHEN students.age >= 18 AND students.age < 25 THEN '18-24' ELSE '25+' END AS age_group FROM students JOIN courses ON students.id = courses.student_id")
-            rows = cursor.fetchall()
             print("Course names with age groups:")
-            for row in rows:
+            for row in self.iter_query("SELECT courses.name, CASE WHEN students.age < 18 THEN 'Under 18' WHEN students.age >= 18 AND students.age < 25 THEN '18-24' ELSE '25+' END AS age_group FROM students JOIN courses ON students.id = courses.student_id"):
                 print(f"Course Name: {row[0]}, Age Group: {row[1]}")
 
+            print("\n")
+
+            # The same age groups counted per course, on typed columns
+            print("Enrollments per age group by course:")
+            for name, groups in self.age_group_counts().items():
+                print(f"Course Name: {name}, {', '.join(f'{group}: {count}' for group, count in groups.items())}")
+
         except sqlite3.Error as e:
             print(f"An error occurred while retrieving data: {e}")
 
+    def fetch_columns(self, sql, params=(), dtypes=None, arraysize=65536):
+        # The result set as {column name: array}, filled chunk by chunk so at most arraysize rows
+        # exist as Python tuples at a time. dtypes has one entry per column: 'int64', 'float64'
+        # etc. give a NumPy array of that type, or an array.array without NumPy; 'object' (the
+        # default) keeps the Python values. NULL becomes NaN in float columns and is an error in
+        # integer columns, so filter it out in the SQL.
+        cursor = self.conn.cursor()
+        cursor.arraysize = arraysize
+        cursor.execute(sql, params)
+        names = [column[0] for column in cursor.description]
+        dtypes = list(dtypes) if dtypes is not None else ["object"] * len(names)
+        if len(dtypes) != len(names):
+            raise ValueError(f"expected {len(names)} dtypes, got {len(dtypes)}")
+        for dtype in dtypes:
+            if dtype != "object" and dtype not in ARRAY_TYPECODES:
+                raise ValueError(f"unsupported dtype {dtype!r}")
+        if numpy is not None:
+            chunks = [[] for _ in names]
+        else:
+            columns = [[] if dtype == "object" else array.array(ARRAY_TYPECODES[dtype]) for dtype in dtypes]
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            for index, values in enumerate(zip(*rows)):
+                dtype = dtypes[index]
+                if numpy is not None and dtype.startswith("int"):
+                    chunks[index].append(numpy.fromiter(values, dtype=dtype, count=len(values)))
+                elif numpy is not None:
+                    chunks[index].append(numpy.array(values, dtype=dtype))  # None becomes NaN here
+                elif dtype.startswith("float"):
+                    columns[index].extend(math.nan if value is None else value for value in values)
+                else:
+                    columns[index].extend(values)
+        if numpy is not None:
+            columns = [numpy.concatenate(chunk) if chunk else numpy.empty(0, dtype=dtype)
+                       for chunk, dtype in zip(chunks, dtypes)]
+        return dict(zip(names, columns))
+
+    def age_group_counts(self):
+        # {course name: {age group: enrollments}} for the age groups of the CASE report in
+        # retrieve_data(), computed on typed columns in one pass. Ages that are not numbers (NULL,
+        # or text left by a CSV import) come back as NaN/None and, as in the CASE, count as '25+'.
+        columns = self.fetch_columns("SELECT courses.name, CASE WHEN typeof(students.age) IN ('integer', 'real') "
+                                     "THEN students.age END AS age "
+                                     "FROM students JOIN courses ON students.id = courses.student_id",
+                                     dtypes=["object", "float64"])
+        names, ages = columns["name"], columns["age"]
+        groups = ("Under 18", "18-24", "25+")
+        if numpy is not None:
+            courses = {}
+            codes = numpy.fromiter((courses.setdefault(name, len(courses)) for name in names.tolist()),
+                                   dtype=numpy.intp, count=len(names))
+            # NaN fails both comparisons, so it lands in the last group
+            group = numpy.where(ages < 18, 0, numpy.where(ages < 25, 1, 2))
+            counts = numpy.bincount(codes * len(groups) + group, minlength=len(courses) * len(groups))
+            counts = counts.reshape(len(courses), len(groups)).tolist()
+            return {name: dict(zip(groups, counts[code])) for name, code in courses.items()}
+        counts = {}
+        for name, age in zip(names, ages):
+            group = groups[0] if age < 18 else groups[1] if age < 25 else groups[2]
+            counts.setdefault(name, dict.fromkeys(groups, 0))[group] += 1
+        return counts
+
+    def enable_course_summary(self):
+        # Per-course enrollment count and age count/sum, kept current by triggers on students and courses,
+        # so the "average age by course" report no longer depends on how many enrollments there are.
+        # Courses with a NULL name are left out of the summary.
+        # The triggers subtract what a row contributed as recorded in two ledgers, the counted students
+        # (id, age) and enrollments (id, name, student_id), not what OLD holds, and an insert first takes
+        # back any counted row with the same id. A row that REPLACE removed without firing its DELETE
+        # trigger (recursive_triggers is off by default) is still subtracted, whichever connection writes.
+        def uncount_enrollment(course_id):
+            return f"""UPDATE course_age_summary
+                       SET enrollment_count = enrollment_count - 1,
+                           age_count = age_count - (SELECT students.age IS NOT NULL FROM course_age_summary_enrollments AS enrollments
+                                                    JOIN course_age_summary_students AS students ON students.id = enrollments.student_id
+                                                    WHERE enrollments.id = {course_id}),
+                           age_sum = age_sum - (SELECT COALESCE(students.age, 0) FROM course_age_summary_enrollments AS enrollments
+                                                JOIN course_age_summary_students AS students ON students.id = enrollments.student_id
+                                                WHERE enrollments.id = {course_id})
+                       WHERE course_name = (SELECT enrollments.name FROM course_age_summary_enrollments AS enrollments
+                                            JOIN course_age_summary_students AS students ON students.id = enrollments.student_id
+                                            WHERE enrollments.id = {course_id});
+                       DELETE FROM course_age_summary WHERE enrollment_count = 0
+                           AND course_name = (SELECT name FROM course_age_summary_enrollments WHERE id = {course_id});
+                       DELETE FROM course_age_summary_enrollments WHERE id = {course_id};"""
+
+        count_enrollment = """INSERT INTO course_age_summary_enrollments (id, name, student_id)
+                              SELECT NEW.id, NEW.name, NEW.student_id WHERE NEW.name IS NOT NULL;
+                              INSERT INTO course_age_summary (course_name, enrollment_count, age_count, age_sum)
+                              SELECT NEW.name, 1, age IS NOT NULL, COALESCE(age, 0) FROM course_age_summary_students
+                              WHERE id = NEW.student_id AND NEW.name IS NOT NULL
+                              ON CONFLICT (course_name) DO UPDATE
+                              SET enrollment_count = enrollment_count + 1,
+                                  age_count = age_count + excluded.age_count,
+                                  age_sum = age_sum + excluded.age_sum;"""
+
+        def uncount_student(student_id):
+            enrollments = f"(SELECT COUNT(*) FROM course_age_summary_enrollments WHERE student_id = {student_id} AND name = course_name)"
+            return f"""UPDATE course_age_summary
+                       SET enrollment_count = enrollment_count - {enrollments},
+                           age_count = age_count - (SELECT age IS NOT NULL FROM course_age_summary_students WHERE id = {student_id}) * {enrollments},
+                           age_sum = age_sum - (SELECT COALESCE(age, 0) FROM course_age_summary_students WHERE id = {student_id}) * {enrollments}
+                       WHERE EXISTS (SELECT 1 FROM course_age_summary_students WHERE id = {student_id})
+                             AND course_name IN (SELECT name FROM course_age_summary_enrollments WHERE student_id = {student_id});
+                       DELETE FROM course_age_summary WHERE enrollment_count = 0
+                           AND course_name IN (SELECT name FROM course_age_summary_enrollments WHERE student_id = {student_id});
+                       DELETE FROM course_age_summary_students WHERE id = {student_id};"""
+
+        count_student = """INSERT INTO course_age_summary_students (id, age) VALUES (NEW.id, NEW.age);
+                           INSERT INTO course_age_summary (course_name, enrollment_count, age_count, age_sum)
+                           SELECT name, COUNT(*), COUNT(*) * (NEW.age IS NOT NULL), COUNT(*) * COALESCE(NEW.age, 0)
+                           FROM course_age_summary_enrollments WHERE student_id = NEW.id GROUP BY name
+                           ON CONFLICT (course_name) DO UPDATE
+                           SET enrollment_count = enrollment_count + excluded.enrollment_count,
+                               age_count = age_count + excluded.age_count,
+                               age_sum = age_sum + excluded.age_sum;"""
+
+        triggers = {
+            "course_age_summary_course_insert": ("AFTER INSERT ON courses", uncount_enrollment("NEW.id") + count_enrollment),
+            "course_age_summary_course_delete": ("AFTER DELETE ON courses", uncount_enrollment("OLD.id")),
+            "course_age_summary_course_update": ("AFTER UPDATE OF id, name, student_id ON courses",
+                                                 uncount_enrollment("OLD.id") + uncount_enrollment("NEW.id") + count_enrollment),
+            "course_age_summary_student_insert": ("AFTER INSERT ON students", uncount_student("NEW.id") + count_student),
+            "course_age_summary_student_delete": ("AFTER DELETE ON students", uncount_student("OLD.id")),
+            "course_age_summary_student_update": ("AFTER UPDATE OF id, age ON students",
+                                                  uncount_student("OLD.id") + uncount_student("NEW.id") + count_student),
+        }
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN")
+            cursor.execute('''CREATE TABLE IF NOT EXISTS course_age_summary
+                              (course_name TEXT PRIMARY KEY,
+                               enrollment_count INTEGER NOT NULL,
+                               age_count INTEGER NOT NULL,
+                               age_sum INTEGER NOT NULL)''')
+            cursor.execute("CREATE TABLE IF NOT EXISTS course_age_summary_students (id INTEGER PRIMARY KEY, age)")
+            cursor.execute('''CREATE TABLE IF NOT EXISTS course_age_summary_enrollments
+                              (id INTEGER PRIMARY KEY, name TEXT NOT NULL, student_id INTEGER)''')
+            cursor.execute('''CREATE INDEX IF NOT EXISTS idx_course_age_summary_enrollments_student_id_name
+                              ON course_age_summary_enrollments (student_id, name)''')
+
+            # Recreated rather than kept, so a database with triggers from an earlier version gets these
+            for name, (event, body) in triggers.items():
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+                cursor.execute(f"CREATE TRIGGER {name} {event} BEGIN {body} END")
+
+            # Rebuild from the current rows; the triggers keep it current from here on
+            cursor.execute("DELETE FROM course_age_summary")
+            cursor.execute("DELETE FROM course_age_summary_students")
+            cursor.execute("DELETE FROM course_age_summary_enrollments")
+            cursor.execute("INSERT INTO course_age_summary_students (id, age) SELECT id, age FROM students")
+            cursor.execute('''INSERT INTO course_age_summary_enrollments (id, name, student_id)
+                              SELECT id, name, student_id FROM courses WHERE name IS NOT NULL''')
+            cursor.execute('''INSERT INTO course_age_summary
+                              SELECT courses.name, COUNT(*), COUNT(students.age), COALESCE(SUM(students.age), 0)
+                              FROM students JOIN courses ON students.id = courses.student_id
+                              WHERE courses.name IS NOT NULL
+                              GROUP BY courses.name''')
+            cursor.execute("COMMIT")
+            self.course_summary = True
+            self._invalidate("course_age_summary", "course_age_summary_students", "course_age_summary_enrollments")
+            print("Course summary enabled successfully")
+        except sqlite3.Error as e:
+            if self.conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            print(f"An error occurred while enabling the course summary: {e}")
+
+    def average_age_by_course(self, min_average):
+        # (course name, average age) for courses whose average age is above min_average
+        if self.course_summary:
+            return self.iter_query("""SELECT course_name, CAST(age_sum AS REAL) / age_count FROM course_age_summary
+                                      WHERE age_count > 0 AND CAST(age_sum AS REAL) / age_count > ?
+                                      ORDER BY course_name""", (min_average,))
+        return self.iter_query("SELECT courses.name, AVG(students.age) FROM students JOIN courses ON students.id = courses.student_id GROUP BY courses.name HAVING AVG(students.age) > ?", (min_average,))
+
+    def check_course_summary(self):
+        # Compare the summary with the live aggregate; returns (course, summary row, live row) for every difference
+        summary = {row[0]: row[1:] for row in self.iter_query(
+            "SELECT course_name, enrollment_count, age_count, age_sum FROM course_age_summary")}
+        live = {row[0]: row[1:] for row in self.iter_query(
+            """SELECT courses.name, COUNT(*), COUNT(students.age), COALESCE(SUM(students.age), 0)
+               FROM students JOIN courses ON students.id = courses.student_id
+               WHERE courses.name IS NOT NULL
+               GROUP BY courses.name""")}
+        mismatches = [(name, summary.get(name), live.get(name))
+                      for name in sorted(summary.keys() | live.keys()) if summary.get(name) != live.get(name)]
+        if mismatches:
+            print(f"Course summary is inconsistent for {len(mismatches)} course(s)")
+        else:
+            print("Course summary is consistent")
+        return mismatches
+
+    def students_not_enrolled(self):
+        # (id, name) of students without any course; compares ids, so students sharing a name stay distinct
+        return self.iter_query("SELECT id, name FROM students WHERE NOT EXISTS (SELECT 1 FROM courses WHERE courses.student_id = students.id)")
+
+    def students_enrolled_in_all(self, course_names):
+        # (id, name) of students enrolled in every one of course_names (every student if it is empty):
+        # one IN list per course, each a search of idx_courses_name_student_id, so courses is never scanned
+        course_names = list(dict.fromkeys(course_names))
+        conditions = " AND ".join(["id IN (SELECT student_id FROM courses WHERE name = ?)"] * len(course_names))
+        return self.iter_query(f"SELECT id, name FROM students{' WHERE ' + conditions if conditions else ''}",
+                               tuple(course_names))
+
     def update_student(self, student_id, name):
         try:
             cursor = self.conn.cursor()
             cursor.execute("UPDATE students SET name = ? WHERE id = ?", (name, student_id))
             self.conn.commit()
+            self._invalidate("students")
             print("Student updated successfully")
         except sqlite3.Error as e:
             print(f"An error occurred while updating student: {e}")
@@ -134,6 +683,7 @@ class StudentDatabase:
             cursor = self.conn.cursor()
             cursor.execute("DELETE FROM students WHERE id = ?", (student_id,))
             self.conn.commit()
+            self._invalidate("students")
             print("Student deleted successfully")
         except sqlite3.Error as e:
             print(f"An error occurred while deleting student: {e}")
@@ -143,6 +693,7 @@ class StudentDatabase:
             cursor = self.conn.cursor()
             cursor.execute("REPLACE INTO students (name, age) VALUES (?, ?)", (name, age))
             self.conn.commit()
+            self._invalidate("students")
             print("Student replaced successfully")
         except sqlite3.Error as e:
             print(f"An error occurred while replacing student: {e}")
@@ -166,12 +717,108 @@ class StudentDatabase:
             # Commit the transaction
             cursor.execute("COMMIT")
 
+            self._invalidate("students")
             print("Transaction executed successfully")
         except sqlite3.Error as e:
             # Rollback the transaction in case of any error
             cursor.execute("ROLLBACK")
             print(f"An error occurred while executing the transaction: {e}")
 
+    def enable_instrumentation(self, slow_query_ms=100.0, on_slow=None, progress_interval=1000):
+        # Opt-in: until this is called the connection is a plain sqlite3.Connection without callbacks
+        self.disable_instrumentation()
+        self.query_stats = QueryStats(slow_query_ms, on_slow)
+        self._row_factory = self.conn.row_factory
+        self.conn.set_trace_callback(self.query_stats.trace)
+        self.conn.set_progress_handler(self.query_stats.progress(progress_interval), progress_interval)
+        self.conn.row_factory = self.query_stats.row_factory(self._row_factory)
+        self.conn = InstrumentedConnection(self.conn, self.query_stats)
+
+    def disable_instrumentation(self):
+        if isinstance(self.conn, InstrumentedConnection):
+            self.conn = self.conn.wrapped
+            self.conn.set_trace_callback(None)
+            self.conn.set_progress_handler(None, 0)
+            self.conn.row_factory = self._row_factory
+            self.query_stats.flush()
+
+    def instrumentation_report(self):
+        if self.query_stats:
+            self.query_stats.report()
+
+    def enable_result_cache(self, max_entries=256, max_bytes=32 * 1024 * 1024):
+        # Opt-in read-through cache for iter_query() and everything built on it. The write methods
+        # below drop the entries of the tables they change, plus the tables their triggers change;
+        # a change of PRAGMA data_version means another connection wrote, and clears the cache.
+        self.result_cache = ResultCache(max_entries, max_bytes)
+        self._data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        self._schema_version = None
+        self._refresh_schema()
+
+    def disable_result_cache(self):
+        self.result_cache = None
+
+    def result_cache_stats(self):
+        return self.result_cache.stats() if self.result_cache else None
+
+    def _refresh_schema(self):
+        # Root page -> table (an index maps to its table), and table -> tables its triggers write
+        schema_version = self.conn.execute("PRAGMA schema_version").fetchone()[0]
+        if schema_version == self._schema_version:
+            return
+        self._schema_version = schema_version
+        self._root_pages = {rootpage: table for table, rootpage in
+                            self.conn.execute("SELECT tbl_name, rootpage FROM sqlite_master WHERE rootpage > 0")}
+        self._trigger_writes = {}
+        for table, sql in self.conn.execute("SELECT tbl_name, sql FROM sqlite_master WHERE type = 'trigger'"):
+            # Statements of the trigger body start after BEGIN or ';' (this skips 'UPDATE OF' in the
+            # trigger header and 'DO UPDATE SET' in upserts)
+            written = re.findall(r"(?:\bBEGIN|;)\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+(\w+)",
+                                 sql, re.IGNORECASE)
+            self._trigger_writes.setdefault(table, set()).update(written)
+
+    def _tables_read(self, sql, params):
+        # The tables a statement reads, from the root pages opened by its OpenRead instructions;
+        # None if it also writes or reads something other than the main database
+        self._refresh_schema()
+        tables = set()
+        for _, opcode, _, root_page, database, *_ in self.conn.execute(f"EXPLAIN {sql}", params):
+            if opcode in ("OpenRead", "ReopenIdx"):
+                if database != 0 or root_page not in self._root_pages:
+                    return None
+                tables.add(self._root_pages[root_page])
+            elif opcode in ("OpenWrite", "VOpen"):
+                return None
+        return frozenset(tables)
+
+    def _cached_rows(self, sql, params, arraysize):
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self.result_cache.clear()
+        key = ResultCache.key(sql, params)
+        rows = self.result_cache.get(key)
+        if rows is None:
+            tables = self._tables_read(sql, params)
+            rows = list(iter_rows(self.conn, sql, params, arraysize or self.arraysize))
+            if tables is not None and not self.conn.in_transaction:
+                # Rows read inside an open transaction may not be committed yet
+                self.result_cache.put(key, rows, tables)
+        return rows
+
+    def _invalidate(self, *tables):
+        # Drop cached results for tables and, transitively, for the tables their triggers write
+        if self.result_cache is None:
+            return
+        self._refresh_schema()
+        pending, written = list(tables), set()
+        while pending:
+            table = pending.pop()
+            if table not in written:
+                written.add(table)
+                pending.extend(self._trigger_writes.get(table, ()))
+        self.result_cache.invalidate(written)
+
     def close_connection(self):
         if self.conn:
             self.conn.close()
@@ -185,9 +832,18 @@ def main():
     # Connect to the database
     database.connect()
 
+    # Record per-statement statistics from here on
+    database.enable_instrumentation(slow_query_ms=50)
+
     # Create tables
     database.create_tables()
 
+    # Maintain the per-course age aggregates incrementally
+    database.enable_course_summary()
+
+    # Cache query results until a write changes the tables they were read from
+    database.enable_result_cache()
+
     # Insert student data
     database.insert_student('John Doe', 20)
     database.insert_student('Jane Smith', 22)
@@ -212,6 +868,24 @@ def main():
     # Execute a transaction
     database.execute_transaction()
 
+    # The incrementally maintained aggregates must match the live query
+    database.check_course_summary()
+
+    # The former EXCEPT/INTERSECT reports are index-driven joins now, without a temporary B-tree
+    print("\nQuery plans:")
+    for sql, params in [("SELECT id, name FROM students WHERE NOT EXISTS (SELECT 1 FROM courses WHERE courses.student_id = students.id)", ()),
+                        ("SELECT id, name FROM students WHERE id IN (SELECT student_id FROM courses WHERE name = ?) "
+                         "AND id IN (SELECT student_id FROM courses WHERE name = ?)", ('Mathematics', 'Physics'))]:
+        print(f"{sql}: {'; '.join(database.query_plan(sql, params))}")
+
+    # Repeated reads come from the result cache
+    for _ in range(3):
+        list(database.iter_students())
+    print(f"\nResult cache: {database.result_cache_stats()}")
+
+    # Per-statement counts, latency and rows for everything since instrumentation was enabled
+    database.instrumentation_report()
+
     # Close the database connection
     database.close_connection()
 
@@ -1,15 +1,44 @@
 #!/usr/bin/env python3
 import sqlite3
+import array
+import collections
+import math
+
+from common import apply_profile, insert_many, iter_rows, query_plan, record_factory
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# fetch_columns dtypes and the array.array typecodes used for them when NumPy is not installed
+ARRAY_TYPECODES = {"int8": "b", "int16": "h", "int32": "i", "int64": "q", "float32": "f", "float64": "d"}
+
+
+# Row types for records=True: tuple subclasses, so row[0] keeps working next to row.name
+Student = collections.namedtuple("Student", "id name age")
+Course = collections.namedtuple("Course", "id name student_id")
+
 
 class StudentDatabase:
-    def __init__(self, db_name):
+    def __init__(self, db_name, records=False):
         self.db_name = db_name
         self.conn = None
+        self.arraysize = 1000
+        self.records = records
+        self.settings = None
+        self.age_summary = False
 
-    def connect(self):
+    def connect(self, profile=None, **overrides):
+        # profile is one of PROFILES; keyword arguments override single settings, e.g. synchronous="OFF"
         try:
             self.conn = sqlite3.connect(self.db_name)
+            if self.records:
+                self.conn.row_factory = record_factory((Student, Course))
+            self.settings = apply_profile(self.conn, profile, **overrides)
             print("Connected to the database")
+            if profile or overrides:
+                print("Connection settings: " + ", ".join(f"{name}={value}" for name, value in self.settings.items()))
         except sqlite3.Error as e:
             print(f"An error occurred while connecting to the database: {e}")
 
@@ -31,9 +60,26 @@ class StudentDatabase:
                                FOREIGN KEY (student_id) REFERENCES students(id))''')
 
             print("Tables created successfully")
+            self.ensure_indexes()
         except sqlite3.Error as e:
             print(f"An error occurred while creating the tables: {e}")
 
+    def ensure_indexes(self):
+        # Indexes for the access paths the queries use: joins and lookups on courses.student_id,
+        # courses deleted with their student, name lookups and age filters/aggregates
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_courses_student_id_name ON courses (student_id, name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_name ON students (name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_age ON students (age)")
+            self.conn.commit()
+            print("Indexes created successfully")
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the indexes: {e}")
+
+    def query_plan(self, sql, params=()):
+        return query_plan(self.conn, sql, params)
+
     def insert_student(self, name, age):
         try:
             cursor = self.conn.cursor()
@@ -52,48 +98,210 @@ class StudentDatabase:
         except sqlite3.Error as e:
             print(f"An error occurred while inserting course: {e}")
 
+    def insert_students_many(self, students, chunk_size=1000):
+        # students is an iterable of (name, age) pairs; returns the (first_id, last_id) range
+        try:
+            id_range = insert_many(self.conn, "INSERT INTO students (name, age) VALUES (?, ?)", students, chunk_size)
+            print("Students inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting students: {e}")
+
+    def insert_courses_many(self, courses, chunk_size=1000):
+        # courses is an iterable of (name, student_id) pairs; returns the (first_id, last_id) range
+        try:
+            id_range = insert_many(self.conn, "INSERT INTO courses (name, student_id) VALUES (?, ?)", courses, chunk_size)
+            print("Courses inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting courses: {e}")
+
+    def iter_query(self, sql, params=(), arraysize=None):
+        return iter_rows(self.conn, sql, params, arraysize or self.arraysize)
+
+    def iter_students(self):
+        return self.iter_query("SELECT * FROM students")
+
+    def iter_courses(self, student_id=None):
+        if student_id is None:
+            return self.iter_query("SELECT * FROM courses")
+        return self.iter_query("SELECT * FROM courses WHERE student_id = ?", (student_id,))
+
     def retrieve_data(self):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM students")
-            rows = cursor.fetchall()
-            for row in rows:
+            for row in self.iter_students():
                 print(f"ID: {row[0]}, Name: {row[1]}, Age: {row[2]}")
 
-            cursor.execute("SELECT * FROM courses")
-            rows = cursor.fetchall()
-            for row in rows:
+            for row in self.iter_courses():
                 print(f"ID: {row[0]}, Name: {row[1]}, Student ID: {row[2]}")
 
-            # Aggregate functions
+            # Aggregate functions - AVG, COUNT, MAX, MIN and SUM of the students' ages
+            stats = self.student_age_stats()
+            print(f"\nAverage Age of Students: {stats['avg']}")
+            print(f"Total Number of Students: {stats['count']}")
+            print(f"Maximum Age: {stats['max']}")
+            print(f"Minimum Age: {stats['min']}")
+            print(f"Sum of Ages: {stats['sum']}")
+
+            # Distribution of the ages, computed on a typed column rather than row tuples
+            print(f"Age Histogram (5-year bins): {self.age_histogram()}")
+            print(f"Age Quartiles: {self.age_quantiles()}")
+
+        except sqlite3.Error as e:
+            print(f"An error occurred while retrieving data: {e}")
+
+    def fetch_columns(self, sql, params=(), dtypes=None, arraysize=65536):
+        # The result set as {column name: array}, filled chunk by chunk so at most arraysize rows
+        # exist as Python tuples at a time. dtypes has one entry per column: 'int64', 'float64'
+        # etc. give a NumPy array of that type, or an array.array without NumPy; 'object' (the
+        # default) keeps the Python values. NULL becomes NaN in float columns and is an error in
+        # integer columns, so filter it out in the SQL.
+        cursor = self.conn.cursor()
+        cursor.arraysize = arraysize
+        cursor.execute(sql, params)
+        names = [column[0] for column in cursor.description]
+        dtypes = list(dtypes) if dtypes is not None else ["object"] * len(names)
+        if len(dtypes) != len(names):
+            raise ValueError(f"expected {len(names)} dtypes, got {len(dtypes)}")
+        for dtype in dtypes:
+            if dtype != "object" and dtype not in ARRAY_TYPECODES:
+                raise ValueError(f"unsupported dtype {dtype!r}")
+        if numpy is not None:
+            chunks = [[] for _ in names]
+        else:
+            columns = [[] if dtype == "object" else array.array(ARRAY_TYPECODES[dtype]) for dtype in dtypes]
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            for index, values in enumerate(zip(*rows)):
+                dtype = dtypes[index]
+                if numpy is not None and dtype.startswith("int"):
+                    chunks[index].append(numpy.fromiter(values, dtype=dtype, count=len(values)))
+                elif numpy is not None:
+                    chunks[index].append(numpy.array(values, dtype=dtype))  # None becomes NaN here
+                elif dtype.startswith("float"):
+                    columns[index].extend(math.nan if value is None else value for value in values)
+                else:
+                    columns[index].extend(values)
+        if numpy is not None:
+            columns = [numpy.concatenate(chunk) if chunk else numpy.empty(0, dtype=dtype)
+                       for chunk, dtype in zip(chunks, dtypes)]
+        return dict(zip(names, columns))
 
-            # AVG - Average age of students
-            cursor.execute("SELECT AVG(age) FROM students")
-            avg_age = cursor.fetchone()[0]
-            print(f"\nAverage Age of Students: {avg_age}")
+    def age_histogram(self, bin_width=5):
+        # {bin start: number of students} over the integer ages, from a typed age column. The column
+        # has no type enforcement, so NULLs and stray text values (e.g. from a CSV import) are skipped
+        ages = self.fetch_columns("SELECT age FROM students WHERE typeof(age) = 'integer'", dtypes=["int64"])["age"]
+        if numpy is not None:
+            bins, counts = numpy.unique(ages // bin_width * bin_width, return_counts=True)
+            return dict(zip(bins.tolist(), counts.tolist()))
+        return dict(sorted(collections.Counter(age // bin_width * bin_width for age in ages).items()))
 
-            # COUNT - Total number of students
-            cursor.execute("SELECT COUNT(*) FROM students")
-            total_students = cursor.fetchone()[0]
-            print(f"Total Number of Students: {total_students}")
+    def age_quantiles(self, quantiles=(0.25, 0.5, 0.75)):
+        # {quantile: age} over the integer ages (linear interpolation); SQLite has no MEDIAN or PERCENTILE
+        ages = self.fetch_columns("SELECT age FROM students WHERE typeof(age) = 'integer' ORDER BY age",
+                                  dtypes=["float64"])["age"]
+        if not len(ages):
+            return {quantile: None for quantile in quantiles}
+        if numpy is not None:
+            return dict(zip(quantiles, numpy.quantile(ages, quantiles).tolist()))
+        result = {}
+        for quantile in quantiles:
+            position = quantile * (len(ages) - 1)
+            lower = math.floor(position)
+            upper = min(lower + 1, len(ages) - 1)
+            result[quantile] = ages[lower] + (ages[upper] - ages[lower]) * (position - lower)
+        return result
 
-            # MAX - Maximum age among students
-            cursor.execute("SELECT MAX(age) FROM students")
-            max_age = cursor.fetchone()[0]
-            print(f"Maximum Age: {max_age}")
+    def student_age_stats(self):
+        # AVG, COUNT, MAX, MIN and SUM of students.age; one scan, or no scan at all with the summary enabled
+        cursor = self.conn.cursor()
+        if self.age_summary:
+            cursor.execute("""SELECT student_count, age_count, age_sum,
+                                     (SELECT MIN(age) FROM student_age_histogram),
+                                     (SELECT MAX(age) FROM student_age_histogram)
+                              FROM student_age_summary""")
+            count, age_count, age_sum, min_age, max_age = cursor.fetchone()
+            avg_age, sum_age = (age_sum / age_count, age_sum) if age_count else (None, None)
+        else:
+            cursor.execute("SELECT AVG(age), COUNT(*), MAX(age), MIN(age), SUM(age) FROM students")
+            avg_age, count, max_age, min_age, sum_age = cursor.fetchone()
+        return {"avg": avg_age, "count": count, "max": max_age, "min": min_age, "sum": sum_age}
 
-            # MIN - Minimum age among students
-            cursor.execute("SELECT MIN(age) FROM students")
-            min_age = cursor.fetchone()[0]
-            print(f"Minimum Age: {min_age}")
+    def enable_age_summary(self):
+        # A one-row summary plus per-age counts (for MIN/MAX after deletes), kept current by triggers
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN")
+            cursor.execute('''CREATE TABLE IF NOT EXISTS student_age_summary
+                              (id INTEGER PRIMARY KEY CHECK (id = 1),
+                               student_count INTEGER NOT NULL,
+                               age_count INTEGER NOT NULL,
+                               age_sum INTEGER NOT NULL)''')
+            # age has no type and is not a rowid alias, so the histogram takes whatever students.age
+            # holds (text, real) and MIN/MAX compare it the way they do on students. Recreated on
+            # every enable, which also replaces the INTEGER PRIMARY KEY version of the table.
+            cursor.execute("DROP TABLE IF EXISTS student_age_histogram")
+            cursor.execute('''CREATE TABLE student_age_histogram
+                              (age PRIMARY KEY,
+                               student_count INTEGER NOT NULL) WITHOUT ROWID''')
 
-            # SUM - Sum of ages of students
-            cursor.execute("SELECT SUM(age) FROM students")
-            sum_age = cursor.fetchone()[0]
-            print(f"Sum of Ages: {sum_age}")
+            cursor.execute('''CREATE TRIGGER IF NOT EXISTS students_age_summary_insert AFTER INSERT ON students
+                              BEGIN
+                                  UPDATE student_age_summary
+                                  SET student_count = student_count + 1,
+                                      age_count = age_count + (NEW.age IS NOT NULL),
+                                      age_sum = age_sum + COALESCE(NEW.age, 0);
+                                  INSERT INTO student_age_histogram (age, student_count)
+                                  SELECT NEW.age, 1 WHERE NEW.age IS NOT NULL
+                                  ON CONFLICT (age) DO UPDATE SET student_count = student_count + 1;
+                              END''')
+            cursor.execute('''CREATE TRIGGER IF NOT EXISTS students_age_summary_delete AFTER DELETE ON students
+                              BEGIN
+                                  UPDATE student_age_summary
+                                  SET student_count = student_count - 1,
+                                      age_count = age_count - (OLD.age IS NOT NULL),
+                                      age_sum = age_sum - COALESCE(OLD.age, 0);
+                                  UPDATE student_age_histogram SET student_count = student_count - 1 WHERE age = OLD.age;
+                                  DELETE FROM student_age_histogram WHERE age = OLD.age AND student_count = 0;
+                              END''')
+            cursor.execute('''CREATE TRIGGER IF NOT EXISTS students_age_summary_update AFTER UPDATE OF age ON students
+                              BEGIN
+                                  UPDATE student_age_summary
+                                  SET age_count = age_count - (OLD.age IS NOT NULL) + (NEW.age IS NOT NULL),
+                                      age_sum = age_sum - COALESCE(OLD.age, 0) + COALESCE(NEW.age, 0);
+                                  UPDATE student_age_histogram SET student_count = student_count - 1 WHERE age = OLD.age;
+                                  DELETE FROM student_age_histogram WHERE age = OLD.age AND student_count = 0;
+                                  INSERT INTO student_age_histogram (age, student_count)
+                                  SELECT NEW.age, 1 WHERE NEW.age IS NOT NULL
+                                  ON CONFLICT (age) DO UPDATE SET student_count = student_count + 1;
+                              END''')
 
+            # Rebuild from the current rows; the triggers keep it current from here on
+            cursor.execute("DELETE FROM student_age_summary")
+            cursor.execute("INSERT INTO student_age_summary SELECT 1, COUNT(*), COUNT(age), COALESCE(SUM(age), 0) FROM students")
+            cursor.execute("INSERT INTO student_age_histogram SELECT age, COUNT(*) FROM students WHERE age IS NOT NULL GROUP BY age")
+            cursor.execute("COMMIT")
+            self.age_summary = True
+            print("Age summary enabled successfully")
         except sqlite3.Error as e:
-            print(f"An error occurred while retrieving data: {e}")
+            if self.conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            print(f"An error occurred while enabling the age summary: {e}")
+
+    def disable_age_summary(self):
+        try:
+            cursor = self.conn.cursor()
+            for trigger in ("insert", "delete", "update"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS students_age_summary_{trigger}")
+            cursor.execute("DROP TABLE IF EXISTS student_age_summary")
+            cursor.execute("DROP TABLE IF EXISTS student_age_histogram")
+            self.conn.commit()
+            self.age_summary = False
+            print("Age summary disabled successfully")
+        except sqlite3.Error as e:
+            print(f"An error occurred while disabling the age summary: {e}")
 
     def close_connection(self):
         if self.conn:
@@ -111,6 +319,9 @@ def main():
     # Create tables
     database.create_tables()
 
+    # Keep the age statistics in a trigger-maintained summary so reading them is O(1)
+    database.enable_age_summary()
+
     # Insert student data
     database.insert_student('John Doe', 20)
     database.insert_student('Jane Smith', 22)
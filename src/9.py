@@ -1,16 +1,112 @@
 #!/usr/bin/env python3
 import sqlite3
+import itertools
+import collections
+import contextlib
 import csv
+import gzip
+import io
+import json
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import apply_profile, insert_many, iter_rows, query_plan, record_factory
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Row types for records=True: tuple subclasses, so row[0] keeps working next to row.name
+Student = collections.namedtuple("Student", "id name age")
+Course = collections.namedtuple("Course", "id name student_id")
+
+
+# An FTS5 table with content='other_table': its index can be rebuilt from that table
+EXTERNAL_CONTENT_FTS5 = re.compile(r"\bUSING\s+fts5\s*\(.*\bcontent\s*=\s*'?[^',)\s]", re.IGNORECASE | re.DOTALL)
+
+
+class AttachmentFile(io.RawIOBase):
+    # File-like access to one attachment through an incremental BLOB handle (Connection.blobopen),
+    # so reads and writes move one chunk at a time instead of the whole value. The length is fixed
+    # when the attachment is created: writes can overwrite bytes but not append.
+    def __init__(self, blob, writable=False):
+        super().__init__()
+        self._blob = blob
+        self._writable = writable
+
+    def __len__(self):
+        return len(self._blob)
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return self._writable
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        # Straight from SQLite into a new bytes object, without going through readinto()
+        self._checkClosed()
+        return self._blob.read(size)
+
+    def readinto(self, buffer):
+        # Fills a caller-owned buffer, so a loop can reuse one buffer for the whole attachment
+        self._checkClosed()
+        view = memoryview(buffer).cast("B")
+        data = self._blob.read(len(view))
+        view[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        # Any buffer-protocol object; SQLite reads it in place
+        self._checkClosed()
+        if not self._writable:
+            raise io.UnsupportedOperation("attachment opened read-only")
+        self._blob.write(data)
+        return memoryview(data).nbytes
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._checkClosed()
+        self._blob.seek(offset, whence)
+        return self._blob.tell()
+
+    def tell(self):
+        self._checkClosed()
+        return self._blob.tell()
+
+    def close(self):
+        if not self.closed:
+            self._blob.close()
+        super().close()
+
 
 class StudentDatabase:
-    def __init__(self, db_name):
+    def __init__(self, db_name, records=False):
         self.db_name = db_name
         self.conn = None
+        self.arraysize = 1000
+        self.records = records
+        self.settings = None
 
-    def connect(self):
+    def connect(self, profile=None, **overrides):
+        # profile is one of PROFILES; keyword arguments override single settings, e.g. synchronous="OFF"
         try:
             self.conn = sqlite3.connect(self.db_name)
+            if self.records:
+                self.conn.row_factory = record_factory((Student, Course))
+            self.settings = apply_profile(self.conn, profile, **overrides)
             print("Connected to the database")
+            if profile or overrides:
+                print("Connection settings: " + ", ".join(f"{name}={value}" for name, value in self.settings.items()))
         except sqlite3.Error as e:
             print(f"An error occurred while connecting to the database: {e}")
 
@@ -31,10 +127,39 @@ class StudentDatabase:
                                student_id INTEGER,
                                FOREIGN KEY (student_id) REFERENCES students(id))''')
 
+            # Create the attachments table (transcripts, photos, ...); size is the length of data
+            cursor.execute('''CREATE TABLE IF NOT EXISTS attachments
+                              (id INTEGER PRIMARY KEY,
+                               student_id INTEGER NOT NULL,
+                               name TEXT NOT NULL,
+                               content_type TEXT,
+                               size INTEGER NOT NULL,
+                               data BLOB NOT NULL,
+                               FOREIGN KEY (student_id) REFERENCES students(id))''')
+
             print("Tables created successfully")
+            self.ensure_indexes()
         except sqlite3.Error as e:
             print(f"An error occurred while creating the tables: {e}")
 
+    def ensure_indexes(self):
+        # Indexes for the access paths the queries use: joins and lookups on courses.student_id,
+        # courses deleted with their student, name lookups, age filters/aggregates and the
+        # attachments of a student
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_courses_student_id_name ON courses (student_id, name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_name ON students (name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_age ON students (age)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_attachments_student_id ON attachments (student_id)")
+            self.conn.commit()
+            print("Indexes created successfully")
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the indexes: {e}")
+
+    def query_plan(self, sql, params=()):
+        return query_plan(self.conn, sql, params)
+
     def insert_student(self, name, age):
         try:
             cursor = self.conn.cursor()
@@ -53,17 +178,41 @@ class StudentDatabase:
         except sqlite3.Error as e:
             print(f"An error occurred while inserting course: {e}")
 
+    def insert_students_many(self, students, chunk_size=1000):
+        # students is an iterable of (name, age) pairs; returns the (first_id, last_id) range
+        try:
+            id_range = insert_many(self.conn, "INSERT INTO students (name, age) VALUES (?, ?)", students, chunk_size)
+            print("Students inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting students: {e}")
+
+    def insert_courses_many(self, courses, chunk_size=1000):
+        # courses is an iterable of (name, student_id) pairs; returns the (first_id, last_id) range
+        try:
+            id_range = insert_many(self.conn, "INSERT INTO courses (name, student_id) VALUES (?, ?)", courses, chunk_size)
+            print("Courses inserted successfully")
+            return id_range
+        except sqlite3.Error as e:
+            print(f"An error occurred while inserting courses: {e}")
+
+    def iter_query(self, sql, params=(), arraysize=None):
+        return iter_rows(self.conn, sql, params, arraysize or self.arraysize)
+
+    def iter_students(self):
+        return self.iter_query("SELECT * FROM students")
+
+    def iter_courses(self, student_id=None):
+        if student_id is None:
+            return self.iter_query("SELECT * FROM courses")
+        return self.iter_query("SELECT * FROM courses WHERE student_id = ?", (student_id,))
+
     def retrieve_data(self):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM students")
-            rows = cursor.fetchall()
-            for row in rows:
+            for row in self.iter_students():
                 print(f"ID: {row[0]}, Name: {row[1]}, Age: {row[2]}")
 
-            cursor.execute("SELECT * FROM courses")
-            rows = cursor.fetchall()
-            for row in rows:
+            for row in self.iter_courses():
                 print(f"ID: {row[0]}, Name: {row[1]}, Student ID: {row[2]}")
         except sqlite3.Error as e:
             print(f"An error occurred while retrieving data: {e}")
@@ -100,32 +249,460 @@ class StudentDatabase:
         except sqlite3.Error as e:
             print(f"An error occurred while dumping database: {e}")
 
-    def import_csv(self, table_name, csv_file):
+    def _compression_for(self, path, compression):
+        # Explicit compression wins, otherwise it follows the file name: '.gz' for gzip, '.zst' for zstd
+        if compression is None:
+            if path.endswith(".gz"):
+                compression = "gzip"
+            elif path.endswith(".zst"):
+                compression = "zstd"
+        if compression not in (None, False, "gzip", "zstd"):
+            raise ValueError(f"Unknown compression '{compression}'")
+        if compression == "zstd" and zstandard is None:
+            raise OSError("zstd compression needs the zstandard package (pip install zstandard)")
+        return compression
+
+    def _open_compressed(self, path, mode, compression, level=None):
+        # level=None keeps each library's default (gzip 9, zstd 3)
+        if compression == "gzip":
+            return gzip.open(path, mode, compresslevel=9 if level is None else level)
+        if "w" in mode:
+            return zstandard.ZstdCompressor(level=3 if level is None else level).stream_writer(open(path, mode))
+        return zstandard.ZstdDecompressor().stream_reader(open(path, mode))
+
+    def _backup_progress(self, label):
+        # Print progress in 10% steps rather than once per backup step
+        reported = [-1]
+
+        def progress(status, remaining, total):
+            percent = 100 * (total - remaining) // total if total else 100
+            if percent // 10 > reported[0]:
+                reported[0] = percent // 10
+                print(f"{label}: {total - remaining}/{total} pages ({percent}%)")
+        return progress
+
+    def snapshot(self, path, pages=256, sleep=0.005, compression=None):
+        # Page-level copy through the backup API. Copying pages per step and sleeping in between
+        # lets other connections keep writing; the copy restarts if they change a page already copied.
+        try:
+            compression = self._compression_for(path, compression)
+            target_path = path
+            if compression:
+                fd, target_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(path)))
+                os.close(fd)
+            try:
+                target = sqlite3.connect(target_path)
+                try:
+                    self.conn.backup(target, pages=pages, sleep=sleep, progress=self._backup_progress("Snapshot"))
+                finally:
+                    target.close()
+                if compression:
+                    with open(target_path, "rb") as source, self._open_compressed(path, "wb", compression) as destination:
+                        shutil.copyfileobj(source, destination, 1024 * 1024)
+            finally:
+                if compression:
+                    os.remove(target_path)
+            print(f"Database snapshot written to '{path}' successfully")
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"An error occurred while taking a snapshot: {e}")
+
+    def restore(self, path, pages=256, sleep=0.005, compression=None):
+        # Replaces the whole database with the snapshot at path
+        try:
+            compression = self._compression_for(path, compression)
+            source_path = path
+            if compression:
+                with self._open_compressed(path, "rb", compression) as source:
+                    fd, source_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(path)))
+                    try:
+                        with os.fdopen(fd, "wb") as destination:
+                            shutil.copyfileobj(source, destination, 1024 * 1024)
+                    except BaseException:
+                        os.remove(source_path)
+                        raise
+            try:
+                if self.conn.in_transaction:
+                    self.conn.commit()
+                source = sqlite3.connect(source_path)
+                try:
+                    source.backup(self.conn, pages=pages, sleep=sleep, progress=self._backup_progress("Restore"))
+                finally:
+                    source.close()
+            finally:
+                if compression:
+                    os.remove(source_path)
+            print(f"Database restored from '{path}' successfully")
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"An error occurred while restoring the snapshot: {e}")
+
+    def _dump_table(self, conn, table_name, path, compression, level, virtual=False):
+        # SQLite builds the INSERT statements itself (quote() per column), so the worker thread
+        # mostly waits in SQLite and zlib, both of which release the GIL. Virtual tables are read
+        # through their module, with the rowid, since their own columns may not include it.
+        try:
+            columns = [f'"{column[1]}"' for column in conn.execute(f'PRAGMA table_info("{table_name}")')]
+            target = f'"{table_name}"'
+            if virtual:
+                columns.insert(0, "rowid")
+                target += f"({', '.join(columns)})"
+            values = " || ',' || ".join(f"quote({column})" for column in columns)
+            cursor = conn.execute(f"SELECT 'INSERT INTO {target} VALUES(' || {values} || ');' FROM \"{table_name}\"")
+            cursor.arraysize = 10000
+            rows = 0
+            with (self._open_compressed(path, "wb", compression, level) if compression else open(path, "wb")) as file:
+                while True:
+                    statements = cursor.fetchmany()
+                    if not statements:
+                        break
+                    file.write("".join(f"{statement}\n" for (statement,) in statements).encode())
+                    rows += len(statements)
+            return rows
+        finally:
+            conn.close()
+
+    def _table_types(self, cursor, schema):
+        # {table name: 'table', 'virtual' or 'shadow'}. Shadow tables hold a virtual table's data
+        # (students_fts_data, ...) and are recreated with it, so they are not dumped themselves.
+        # Before SQLite 3.37 (no PRAGMA table_list) they are recognised by their name prefix.
+        if sqlite3.sqlite_version_info >= (3, 37):
+            return {name: kind for _, name, kind, *_ in cursor.execute("PRAGMA main.table_list")}
+        virtual = [name for kind, name, _, sql in schema if kind == "table" and sql.upper().startswith("CREATE VIRTUAL")]
+        types = {}
+        for kind, name, _, sql in schema:
+            if kind == "table":
+                types[name] = ("virtual" if name in virtual else
+                               "shadow" if any(name.startswith(f"{table}_") for table in virtual) else "table")
+        return types
+
+    def dump_parallel(self, directory, max_workers=None, compression="gzip", level=6):
+        # One file per table plus manifest.json. Every table is read through its own read-only
+        # connection, and all of them start their read transaction while this connection holds the
+        # write lock, so they see the same snapshot; the dumps then run concurrently.
+        readers = {}
+        try:
+            compression = self._compression_for("", compression)
+            os.makedirs(directory, exist_ok=True)
+            start = time.perf_counter()
+            cursor = self.conn.cursor()
+            if self.conn.in_transaction:
+                self.conn.commit()
+
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                schema = cursor.execute("SELECT type, name, tbl_name, sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'").fetchall()
+                sequence = cursor.execute("SELECT name, seq FROM sqlite_sequence").fetchall() if any(
+                    row[1] == "sqlite_sequence" for row in cursor.execute("SELECT type, name FROM sqlite_master")) else []
+                table_types = self._table_types(cursor, schema)
+                tables = [(name, sql) for kind, name, _, sql in schema if kind == "table" and table_types.get(name) == "table"]
+                # External-content FTS5 tables are rebuilt from their content table after the load;
+                # other virtual tables have their rows dumped like a table
+                virtual_tables = [(name, sql, bool(EXTERNAL_CONTENT_FTS5.search(sql))) for kind, name, _, sql in schema
+                                  if kind == "table" and table_types.get(name) == "virtual"]
+                virtual_dumps = {name for name, _, rebuild in virtual_tables if not rebuild}
+                dumped = tables + [(name, sql) for name, sql, rebuild in virtual_tables if not rebuild]
+                for table_name, _ in dumped:
+                    reader = sqlite3.connect(f"file:{os.path.abspath(self.db_name)}?mode=ro", uri=True, check_same_thread=False)
+                    readers[table_name] = reader
+                    reader.execute("BEGIN")
+                    reader.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()  # Starts the read transaction
+            finally:
+                cursor.execute("ROLLBACK")
+
+            suffix = {"gzip": ".sql.gz", "zstd": ".sql.zst"}.get(compression, ".sql")
+            files = {table_name: f"{index:04d}_{table_name}{suffix}" for index, (table_name, _) in enumerate(dumped)}
+            with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+                futures = {table_name: executor.submit(self._dump_table, readers[table_name], table_name,
+                                                       os.path.join(directory, files[table_name]), compression, level,
+                                                       table_name in virtual_dumps)
+                           for table_name, _ in dumped}
+                row_counts = {table_name: future.result() for table_name, future in futures.items()}
+
+            manifest = {
+                "database": self.db_name,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "compression": compression or None,
+                "tables": [{"name": name, "sql": sql, "file": files[name], "rows": row_counts[name]} for name, sql in tables],
+                # Created after the data has been loaded
+                "indexes": [sql for kind, _, _, sql in schema if kind == "index"],
+                "virtual_tables": [{"name": name, "sql": sql, "rebuild": rebuild,
+                                    "file": None if rebuild else files[name], "rows": None if rebuild else row_counts[name]}
+                                   for name, sql, rebuild in virtual_tables],
+                "triggers": [sql for kind, _, _, sql in schema if kind == "trigger"],
+                "views": [sql for kind, _, _, sql in schema if kind == "view"],
+                "sqlite_sequence": sequence,
+            }
+            with open(os.path.join(directory, "manifest.json"), "w") as file:
+                json.dump(manifest, file, indent=2)
+            elapsed = time.perf_counter() - start
+            print(f"Database dumped to '{directory}' successfully ({len(tables)} tables, "
+                  f"{sum(row_counts.values())} rows in {elapsed:.2f}s)")
+            return manifest
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"An error occurred while dumping database: {e}")
+        finally:
+            # Readers whose dump never ran (or failed before closing them) still hold a read transaction
+            for reader in readers.values():
+                reader.close()
+
+    def _load_statements(self, lines, statements_per_transaction):
+        # Runs the INSERT statements of a table file, statements_per_transaction per transaction.
+        # A quoted value can contain newlines, so lines are joined until they form a complete
+        # statement. A failing transaction is rolled back before the error is raised.
+        loaded = 0
+        statement = ""
+        batch = []
+        for line in itertools.chain(lines, [None]):
+            if line is not None:
+                statement += line
+                if not sqlite3.complete_statement(statement):
+                    continue
+                batch.append(statement)
+                statement = ""
+            elif statement.strip():
+                raise ValueError(f"incomplete statement at the end of the file: {statement[:80]!r}")
+            if batch and (line is None or len(batch) == statements_per_transaction):
+                self.conn.execute("BEGIN")
+                try:
+                    for sql in batch:
+                        self.conn.execute(sql)
+                    self.conn.commit()
+                except BaseException:
+                    self.conn.rollback()
+                    raise
+                loaded += len(batch)
+                batch = []
+        return loaded
+
+    def _load_table_file(self, directory, table, compression, statements_per_transaction):
+        path = os.path.join(directory, table["file"])
+        with (self._open_compressed(path, "rb", compression) if compression else open(path, "rb")) as raw:
+            # newline="" keeps a '\r' inside a value as it is
+            lines = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+            try:
+                return self._load_statements(lines, statements_per_transaction)
+            except sqlite3.Error as e:
+                raise sqlite3.Error(f"table '{table['name']}': {e}") from e
+
+    def restore_parallel_dump(self, directory, statements_per_transaction=10000):
+        # Loads a dump_parallel directory: tables in manifest order, then indexes, virtual tables,
+        # triggers and views, so indexes are built once over the loaded data instead of updated row by row
+        try:
+            with open(os.path.join(directory, "manifest.json")) as file:
+                manifest = json.load(file)
+            compression = manifest["compression"]
+            if self.conn.in_transaction:
+                self.conn.commit()
+            start = time.perf_counter()
+            for table in manifest["tables"]:
+                self.conn.executescript(table["sql"])
+                self._load_table_file(directory, table, compression, statements_per_transaction)
+            for sql in manifest["indexes"]:
+                self.conn.executescript(sql)
+            for table in manifest.get("virtual_tables", []):
+                self.conn.executescript(table["sql"])
+                if table["rebuild"]:
+                    name = table["name"]
+                    self.conn.execute(f"INSERT INTO \"{name}\"(\"{name}\") VALUES ('rebuild')")
+                    self.conn.commit()
+                else:
+                    self._load_table_file(directory, table, compression, statements_per_transaction)
+            for sql in manifest["triggers"] + manifest["views"]:
+                self.conn.executescript(sql)
+            if manifest["sqlite_sequence"]:
+                self.conn.execute("DELETE FROM sqlite_sequence")
+                self.conn.executemany("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", manifest["sqlite_sequence"])
+                self.conn.commit()
+            elapsed = time.perf_counter() - start
+            print(f"Database restored from '{directory}' successfully ({elapsed:.2f}s)")
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"An error occurred while restoring the dump: {e}")
+
+    def _set_pragmas(self, pragmas):
+        # Apply pragmas and return their previous values so they can be restored afterwards
+        cursor = self.conn.cursor()
+        previous = {}
+        for name, value in pragmas.items():
+            previous[name] = cursor.execute(f"PRAGMA {name}").fetchone()[0]
+            cursor.execute(f"PRAGMA {name} = {value}")
+        return previous
+
+    def _csv_converter(self, declared_type):
+        # Choose the conversion once per column from its declared type, following SQLite's affinity rules
+        declared_type = declared_type.upper()
+        if "INT" in declared_type:
+            convert = int
+        elif "REAL" in declared_type or "FLOA" in declared_type or "DOUB" in declared_type:
+            convert = float
+        else:
+            return lambda value: value
+        return lambda value: convert(value) if value != "" else None
+
+    def import_csv(self, table_name, csv_file, columns=None, chunk_size=10000, report_every=100000, compress=None):
+        # Streams the file in chunks of chunk_size rows; columns defaults to every header column the table has.
+        # compress defaults to on for '.gz' file names, as in export_csv. Returns the number of rows imported.
         try:
             cursor = self.conn.cursor()
-            with open(csv_file, "r") as file:
+            declared_types = {column[1]: column[2] for column in cursor.execute(f"PRAGMA table_info({table_name})")}
+            if not declared_types:
+                raise ValueError(f"no such table: {table_name}")
+            if compress is None:
+                compress = csv_file.endswith(".gz")
+            if compress:
+                file = gzip.open(csv_file, "rt", newline="")
+            else:
+                file = open(csv_file, "r", newline="", buffering=1024 * 1024)
+            with file:
                 csv_reader = csv.reader(file)
-                next(csv_reader)  # Skip the header row
-                for row in csv_reader:
-                    cursor.execute(f"INSERT INTO {table_name} (name, age) VALUES (?, ?)", (row[0], row[1]))
-            self.conn.commit()
-            print(f"CSV file '{csv_file}' imported into table '{table_name}' successfully")
-        except sqlite3.Error as e:
+                header = next(csv_reader, None)
+                if header is None:
+                    print(f"CSV file '{csv_file}' is empty, nothing imported")
+                    return 0
+                if columns is None:
+                    columns = [name for name in header if name in declared_types]
+                    if not columns:
+                        raise ValueError(f"no column of the CSV header is in table '{table_name}'")
+                for name in columns:
+                    if name not in header:
+                        raise ValueError(f"column '{name}' is not in the CSV header")
+                    if name not in declared_types:
+                        raise ValueError(f"table '{table_name}' has no column '{name}'")
+                positions = [header.index(name) for name in columns]
+                converters = [self._csv_converter(declared_types[name]) for name in columns]
+                placeholders = ", ".join(["?"] * len(columns))
+                sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+                start = time.perf_counter()
+                imported = 0
+
+                def coerced_rows():
+                    nonlocal imported
+                    for row in csv_reader:
+                        yield tuple(convert(row[position]) for position, convert in zip(positions, converters))
+                        imported += 1
+                        if imported % report_every == 0:
+                            print(f"Imported {imported} rows ({imported / (time.perf_counter() - start):,.0f} rows/sec)")
+
+                # Bulk-load settings; a database already in WAL mode stays in WAL mode
+                self.conn.commit()
+                bulk_load = {"synchronous": "OFF", "cache_size": -256 * 1024}
+                if cursor.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+                    bulk_load["journal_mode"] = "MEMORY"
+                previous = self._set_pragmas(bulk_load)
+                try:
+                    insert_many(self.conn, sql, coerced_rows(), chunk_size)
+                finally:
+                    self._set_pragmas(previous)
+
+            elapsed = time.perf_counter() - start
+            print(f"CSV file '{csv_file}' imported into table '{table_name}' successfully "
+                  f"({imported} rows, {imported / elapsed:,.0f} rows/sec)")
+            return imported
+        except (sqlite3.Error, ValueError, OSError) as e:
             print(f"An error occurred while importing CSV: {e}")
 
-    def export_csv(self, table_name, csv_file):
+    def export_csv(self, table_name, csv_file, compress=None, arraysize=10000):
+        # Streams rows with fetchmany so memory stays flat; compress defaults to on for '.gz' file names
         try:
             cursor = self.conn.cursor()
+            cursor.arraysize = arraysize
             cursor.execute(f"SELECT * FROM {table_name}")
-            rows = cursor.fetchall()
-            with open(csv_file, "w", newline="") as file:
+            if compress is None:
+                compress = csv_file.endswith(".gz")
+            raw = gzip.GzipFile(csv_file, "wb") if compress else io.FileIO(csv_file, "w")
+            exported = 0
+            with io.TextIOWrapper(io.BufferedWriter(raw, 1024 * 1024), newline="") as file:
                 csv_writer = csv.writer(file)
-                csv_writer.writerow(["name", "age"])  # Write header row
-                csv_writer.writerows(rows)
-            print(f"Table '{table_name}' exported to CSV file '{csv_file}' successfully")
-        except sqlite3.Error as e:
+                csv_writer.writerow([column[0] for column in cursor.description])  # Write header row
+                while True:
+                    rows = cursor.fetchmany()
+                    if not rows:
+                        break
+                    csv_writer.writerows(rows)
+                    exported += len(rows)
+            print(f"Table '{table_name}' exported to CSV file '{csv_file}' successfully ({exported} rows)")
+            return exported
+        except (sqlite3.Error, OSError) as e:
             print(f"An error occurred while exporting CSV: {e}")
 
+    def _blobopen(self, attachment_id, readonly):
+        if not hasattr(self.conn, "blobopen"):
+            raise sqlite3.NotSupportedError("streaming attachments needs Python 3.11 or newer (Connection.blobopen)")
+        return self.conn.blobopen("attachments", "data", attachment_id, readonly=readonly)
+
+    def add_attachment(self, student_id, source, name=None, content_type=None, size=None, chunk_size=1024 * 1024):
+        # Streams source (a path or a binary file object) into a new attachment and returns its id.
+        # A BLOB handle cannot change the length of a value, so the row is inserted with a zeroblob()
+        # of the final size and filled through one reused buffer: the file's readinto() writes into
+        # it and the handle reads from it, so memory stays at chunk_size whatever the file size.
+        # size is only needed for sources that cannot seek.
+        try:
+            with contextlib.ExitStack() as stack:
+                if isinstance(source, (str, os.PathLike)):
+                    name = name or os.path.basename(source)
+                    source = stack.enter_context(open(source, "rb", buffering=0))
+                if name is None:
+                    raise ValueError("name is required when source is a file object")
+                if content_type is None:
+                    content_type = mimetypes.guess_type(name)[0]
+                if size is None:
+                    position = source.tell()
+                    size = source.seek(0, io.SEEK_END) - position
+                    source.seek(position)
+
+                cursor = self.conn.cursor()
+                if cursor.execute("SELECT 1 FROM students WHERE id = ?", (student_id,)).fetchone() is None:
+                    raise ValueError(f"no student with id {student_id}")
+                cursor.execute("INSERT INTO attachments (student_id, name, content_type, size, data) "
+                               "VALUES (?, ?, ?, ?, zeroblob(?))", (student_id, name, content_type, size, size))
+                attachment_id = cursor.lastrowid
+                try:
+                    view = memoryview(bytearray(max(1, min(chunk_size, size))))
+                    with self._blobopen(attachment_id, readonly=False) as blob:
+                        while blob.tell() < size:
+                            count = source.readinto(view[:size - blob.tell()])
+                            if not count:
+                                raise ValueError(f"'{name}' ended after {blob.tell()} of {size} bytes")
+                            blob.write(view[:count])
+                    self.conn.commit()
+                except BaseException:
+                    self.conn.rollback()
+                    raise
+            print(f"Attachment '{name}' added to student {student_id} ({size} bytes)")
+            return attachment_id
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"An error occurred while adding attachment: {e}")
+
+    def open_attachment(self, attachment_id, writable=False):
+        # An AttachmentFile for reading in chunks (read, readinto, seek), or for overwriting bytes in
+        # place with writable=True. Writes outside a transaction are committed as they happen.
+        return AttachmentFile(self._blobopen(attachment_id, readonly=not writable), writable)
+
+    def save_attachment(self, attachment_id, path, chunk_size=1024 * 1024):
+        # Streams an attachment to a file, holding one chunk in memory at a time
+        try:
+            saved = 0
+            with self._blobopen(attachment_id, readonly=True) as blob, open(path, "wb", buffering=0) as file:
+                while chunk := blob.read(chunk_size):
+                    file.write(chunk)
+                    saved += len(chunk)
+            print(f"Attachment {attachment_id} saved to '{path}' ({saved} bytes)")
+            return saved
+        except (sqlite3.Error, OSError) as e:
+            print(f"An error occurred while saving attachment: {e}")
+
+    def list_attachments(self, student_id):
+        # (id, name, content_type, size) per attachment, without reading the data
+        return self.iter_query("SELECT id, name, content_type, size FROM attachments WHERE student_id = ? ORDER BY id",
+                               (student_id,))
+
+    def delete_attachment(self, attachment_id):
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("DELETE FROM attachments WHERE id = ?", (attachment_id,))
+            self.conn.commit()
+            print("Attachment deleted successfully")
+        except sqlite3.Error as e:
+            print(f"An error occurred while deleting attachment: {e}")
+
     def close_connection(self):
         if self.conn:
             self.conn.close()
@@ -163,12 +740,29 @@ def main():
     # Dump database
     database.dump_database('database_dump.sql')
 
+    # Per-table dump, tables written concurrently to separate gzip files plus a manifest
+    database.dump_parallel('database_dump')
+
+    # Binary snapshot through the backup API, gzip-compressed because of the file name
+    database.snapshot('database_snapshot.db.gz')
+
     # Import CSV
-    database.import_csv('students', 'students.csv')
+    database.import_csv('students', 'students.csv', columns=['name', 'age'])
 
     # Export CSV
     database.export_csv('students', 'exported_students.csv')
 
+    # Attach a file to a student, then read it back in chunks through the BLOB handle
+    attachment_id = database.add_attachment(1, 'students.csv')
+    if attachment_id is not None:
+        for row in database.list_attachments(1):
+            print(f"Attachment ID: {row[0]}, Name: {row[1]}, Type: {row[2]}, Size: {row[3]}")
+        with database.open_attachment(attachment_id) as attachment:
+            buffer = bytearray(32)
+            count = attachment.readinto(buffer)
+            print(f"First {count} of {len(attachment)} bytes: {bytes(buffer[:count])!r}")
+        database.delete_attachment(attachment_id)
+
     # Close the database connection
     database.close_connection()
 
@@ -0,0 +1,880 @@
+#!/usr/bin/env python3
+# Benchmarks for the StudentDatabase examples
+import argparse
+import asyncio
+import contextlib
+import csv
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import PROFILES
+
+
+def load_example(number):
+    # The examples are named 1.py, 2.py, ... so they can only be loaded by module name
+    return importlib.import_module(str(number))
+
+
+@contextlib.contextmanager
+def quiet():
+    # The examples print a line per operation; keep that out of the timings
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def percentile(values, p):
+    # Nearest-rank percentile of a non-empty list
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def latency_summary(latencies):
+    return {f"p{p}": percentile(latencies, p) for p in (50, 95, 99)}
+
+
+def generate_students(count):
+    for i in range(count):
+        yield (f"Student {i}", 18 + i % 10)
+
+
+FIRST_NAMES = ["John", "Jane", "Alex", "Sarah", "Alice", "Bob", "Maria", "Wei", "Omar", "Priya", "Lucas", "Emma"]
+LAST_NAMES = ["Doe", "Smith", "Johnson", "Brown", "Williams", "Garcia", "Chen", "Khan", "Patel", "Martin", "Nguyen", "Olsen"]
+COURSE_NAMES = ["Mathematics", "Physics", "Chemistry", "Biology", "English", "History", "Art", "Music"]
+
+
+def synthetic_students(count, seed=0):
+    # Deterministic (name, age) rows; about 1% of ages are NULL like 'Sarah Brown' in 4.py
+    rng = random.Random(seed)
+    for _ in range(count):
+        age = None if rng.random() < 0.01 else rng.randint(16, 30)
+        yield (f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", age)
+
+
+def synthetic_courses(student_count, seed=1):
+    # Deterministic (name, student_id) rows, 0-3 distinct courses per student
+    rng = random.Random(seed)
+    for student_id in range(1, student_count + 1):
+        for name in rng.sample(COURSE_NAMES, rng.randint(0, 3)):
+            yield (name, student_id)
+
+
+def open_database(example, db_name, profile=None):
+    database = example.StudentDatabase(db_name)
+    with quiet():
+        database.connect(profile)
+        database.create_tables()
+    return database
+
+
+def bench_bulk_insert(args):
+    example = load_example(3)
+    with tempfile.TemporaryDirectory() as tmp:
+        # Per-row path: one execute and one commit per student
+        database = open_database(example, os.path.join(tmp, "per_row.db"))
+        per_row_count = min(args.rows, args.per_row_limit)
+        start = time.perf_counter()
+        with quiet():
+            for name, age in generate_students(per_row_count):
+                database.insert_student(name, age)
+        per_row_elapsed = time.perf_counter() - start
+        with quiet():
+            database.close_connection()
+
+        # Batched path: executemany, one transaction per chunk
+        database = open_database(example, os.path.join(tmp, "batched.db"))
+        start = time.perf_counter()
+        with quiet():
+            database.insert_students_many(generate_students(args.rows), chunk_size=args.chunk_size)
+        batched_elapsed = time.perf_counter() - start
+        with quiet():
+            database.close_connection()
+
+    per_row_rate = per_row_count / per_row_elapsed
+    batched_rate = args.rows / batched_elapsed
+    print(f"Per-row insert:  {per_row_count} rows in {per_row_elapsed:.2f}s ({per_row_rate:,.0f} rows/sec)")
+    print(f"Batched insert:  {args.rows} rows in {batched_elapsed:.2f}s ({batched_rate:,.0f} rows/sec, chunk size {args.chunk_size})")
+    print(f"Speedup: {batched_rate / per_row_rate:.1f}x")
+
+
+def legacy_export_csv(conn, table_name, csv_file):
+    # export_csv as it was before streaming: fetchall, then write
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT * FROM {table_name}")
+    rows = cursor.fetchall()
+    with open(csv_file, "w", newline="") as file:
+        csv_writer = csv.writer(file)
+        csv_writer.writerow(["name", "age"])
+        csv_writer.writerows(rows)
+
+
+def measure(function, *args, **kwargs):
+    # Wall time of one call, then peak Python heap of a second, traced call
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def bench_export_csv(args):
+    example = load_example(9)
+    with tempfile.TemporaryDirectory() as tmp:
+        database = open_database(example, os.path.join(tmp, "export.db"))
+        with quiet():
+            database.insert_students_many(generate_students(args.rows), chunk_size=10000)
+
+        results = [("fetchall", *measure(legacy_export_csv, database.conn, "students", os.path.join(tmp, "legacy.csv")))]
+        with quiet():
+            results.append(("streaming", *measure(database.export_csv, "students", os.path.join(tmp, "streamed.csv"))))
+            results.append(("streaming+gzip", *measure(database.export_csv, "students", os.path.join(tmp, "streamed.csv.gz"))))
+            database.close_connection()
+
+    for label, elapsed, peak in results:
+        print(f"{label:<15} {args.rows} rows in {elapsed:.2f}s ({args.rows / elapsed:,.0f} rows/sec), "
+              f"peak Python memory {peak / 1024 / 1024:.1f} MiB")
+
+
+async def run_open_loop(handle, requests, interval):
+    # Requests arrive every interval seconds whether or not earlier ones have finished;
+    # latency counts from the scheduled arrival, so a blocked event loop shows up in it
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    latencies = []
+
+    async def request(i, kind):
+        arrival = start + i * interval
+        await asyncio.sleep(arrival - loop.time())
+        await handle(i, kind)
+        latencies.append((kind, loop.time() - arrival))
+
+    await asyncio.gather(*(request(i, kind) for i, kind in enumerate(requests)))
+    return latencies
+
+
+def bench_async_latency(args):
+    example = load_example(12)
+    slow_sql = "SELECT COUNT(*) FROM students WHERE name LIKE '%99%'"
+    fast_sql = "SELECT * FROM students WHERE id = ?"
+    requests = ["slow" if i % args.slow_every == 0 else "fast" for i in range(args.requests)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "async.db")
+        database = open_database(example, db_name)
+        with quiet():
+            database.insert_students_many(generate_students(args.rows), chunk_size=10000)
+            database.conn.execute("PRAGMA journal_mode=WAL")
+
+        async def blocking(i, kind):
+            # The sqlite3 call runs on the event loop thread and stalls every other request
+            if kind == "slow":
+                list(database.iter_query(slow_sql))
+            else:
+                list(database.iter_query(fast_sql, (i % args.rows + 1,)))
+
+        blocking_latencies = asyncio.run(run_open_loop(blocking, requests, args.interval / 1000))
+        with quiet():
+            database.close_connection()
+
+        async def run_async():
+            connections = [example.AsyncStudentDatabase(db_name) for _ in range(args.connections)]
+            with quiet():
+                for connection in connections:
+                    await connection.connect()
+            # The slow scans get their own connection so point lookups are never queued behind them
+            slow_connection, fast_connections = connections[0], connections[1:] or connections
+
+            async def handle(i, kind):
+                if kind == "slow":
+                    await slow_connection.fetch_query(slow_sql)
+                else:
+                    await fast_connections[i % len(fast_connections)].fetch_query(fast_sql, (i % args.rows + 1,))
+
+            latencies = await run_open_loop(handle, requests, args.interval / 1000)
+            with quiet():
+                for connection in connections:
+                    await connection.close_connection()
+            return latencies
+
+        async_latencies = asyncio.run(run_async())
+
+    for label, latencies in (("blocking", blocking_latencies), ("async", async_latencies)):
+        for kind in ("fast", "slow"):
+            values = [latency for request_kind, latency in latencies if request_kind == kind]
+            summary = ", ".join(f"{name} {value * 1000:.2f} ms" for name, value in latency_summary(values).items())
+            print(f"{label:<9} {len(values):>5} {kind} requests: {summary}")
+
+
+# (script, operation, sql, params); params is either a tuple or a function of a random.Random and the size
+SUITE_QUERIES = [
+    ("4.py", "select_all_students", "SELECT * FROM students", ()),
+    ("4.py", "courses_for_student", "SELECT * FROM courses WHERE student_id = ?", lambda rng, size: (rng.randint(1, size),)),
+    ("4.py", "distinct_ages", "SELECT DISTINCT age FROM students", ()),
+    ("4.py", "age_between", "SELECT * FROM students WHERE age BETWEEN 20 AND 25", ()),
+    ("4.py", "name_in_list", "SELECT * FROM students WHERE name IN (?, ?)", ("John Doe", "Jane Smith")),
+    ("4.py", "name_like", "SELECT * FROM students WHERE name LIKE ?", ("%Joh%",)),
+    ("4.py", "age_is_null", "SELECT * FROM students WHERE age IS NULL", ()),
+    ("5.py", "name_glob_suffix", "SELECT * FROM students WHERE name GLOB '*n'", ()),
+    ("6.py", "inner_join", "SELECT students.name, courses.name FROM students INNER JOIN courses ON students.id = courses.student_id", ()),
+    ("6.py", "left_join", "SELECT students.name, courses.name FROM students LEFT JOIN courses ON students.id = courses.student_id", ()),
+    ("6.py", "cross_join_first_100k", "SELECT students.name, courses.name FROM students CROSS JOIN courses LIMIT 100000", ()),
+    ("6.py", "self_join", "SELECT s.name, c.name FROM students s, courses c WHERE s.id = c.student_id", ()),
+    ("6.py", "right_join_simulated", "SELECT students.name, courses.name FROM courses LEFT JOIN students ON students.id = courses.student_id", ()),
+    ("6.py", "full_outer_join_simulated", "SELECT students.name, courses.name FROM students LEFT JOIN courses ON students.id = courses.student_id UNION ALL SELECT NULL, courses.name FROM courses WHERE NOT EXISTS (SELECT 1 FROM students WHERE students.id = courses.student_id)", ()),
+    # RIGHT JOIN and FULL OUTER JOIN are native from SQLite 3.39.0
+    *([("6.py", "right_join_native", "SELECT students.name, courses.name FROM students RIGHT JOIN courses ON students.id = courses.student_id", ()),
+       ("6.py", "full_outer_join_native", "SELECT students.name, courses.name FROM students FULL OUTER JOIN courses ON students.id = courses.student_id", ())]
+      if sqlite3.sqlite_version_info >= (3, 39, 0) else []),
+    ("7.py", "group_by_having", "SELECT courses.name, AVG(students.age) FROM students JOIN courses ON students.id = courses.student_id GROUP BY courses.name HAVING AVG(students.age) > 20", ()),
+    ("7.py", "union", "SELECT name FROM students UNION SELECT name FROM courses", ()),
+    ("7.py", "except", "SELECT name FROM students EXCEPT SELECT students.name FROM students JOIN courses ON students.id = courses.student_id", ()),
+    ("7.py", "intersect", "SELECT students.name FROM students JOIN courses ON students.id = courses.student_id WHERE courses.name = 'Mathematics' INTERSECT SELECT students.name FROM students JOIN courses ON students.id = courses.student_id WHERE courses.name = 'Physics'", ()),
+    ("7.py", "not_enrolled_anti_join", "SELECT id, name FROM students WHERE NOT EXISTS (SELECT 1 FROM courses WHERE courses.student_id = students.id)", ()),
+    ("7.py", "enrolled_in_all_semi_join", "SELECT id, name FROM students WHERE id IN (SELECT student_id FROM courses WHERE name = ?) AND id IN (SELECT student_id FROM courses WHERE name = ?)", ("Mathematics", "Physics")),
+    ("7.py", "subquery", "SELECT name FROM students WHERE age < (SELECT AVG(age) FROM students)", ()),
+    ("7.py", "exists", "SELECT name FROM students WHERE EXISTS (SELECT 1 FROM courses WHERE students.id = courses.student_id)", ()),
+    ("7.py", "case", "SELECT courses.name, CASE WHEN students.age < 18 THEN 'Under 18' WHEN students.age >= 18 AND students.age < 25 THEN '18-24' ELSE '25+' END AS age_group FROM students JOIN courses ON students.id = courses.student_id", ()),
+    ("8.py", "avg_age", "SELECT AVG(age) FROM students", ()),
+    ("8.py", "count_students", "SELECT COUNT(*) FROM students", ()),
+    ("8.py", "max_age", "SELECT MAX(age) FROM students", ()),
+    ("8.py", "min_age", "SELECT MIN(age) FROM students", ()),
+    ("8.py", "sum_age", "SELECT SUM(age) FROM students", ()),
+    ("8.py", "age_stats_single_pass", "SELECT AVG(age), COUNT(*), MAX(age), MIN(age), SUM(age) FROM students", ()),
+]
+
+
+def time_runs(function, runs):
+    # Latency of each run; function returns the number of rows it produced
+    latencies = []
+    rows = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        rows = function()
+        latencies.append(time.perf_counter() - start)
+    return latencies, rows
+
+
+def suite_result(size, script, operation, latencies, rows):
+    summary = latency_summary(latencies)
+    return {
+        "size": size,
+        "script": script,
+        "operation": operation,
+        "runs": len(latencies),
+        "rows": rows,
+        **{f"{name}_ms": value * 1000 for name, value in summary.items()},
+        "rows_per_sec": rows / summary["p50"] if summary["p50"] else None,
+    }
+
+
+def print_result(result):
+    print(f"{result['size']:>10} {result['script']:<5} {result['operation']:<24} p50 {result['p50_ms']:10.3f} ms  "
+          f"p99 {result['p99_ms']:10.3f} ms  {result['rows']} rows")
+
+
+def run_suite_size(size, args, selected):
+    example = load_example(9)
+    results = []
+
+    def record(script, operation, function, runs):
+        if selected(operation):
+            with quiet():
+                latencies, rows = time_runs(function, runs)
+            results.append(suite_result(size, script, operation, latencies, rows))
+            print_result(results[-1])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "suite.db")
+        database = open_database(example, db_name)
+
+        # Inserts (1.py - 10.py): bulk loads build the data set, per-row inserts run at the end
+        def bulk_students():
+            database.insert_students_many(synthetic_students(size, args.seed), chunk_size=10000)
+            return size
+
+        def bulk_courses():
+            database.insert_courses_many(synthetic_courses(size, args.seed + 1), chunk_size=10000)
+            return database.conn.execute("SELECT COUNT(*) FROM courses").fetchone()[0]
+
+        with quiet():
+            latencies, rows = time_runs(bulk_students, 1)
+        results.append(suite_result(size, "1.py", "insert_students_many", latencies, rows))
+        print_result(results[-1])
+        with quiet():
+            latencies, rows = time_runs(bulk_courses, 1)
+        results.append(suite_result(size, "3.py", "insert_courses_many", latencies, rows))
+        print_result(results[-1])
+        database.conn.execute("ANALYZE")
+
+        # Queries (4.py - 8.py)
+        rng = random.Random(args.seed)
+        for script, operation, sql, params in SUITE_QUERIES:
+            if callable(params):
+                # Point lookups are cheap, so they get many runs with varying parameters
+                record(script, operation, lambda: sum(1 for _ in database.iter_query(sql, params(rng, size))), args.lookups)
+            else:
+                record(script, operation, lambda: sum(1 for _ in database.iter_query(sql, params)), args.repeat)
+
+        # Tools (9.py)
+        csv_file = os.path.join(tmp, "students.csv")
+        record("9.py", "export_csv", lambda: database.export_csv("students", csv_file), args.repeat)
+        record("9.py", "dump_database", lambda: (database.dump_database(os.path.join(tmp, "dump.sql")), size)[1], 1)
+
+        def per_row_insert():
+            for name, age in synthetic_students(args.per_row, args.seed + 2):
+                database.insert_student(name, age)
+            return args.per_row
+
+        record("1.py", "insert_student_per_row", per_row_insert, 1)
+        with quiet():
+            database.close_connection()
+
+        if selected("import_csv") and os.path.exists(csv_file):
+            imported = open_database(example, os.path.join(tmp, "imported.db"))
+            record("9.py", "import_csv", lambda: imported.import_csv("students", csv_file, columns=["name", "age"]), 1)
+            with quiet():
+                imported.close_connection()
+
+    return results
+
+
+def compare_results(results, baseline_file, tolerance):
+    # Operations whose p50 grew by more than tolerance (a fraction) against a previous run
+    with open(baseline_file) as file:
+        baseline = {(r["size"], r["script"], r["operation"]): r for r in json.load(file)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["size"], result["script"], result["operation"]))
+        if previous and result["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+            regressions.append((result, previous))
+    return regressions
+
+
+def bench_suite(args):
+    selected = (lambda operation: operation in args.only) if args.only else (lambda operation: True)
+    results = []
+    for size in args.sizes:
+        results.extend(run_suite_size(size, args, selected))
+
+    report = {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "seed": args.seed,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        regressions = compare_results(results, args.baseline, args.tolerance)
+        for result, previous in regressions:
+            print(f"Regression: {result['script']} {result['operation']} at {result['size']} rows: "
+                  f"p50 {previous['p50_ms']:.3f} ms -> {result['p50_ms']:.3f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+def bench_outer_join(args):
+    example = load_example(6)
+    with tempfile.TemporaryDirectory() as tmp:
+        database = open_database(example, os.path.join(tmp, "joins.db"))
+        with quiet():
+            database.insert_students_many(synthetic_students(args.rows, args.seed), chunk_size=10000)
+            database.insert_courses_many(synthetic_courses(args.rows, args.seed + 1), chunk_size=10000)
+            # Some courses whose student is missing, so the right-hand side has unmatched rows too
+            database.insert_courses_many(((name, None) for name, _ in synthetic_courses(args.rows // 100, args.seed + 2)))
+        database.conn.execute("ANALYZE")
+
+        variants = [("UNION + NOT IN (previous)", lambda: database.iter_query(
+            "SELECT students.name, courses.name FROM students LEFT JOIN courses ON students.id = courses.student_id "
+            "UNION SELECT students.name, NULL FROM students WHERE students.id NOT IN (SELECT student_id FROM courses)")),
+                    ("UNION ALL + NOT EXISTS", lambda: database.full_outer_join(native=False)),
+                    ("swapped LEFT JOIN", lambda: database.right_join(native=False))]
+        if example.NATIVE_OUTER_JOINS:
+            variants.insert(2, ("native FULL OUTER JOIN", lambda: database.full_outer_join(native=True)))
+            variants.append(("native RIGHT JOIN", lambda: database.right_join(native=True)))
+
+        for label, query in variants:
+            latencies, rows = time_runs(lambda: sum(1 for _ in query()), args.repeat)
+            print(f"{label:<26} {rows} rows: p50 {percentile(latencies, 50) * 1000:.1f} ms")
+        with quiet():
+            database.close_connection()
+
+
+def bench_fts_search(args):
+    example = load_example(4)
+    like_sql = "SELECT id, name, age FROM students WHERE name LIKE ?"
+    with tempfile.TemporaryDirectory() as tmp:
+        # Insert cost of keeping the search index in sync, against the same tables without it
+        tokenizer = example.FTS_TOKENIZER
+        timings = {}
+        for label in ("without search index", "with search index"):
+            example.FTS_TOKENIZER = tokenizer if label == "with search index" else None
+            database = open_database(example, os.path.join(tmp, f"{label.split()[0]}.db"))
+            start = time.perf_counter()
+            with quiet():
+                database.insert_students_many(synthetic_students(args.rows, args.seed), chunk_size=10000)
+            timings[label] = time.perf_counter() - start
+            if label == "without search index":
+                with quiet():
+                    database.close_connection()
+        example.FTS_TOKENIZER = tokenizer
+        for label, elapsed in timings.items():
+            print(f"Insert {args.rows} students {label}: {elapsed:.2f}s ({args.rows / elapsed:,.0f} rows/sec)")
+
+        print(f"Search index tokenizer: {tokenizer}")
+        for term in args.terms:
+            like_rows = {row for row in database.iter_query(like_sql, (f"%{term}%",))}
+            search_rows = set(database.search_students(term))
+            like_latencies, rows = time_runs(lambda: sum(1 for _ in database.iter_query(like_sql, (f"%{term}%",))), args.repeat)
+            search_latencies, _ = time_runs(lambda: sum(1 for _ in database.search_students(term)), args.repeat)
+            unranked_latencies, _ = time_runs(lambda: sum(1 for _ in database.search_students(term, ranked=False)), args.repeat)
+            first_latencies, _ = time_runs(lambda: sum(1 for _ in database.search_students(term, limit=10)), args.repeat)
+            print(f"{term!r:<14} {rows:>8} rows: LIKE scan p50 {percentile(like_latencies, 50) * 1000:.1f} ms, "
+                  f"search_students p50 {percentile(search_latencies, 50) * 1000:.1f} ms "
+                  f"(unranked {percentile(unranked_latencies, 50) * 1000:.1f} ms), "
+                  f"top 10 p50 {percentile(first_latencies, 50) * 1000:.1f} ms"
+                  f"{'' if like_rows == search_rows else ' (results differ)'}")
+        with quiet():
+            database.close_connection()
+
+
+def bench_in_list(args):
+    example = load_example(4)
+    with tempfile.TemporaryDirectory() as tmp:
+        database = open_database(example, os.path.join(tmp, "in_list.db"))
+        with quiet():
+            database.insert_students_many(synthetic_students(args.rows, args.seed), chunk_size=10000)
+        database.conn.execute("ANALYZE")
+        rng = random.Random(args.seed)
+
+        def formatted(values):
+            # The previous approach: one placeholder per value, a new SQL text for every list length
+            sql = "SELECT * FROM students WHERE id IN ({})".format(",".join(["?"] * len(values)))
+            return sum(1 for _ in database.iter_query(sql, values))
+
+        for size in args.sizes:
+            # List lengths vary a little, as real filters do, so every formatted query is new SQL
+            lists = [rng.sample(range(1, args.rows + 1), rng.randint(max(1, size - size // 10), size))
+                     for _ in range(args.repeat)]
+            results = []
+            for label, function in (("formatted IN", formatted),
+                                    ("filter_students_in", lambda values: sum(1 for _ in database.filter_students_in("id", values)))):
+                try:
+                    runs = iter(lists)
+                    latencies, _ = time_runs(lambda: function(next(runs)), len(lists))
+                    results.append(f"{label} p50 {percentile(latencies, 50) * 1000:.2f} ms")
+                except sqlite3.OperationalError as e:
+                    results.append(f"{label} fails ({e})")
+            print(f"{size:>7} ids: {', '.join(results)}")
+        with quiet():
+            database.close_connection()
+
+
+def bench_result_cache(args):
+    example = load_example(7)
+    queries = [("SELECT * FROM students WHERE age = ?", lambda rng: (rng.randint(16, 30),)),
+               ("SELECT * FROM courses WHERE student_id = ?", lambda rng: (rng.randint(1, 100),)),
+               ("SELECT AVG(age), COUNT(*), MAX(age), MIN(age), SUM(age) FROM students", lambda rng: ()),
+               ("SELECT courses.name, AVG(students.age) FROM students JOIN courses ON students.id = courses.student_id "
+                "GROUP BY courses.name HAVING AVG(students.age) > ?", lambda rng: (20,))]
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in ("uncached", "cached"):
+            database = open_database(example, os.path.join(tmp, f"{label}.db"))
+            with quiet():
+                database.insert_students_many(synthetic_students(args.rows, args.seed), chunk_size=10000)
+                database.insert_courses_many(synthetic_courses(args.rows, args.seed + 1), chunk_size=10000)
+            if label == "cached":
+                database.enable_result_cache()
+            rng = random.Random(args.seed)
+            start = time.perf_counter()
+            with quiet():
+                for _ in range(args.operations):
+                    if rng.random() < args.write_ratio:
+                        database.update_student(rng.randint(1, args.rows), "Renamed Student")
+                    else:
+                        sql, params = rng.choice(queries)
+                        sum(1 for _ in database.iter_query(sql, params(rng)))
+            elapsed = time.perf_counter() - start
+            stats = database.result_cache_stats()
+            print(f"{label:<9} {args.operations} operations ({args.write_ratio:.0%} writes) in {elapsed:.2f}s "
+                  f"({args.operations / elapsed:,.0f} ops/sec)"
+                  + (f", hit rate {stats['hit_rate']:.0%}, {stats['invalidations']} invalidations" if stats else ""))
+            with quiet():
+                database.close_connection()
+
+
+def bench_columnar(args):
+    example = load_example(8)
+    sql = "SELECT id, age FROM students WHERE age IS NOT NULL"
+    with tempfile.TemporaryDirectory() as tmp:
+        database = open_database(example, os.path.join(tmp, "columnar.db"))
+        with quiet():
+            database.insert_students_many(synthetic_students(args.rows, args.seed), chunk_size=10000)
+
+        def tuples():
+            # Row tuples, then the mean and a 5-year histogram in plain Python
+            rows = database.conn.execute(sql).fetchall()
+            ages = [age for _, age in rows]
+            histogram = {}
+            for age in ages:
+                histogram[age // 5 * 5] = histogram.get(age // 5 * 5, 0) + 1
+            return sum(ages) / len(ages), histogram
+
+        def columns():
+            ages = database.fetch_columns(sql, dtypes=["int64", "int64"])["age"]
+            if example.numpy is not None:
+                bins, counts = example.numpy.unique(ages // 5 * 5, return_counts=True)
+                return ages.mean(), dict(zip(bins.tolist(), counts.tolist()))
+            histogram = {}
+            for age in ages:
+                histogram[age // 5 * 5] = histogram.get(age // 5 * 5, 0) + 1
+            return sum(ages) / len(ages), histogram
+
+        label = "NumPy arrays" if example.numpy is not None else "array.array"
+        for name, function in (("tuples", tuples), (f"fetch_columns ({label})", columns)):
+            elapsed, peak = measure(function)
+            print(f"{name:<30} {args.rows} rows in {elapsed:.2f}s, peak Python memory {peak / 1024 / 1024:.1f} MiB")
+        with quiet():
+            database.close_connection()
+
+
+def bench_row_memory(args):
+    # Time to fetch every student and the Python memory the fetched rows keep alive, per row type
+    example = load_example(3)
+
+    class SlotsStudent:
+        __slots__ = ("id", "name", "age")
+
+        def __init__(self, id, name, age):
+            self.id, self.name, self.age = id, name, age
+
+    factories = [("tuples", None),
+                 ("records=True", example.record_factory((example.Student, example.Course))),
+                 ("__slots__ class", lambda cursor, row: SlotsStudent(*row)),
+                 ("sqlite3.Row", sqlite3.Row),
+                 ("dicts", lambda cursor, row: {column[0]: value for column, value in zip(cursor.description, row)})]
+    with tempfile.TemporaryDirectory() as tmp:
+        database = open_database(example, os.path.join(tmp, "rows.db"))
+        with quiet():
+            database.insert_students_many(synthetic_students(args.rows, args.seed), chunk_size=10000)
+        for name, factory in factories:
+            database.conn.row_factory = factory
+            start = time.perf_counter()
+            rows = database.conn.execute("SELECT id, name, age FROM students").fetchall()
+            elapsed = time.perf_counter() - start
+            del rows
+            tracemalloc.start()
+            rows = database.conn.execute("SELECT id, name, age FROM students").fetchall()
+            retained = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del rows
+            print(f"{name:<16} {args.rows} rows in {elapsed:.2f}s, {retained / 1024 / 1024:.1f} MiB retained "
+                  f"({retained / args.rows:.0f} bytes/row)")
+        database.conn.row_factory = None
+        with quiet():
+            database.close_connection()
+
+
+def bench_profiles(args):
+    # Insert and query throughput of 3.py under each connect() profile; "default" is plain sqlite3.connect
+    example = load_example(3)
+    profiles = args.profiles or ["default", *PROFILES]
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in profiles:
+            db_name = os.path.join(tmp, f"{profile}.db")
+            database = open_database(example, db_name, None if profile == "default" else profile)
+            journal_mode = database.settings["journal_mode"]
+            start = time.perf_counter()
+            with quiet():
+                for name, age in synthetic_students(args.per_row, args.seed):
+                    database.insert_student(name, age)
+            per_row = args.per_row / (time.perf_counter() - start)
+            start = time.perf_counter()
+            with quiet():
+                database.insert_students_many(synthetic_students(args.rows, args.seed), chunk_size=10000)
+            batched = args.rows / (time.perf_counter() - start)
+            with quiet():
+                database.close_connection()
+
+            # Reopen so the queries start from a cold page cache
+            database = open_database(example, db_name, None if profile == "default" else profile)
+            rng = random.Random(args.seed)
+            total = args.per_row + args.rows
+            start = time.perf_counter()
+            for _ in range(args.lookups):
+                database.conn.execute("SELECT * FROM students WHERE id = ?", (rng.randint(1, total),)).fetchall()
+            lookups = args.lookups / (time.perf_counter() - start)
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                database.conn.execute("SELECT COUNT(*), AVG(age) FROM students WHERE name LIKE '%a%'").fetchone()
+            scan = (time.perf_counter() - start) / args.repeat
+            with quiet():
+                database.close_connection()
+            print(f"{profile:<12} ({journal_mode:<6}) per-row insert {per_row:>9,.0f} rows/sec, "
+                  f"batched insert {batched:>10,.0f} rows/sec, lookups {lookups:>8,.0f}/sec, scan {scan * 1000:.1f} ms")
+
+
+def bench_attachments(args):
+    # Storing and saving one large attachment (9.py): whole values through execute vs BLOB streaming
+    example = load_example(9)
+    size = args.size * 1024 * 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "attachment.bin")
+        with open(source, "wb") as file:
+            for _ in range(args.size):
+                file.write(os.urandom(1024 * 1024))
+        database = open_database(example, os.path.join(tmp, "attachments.db"))
+        with quiet():
+            database.insert_student("John Doe", 20)
+
+        def whole_value():
+            with open(source, "rb") as file:
+                data = file.read()
+            cursor = database.conn.execute("INSERT INTO attachments (student_id, name, size, data) VALUES (1, ?, ?, ?)",
+                                           ("attachment.bin", len(data), data))
+            database.conn.commit()
+            data = database.conn.execute("SELECT data FROM attachments WHERE id = ?", (cursor.lastrowid,)).fetchone()[0]
+            with open(os.path.join(tmp, "whole_value.bin"), "wb") as file:
+                file.write(data)
+
+        def streamed():
+            with quiet():
+                attachment_id = database.add_attachment(1, source, chunk_size=args.chunk_size)
+                database.save_attachment(attachment_id, os.path.join(tmp, "streamed.bin"), chunk_size=args.chunk_size)
+
+        for name, function in (("execute (whole value)", whole_value), ("blobopen (streamed)", streamed)):
+            elapsed, peak = measure(function)
+            print(f"{name:<22} {args.size} MiB stored and saved in {elapsed:.2f}s, "
+                  f"peak Python memory {peak / 1024 / 1024:.1f} MiB")
+        with quiet():
+            database.close_connection()
+
+
+def rss_bytes():
+    # Resident set size of this process; SQLite's page cache lives outside the Python heap,
+    # so tracemalloc cannot see it
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def shared_memory_case(mode, threads, rows, duration, writer):
+    # Runs in a fresh process so the RSS growth belongs to this case alone.
+    # mode is private (a copy per thread), shared (read_uncommitted readers) or isolated
+    # (shared, read_uncommitted=False)
+    example = load_example(2)
+    baseline = rss_bytes()
+    with quiet():
+        database = example.StudentDatabase(shared_name=None if mode == "private" else "benchmark",
+                                           read_uncommitted=mode == "shared")
+        database.connect()
+        database.create_table()
+        database.insert_students_many(synthetic_students(rows), chunk_size=10000)
+
+    ready = threading.Barrier(threads + 1)
+    counts = [0] * threads
+    locked = [0] * threads
+    writes = [0]
+    memory = []
+    deadline = [None]
+
+    def worker(index):
+        if mode == "private":
+            # Every thread works on its own full copy of the database
+            private = sqlite3.connect(":memory:")
+            database.conn.backup(private)
+
+            def read(sql, params):
+                return iter(private.execute(sql, params))
+        else:
+            read = database.iter_query
+        rng = random.Random(index)
+        ready.wait()
+        ready.wait()  # Memory is measured between the two barriers
+        while time.perf_counter() < deadline[0]:
+            start = rng.randint(1, rows - 100)
+            try:
+                counts[index] += sum(1 for _ in read("SELECT * FROM students WHERE id = ?", (start,)))
+                for _ in read("SELECT COUNT(*), AVG(age) FROM students WHERE id BETWEEN ? AND ?", (start, start + 100)):
+                    pass
+                counts[index] += 1
+            except sqlite3.OperationalError:
+                # 'database table is locked': an isolated reader met an open write transaction
+                locked[index] += 1
+        if mode == "private":
+            private.close()
+        else:
+            database.release_thread_connection()
+
+    def write():
+        # 100-row transactions on the shared database, as fast as they go
+        students = synthetic_students(10 ** 9, seed=1)
+        while time.perf_counter() < deadline[0]:
+            with quiet():
+                # None when the insert failed, e.g. on a table an isolated reader had locked
+                if database.insert_students_many(itertools.islice(students, 100), chunk_size=100):
+                    writes[0] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    ready.wait()
+    memory.append(rss_bytes() - baseline)
+    deadline[0] = time.perf_counter() + duration
+    if writer:
+        workers.append(threading.Thread(target=write))
+        workers[-1].start()
+    ready.wait()
+    for thread in workers:
+        thread.join()
+    with quiet():
+        database.close_connection()
+    return sum(counts) / duration, sum(locked) / duration, writes[0] / duration, memory[0]
+
+
+def bench_shared_memory(args):
+    # Each case runs in its own process: RSS is not given back to the OS reliably between cases.
+    # Without --writer the shared and isolated readers behave the same, so isolated only runs with it
+    context = multiprocessing.get_context("spawn")
+    modes = ("private", "shared", "isolated") if args.writer else ("private", "shared")
+    for threads in args.threads:
+        for mode in modes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                qps, locked, writes, memory = executor.submit(
+                    shared_memory_case, mode, threads, args.rows, args.duration, args.writer).result()
+            line = f"{mode:<8} {threads:>2} threads: {qps:>10,.0f} queries/sec, memory {memory / 1024 / 1024:.1f} MiB"
+            if args.writer:
+                line += f", {locked:>8,.0f} locked reads/sec, {writes:>6,.0f} writes/sec"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="StudentDatabase benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    bulk_insert = subparsers.add_parser("bulk_insert", help="per-row insert_student vs insert_students_many")
+    bulk_insert.add_argument("--rows", type=int, default=100000)
+    bulk_insert.add_argument("--chunk-size", type=int, default=1000)
+    bulk_insert.add_argument("--per-row-limit", type=int, default=2000,
+                             help="cap on rows for the per-row path, which commits once per row")
+    bulk_insert.set_defaults(func=bench_bulk_insert)
+
+    export_csv = subparsers.add_parser("export_csv", help="fetchall export vs streaming export_csv")
+    export_csv.add_argument("--rows", type=int, default=1000000)
+    export_csv.set_defaults(func=bench_export_csv)
+
+    async_latency = subparsers.add_parser("async_latency", help="request latency of blocking vs AsyncStudentDatabase calls")
+    async_latency.add_argument("--rows", type=int, default=200000)
+    async_latency.add_argument("--requests", type=int, default=500)
+    async_latency.add_argument("--interval", type=float, default=2.0, help="milliseconds between request arrivals")
+    async_latency.add_argument("--slow-every", type=int, default=25, help="every Nth request is a full-table scan")
+    async_latency.add_argument("--connections", type=int, default=4)
+    async_latency.set_defaults(func=bench_async_latency)
+
+    outer_join = subparsers.add_parser("outer_join", help="simulated vs native FULL OUTER JOIN from 6.py")
+    outer_join.add_argument("--rows", type=int, default=1000000)
+    outer_join.add_argument("--repeat", type=int, default=3)
+    outer_join.add_argument("--seed", type=int, default=0)
+    outer_join.set_defaults(func=bench_outer_join)
+
+    fts_search = subparsers.add_parser("fts_search", help="LIKE '%%term%%' scan vs FTS5 search_students from 4.py")
+    fts_search.add_argument("--rows", type=int, default=1000000)
+    fts_search.add_argument("--terms", type=lambda value: value.split(","), default=["Joh", "Priya Khan", "Zoe"],
+                            help="comma-separated search terms")
+    fts_search.add_argument("--repeat", type=int, default=5)
+    fts_search.add_argument("--seed", type=int, default=0)
+    fts_search.set_defaults(func=bench_fts_search)
+
+    in_list = subparsers.add_parser("in_list", help="formatted IN (...) lists vs filter_students_in from 4.py")
+    in_list.add_argument("--rows", type=int, default=200000)
+    in_list.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")],
+                         default=[10, 100, 1000, 10000, 50000], help="comma-separated list lengths")
+    in_list.add_argument("--repeat", type=int, default=20)
+    in_list.add_argument("--seed", type=int, default=0)
+    in_list.set_defaults(func=bench_in_list)
+
+    result_cache = subparsers.add_parser("result_cache", help="repeated reads with and without the 7.py result cache")
+    result_cache.add_argument("--rows", type=int, default=100000)
+    result_cache.add_argument("--operations", type=int, default=2000)
+    result_cache.add_argument("--write-ratio", type=float, default=0.01)
+    result_cache.add_argument("--seed", type=int, default=0)
+    result_cache.set_defaults(func=bench_result_cache)
+
+    columnar = subparsers.add_parser("columnar", help="row tuples vs fetch_columns for the 8.py age statistics")
+    columnar.add_argument("--rows", type=int, default=1000000)
+    columnar.add_argument("--seed", type=int, default=0)
+    columnar.set_defaults(func=bench_columnar)
+
+    row_memory = subparsers.add_parser("row_memory", help="fetch time and memory of tuples vs records=True and other row types")
+    row_memory.add_argument("--rows", type=int, default=1000000)
+    row_memory.add_argument("--seed", type=int, default=0)
+    row_memory.set_defaults(func=bench_row_memory)
+
+    profiles = subparsers.add_parser("profiles", help="insert and query throughput of each connect() profile (3.py)")
+    profiles.add_argument("--rows", type=int, default=1000000)
+    profiles.add_argument("--per-row", type=int, default=2000, help="students inserted one by one, one commit each")
+    profiles.add_argument("--lookups", type=int, default=20000)
+    profiles.add_argument("--repeat", type=int, default=5, help="runs of the full-table scan")
+    profiles.add_argument("--seed", type=int, default=0)
+    profiles.add_argument("--profiles", nargs="*", help="profiles to run (default: plain connect() and every preset)")
+    profiles.set_defaults(func=bench_profiles)
+
+    attachments = subparsers.add_parser("attachments", help="whole-value execute vs streamed BLOB attachments (9.py)")
+    attachments.add_argument("--size", type=int, default=50, help="attachment size in MiB")
+    attachments.add_argument("--chunk-size", type=int, default=1024 * 1024)
+    attachments.set_defaults(func=bench_attachments)
+
+    shared_memory = subparsers.add_parser("shared_memory",
+                                          help="read throughput and memory of a shared-cache vs per-thread in-memory database (2.py)")
+    shared_memory.add_argument("--rows", type=int, default=500000)
+    shared_memory.add_argument("--threads", type=lambda value: [int(count) for count in value.split(",")], default=[1, 2, 4, 8],
+                               help="comma-separated thread counts")
+    shared_memory.add_argument("--duration", type=float, default=2.0, help="seconds of reads per case")
+    shared_memory.add_argument("--writer", action="store_true",
+                               help="add a thread writing 100-row transactions, and isolated (read_uncommitted=False) readers")
+    shared_memory.set_defaults(func=bench_shared_memory)
+
+    suite = subparsers.add_parser("suite", help="every scenario from 1.py - 10.py at several data sizes")
+    suite.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")], default=[10000, 1000000],
+                       help="comma-separated student counts, e.g. 10000,1000000,10000000")
+    suite.add_argument("--repeat", type=int, default=5, help="runs per scan-type operation")
+    suite.add_argument("--lookups", type=int, default=1000, help="runs per point lookup")
+    suite.add_argument("--per-row", type=int, default=200, help="students inserted one by one")
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--only", nargs="*", help="operation names to run (the bulk inserts always run)")
+    suite.add_argument("--output", default="benchmark_results.json")
+    suite.add_argument("--baseline", help="previous results file to compare against")
+    suite.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 slowdown against the baseline")
+    suite.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
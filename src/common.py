@@ -0,0 +1,129 @@
+# Helpers shared by the numbered examples; each script imports what it uses from here
+import collections
+import contextlib
+import itertools
+import re
+import sqlite3
+
+
+# Pragma presets for connect(profile=...). A negative cache_size is in KiB, mmap_size is in bytes,
+# busy_timeout in milliseconds and wal_autocheckpoint in pages
+PROFILES = {
+    # Every commit is on disk before it returns
+    "durable": {"journal_mode": "WAL", "synchronous": "FULL", "cache_size": -8192, "mmap_size": 0,
+                "temp_store": "DEFAULT", "busy_timeout": 5000, "wal_autocheckpoint": 1000},
+    # A power loss can lose the last commits, but never corrupts the database
+    "balanced": {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -32768, "mmap_size": 64 * 1024 ** 2,
+                 "temp_store": "MEMORY", "busy_timeout": 5000, "wal_autocheckpoint": 1000},
+    # For data that can be loaded again: a crash or power loss during the load can corrupt the file
+    "bulk_load": {"journal_mode": "MEMORY", "synchronous": "OFF", "cache_size": -262144, "mmap_size": 0,
+                  "temp_store": "MEMORY", "busy_timeout": 5000, "wal_autocheckpoint": 0},
+    # Writes as in "balanced", reads from a large page cache and a memory-mapped file
+    "read_mostly": {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -131072, "mmap_size": 1024 ** 3,
+                    "temp_store": "MEMORY", "busy_timeout": 5000, "wal_autocheckpoint": 1000},
+}
+# Settings that PRAGMA reads back as numbers
+PRAGMA_NAMES = {"synchronous": ("OFF", "NORMAL", "FULL", "EXTRA"), "temp_store": ("DEFAULT", "FILE", "MEMORY")}
+
+
+def apply_profile(conn, profile=None, **overrides):
+    # Applies a PROFILES preset and per-setting overrides (None keeps the current value), then
+    # returns the settings SQLite actually uses. They can differ from the request: an in-memory
+    # database has no WAL, and mmap_size is capped by SQLITE_MAX_MMAP_SIZE.
+    if profile is not None and profile not in PROFILES:
+        raise ValueError(f"profile must be one of {', '.join(PROFILES)}")
+    unknown = set(overrides) - set(PROFILES["balanced"])
+    if unknown:
+        raise ValueError(f"unknown connection settings: {', '.join(sorted(unknown))}")
+    settings = dict(PROFILES.get(profile, {}), **overrides)
+    for name, value in settings.items():
+        if value is None:
+            continue
+        # PRAGMA takes no parameters, so only plain numbers and keywords are let through
+        if not str(value).lstrip("-").isalnum():
+            raise ValueError(f"invalid value for {name}: {value!r}")
+        conn.execute(f"PRAGMA {name}={value}")
+    return connection_settings(conn)
+
+
+def connection_settings(conn):
+    # The current value of every setting a profile controls; None where SQLite has no value
+    # (an in-memory database has no mmap_size)
+    settings = {}
+    for name in PROFILES["balanced"]:
+        row = conn.execute(f"PRAGMA {name}").fetchone()
+        value = row[0] if row else None
+        settings[name] = PRAGMA_NAMES[name][value] if name in PRAGMA_NAMES and value is not None else value
+    return settings
+
+
+def query_plan(conn, sql, params=()):
+    # The detail column of EXPLAIN QUERY PLAN, e.g. 'SEARCH courses USING COVERING INDEX ...' or 'SCAN students'
+    cursor = conn.cursor()
+    return [row[3] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def iter_rows(conn, sql, params=(), arraysize=1000):
+    # Yield rows lazily, fetching arraysize rows from SQLite at a time
+    cursor = conn.cursor()
+    cursor.arraysize = arraysize
+    cursor.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            break
+        yield from rows
+
+
+def insert_many(conn, sql, rows, chunk_size, lock=None, on_commit=None):
+    # Insert rows from any iterable in chunks, one explicit transaction per chunk. lock is held per
+    # chunk, and on_commit(count) is called under it after each committed chunk.
+    # Returns (first_id, last_id), (None, None) without rows. The range assumes the rows of a chunk
+    # got consecutive rowids: true for a plain INSERT that leaves the rowid to SQLite, since no other
+    # connection can write during the chunk's transaction, but not with explicit ids, OR IGNORE or
+    # triggers that insert into the same table.
+    if conn.in_transaction:
+        conn.commit()
+    cursor = conn.cursor()
+    rows = iter(rows)
+    first_id = last_id = None
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        with lock or contextlib.nullcontext():
+            cursor.execute("BEGIN")
+            try:
+                cursor.executemany(sql, chunk)
+                cursor.execute("COMMIT")
+            except sqlite3.Error:
+                cursor.execute("ROLLBACK")
+                raise
+            if on_commit is not None:
+                on_commit(len(chunk))
+            last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+        if first_id is None:
+            first_id = last_id - len(chunk) + 1
+    return first_id, last_id
+
+
+def record_factory(record_types=()):
+    # row_factory giving each row a field per column. The rows have no per-instance __dict__, so
+    # they stay about the size of a plain tuple. The type is picked once per result set, not per
+    # row: one of record_types (namedtuple classes) when the columns match, otherwise a namedtuple
+    # generated for the column names and reused afterwards.
+    types = {record_type._fields: record_type for record_type in record_types}
+    last = (None, None)  # cursor.description of the latest result set and its type
+
+    def factory(cursor, row):
+        nonlocal last
+        description, record_type = last
+        if cursor.description is not description:
+            description = cursor.description
+            fields = tuple(re.sub(r"\W", "_", column[0]) for column in description)
+            record_type = types.get(fields)
+            if record_type is None:
+                record_type = types[fields] = collections.namedtuple("Record", fields, rename=True)
+            last = description, record_type
+        return tuple.__new__(record_type, row)
+    return factory
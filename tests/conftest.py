@@ -0,0 +1,33 @@
+# The examples are named 1.py, 2.py, ... so they are loaded by module name from src/
+import contextlib
+import importlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+def load_example(number):
+    return importlib.import_module(str(number))
+
+
+@pytest.fixture
+def open_database(tmp_path):
+    # open_database(number, **kwargs) -> a connected StudentDatabase with its tables, in tmp_path
+    databases = []
+
+    def open_database(number, **kwargs):
+        database = load_example(number).StudentDatabase(str(tmp_path / f"{number}.db"), **kwargs)
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.connect()
+            database.create_tables()
+        databases.append(database)
+        return database
+
+    yield open_database
+    with contextlib.redirect_stdout(io.StringIO()):
+        for database in databases:
+            database.close_connection()
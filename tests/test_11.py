@@ -0,0 +1,102 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from conftest import load_example
+
+
+def failing_open():
+    raise sqlite3.OperationalError("unable to open database file")
+
+
+def test_a_failed_connect_does_not_use_up_the_pool(tmp_path, monkeypatch):
+    pool = load_example(11).ConnectionPool(str(tmp_path / "11.db"), max_size=2, timeout=0.1)
+    first = pool.checkout()
+    open_connection = pool._open
+    monkeypatch.setattr(pool, "_open", failing_open)
+    for _ in range(3):
+        with pytest.raises(sqlite3.OperationalError, match="unable to open"):
+            pool.checkout()
+    assert pool.stats()["size"] == 1
+
+    monkeypatch.setattr(pool, "_open", open_connection)
+    second = pool.checkout()
+    assert pool.stats()["size"] == 2
+    pool.checkin(first)
+    pool.checkin(second)
+    pool.close()
+
+
+def test_a_failed_replacement_gives_its_slot_back(tmp_path, monkeypatch):
+    pool = load_example(11).ConnectionPool(str(tmp_path / "11.db"), max_size=1, timeout=0.1)
+    pool.checkin(pool.checkout())
+    pool._idle[0].close()  # No longer passes the health check
+    monkeypatch.setattr(pool, "_open", failing_open)
+    with pytest.raises(sqlite3.OperationalError, match="unable to open"):
+        pool.checkout()
+    assert pool.stats()["size"] == 0
+
+    monkeypatch.undo()
+    pool.checkin(pool.checkout())
+    assert pool.stats()["size"] == 1
+    pool.close()
+
+
+def test_a_waiting_checkout_gets_a_slot_given_back_by_a_failed_connect(tmp_path, monkeypatch):
+    pool = load_example(11).ConnectionPool(str(tmp_path / "11.db"), max_size=2, timeout=5)
+    first = pool.checkout()
+    opening, fail = threading.Event(), threading.Event()
+
+    def slow_failing_open():
+        opening.set()
+        fail.wait()
+        failing_open()
+
+    open_connection = pool._open
+    monkeypatch.setattr(pool, "_open", slow_failing_open)
+    failed = []
+    opener = threading.Thread(target=lambda: failed.append(pytest.raises(sqlite3.OperationalError, pool.checkout)))
+    opener.start()
+    opening.wait()
+
+    # The pool is full (one connection out, one being opened), so this checkout has to wait
+    monkeypatch.setattr(pool, "_open", open_connection)
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(pool.checkout()))
+    waiter.start()
+    time.sleep(0.1)
+    assert not result
+    started = time.perf_counter()
+    fail.set()
+    waiter.join()
+    opener.join()
+    assert failed and result
+    assert time.perf_counter() - started < 1  # Woken by the freed slot, not by its 5 s timeout
+    assert pool.stats()["size"] == 2
+    pool.checkin(first)
+    pool.checkin(result[0])
+    pool.close()
+
+
+def test_close_wakes_waiting_checkouts(tmp_path):
+    pool = load_example(11).ConnectionPool(str(tmp_path / "11.db"), max_size=1, timeout=5)
+    conn = pool.checkout()
+    errors = []
+
+    def checkout():
+        try:
+            pool.checkout()
+        except sqlite3.ProgrammingError as e:
+            errors.append(e)
+
+    waiter = threading.Thread(target=checkout)
+    waiter.start()
+    time.sleep(0.1)
+    pool.close()
+    waiter.join(1)
+    assert not waiter.is_alive() and errors
+    pool.checkin(conn)
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")  # Closed on checkin once the pool is closed
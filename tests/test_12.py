@@ -0,0 +1,84 @@
+import asyncio
+import contextlib
+import io
+import sqlite3
+
+from conftest import load_example
+
+SLOW_SQL = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 1000000) SELECT COUNT(*) FROM c"
+
+
+async def open_async_database(path):
+    database = load_example(12).AsyncStudentDatabase(str(path))
+    with contextlib.redirect_stdout(io.StringIO()):
+        await database.connect()
+        await database.create_tables()
+        await database.insert_students_many([(f"Student {i}", 20 + i) for i in range(5)])
+    return database
+
+
+async def close_async_database(database):
+    with contextlib.redirect_stdout(io.StringIO()):
+        await database.close_connection()
+
+
+def test_awaiting_a_slow_query_leaves_the_event_loop_free(tmp_path):
+    async def main():
+        database = await open_async_database(tmp_path / "12.db")
+        other = await open_async_database(tmp_path / "12.db")
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.001)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        try:
+            # Two instances serve their queries side by side while the loop keeps ticking
+            slow, fast = await asyncio.gather(
+                database.fetch_query(SLOW_SQL),
+                other.fetch_query("SELECT name FROM students WHERE id = ?", (2,)))
+        finally:
+            ticker.cancel()
+        assert slow == [(1000000,)] and fast == [("Student 1",)]
+        assert ticks >= 10
+        await close_async_database(database)
+        await close_async_database(other)
+
+    asyncio.run(main())
+
+
+def test_iter_query_streams_and_closes_its_cursor(tmp_path):
+    path = tmp_path / "12.db"
+
+    def write():
+        writer = sqlite3.connect(path, timeout=0)
+        try:
+            writer.execute("INSERT INTO courses (name, student_id) VALUES ('Mathematics', 1)")
+            writer.commit()
+        finally:
+            writer.close()
+
+    async def main():
+        database = await open_async_database(path)
+        async with contextlib.aclosing(database.iter_query("SELECT * FROM students ORDER BY id", arraysize=2)) as rows:
+            async for row in rows:
+                assert row == (1, "Student 0", 20)
+                # The query is still running, so its read lock keeps writers out
+                try:
+                    write()
+                except sqlite3.OperationalError as e:
+                    assert "locked" in str(e)
+                else:
+                    raise AssertionError("the query finished before the first row was used")
+                break
+        write()  # The cursor was closed on the way out
+
+        assert [row async for row in database.iter_students()] == [(i + 1, f"Student {i}", 20 + i) for i in range(5)]
+        write()
+        assert [row async for row in database.iter_courses(1)] == [(1, "Mathematics", 1), (2, "Mathematics", 1)]
+        await close_async_database(database)
+
+    asyncio.run(main())
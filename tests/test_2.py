@@ -0,0 +1,47 @@
+import contextlib
+import io
+import sqlite3
+
+import pytest
+
+from conftest import load_example
+
+
+def test_a_schema_only_session_is_saved(tmp_path):
+    backing_file = tmp_path / "2.db"
+    database = load_example(2).StudentDatabase(str(backing_file), durability="full")
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.connect()
+        database.create_table()
+        database.close_connection()
+
+    conn = sqlite3.connect(backing_file)
+    try:
+        assert conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'students'").fetchall() == [("students",)]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("read_uncommitted", [True, False])
+def test_thread_connections_and_uncommitted_writes(read_uncommitted):
+    database = load_example(2).StudentDatabase(shared_name=f"uncommitted_{read_uncommitted}", read_uncommitted=read_uncommitted)
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.connect()
+        database.create_table()
+        database.insert_students_many([("John Doe", 20)])
+    reader = database.thread_connection()
+    try:
+        database.conn.execute("BEGIN")
+        database.conn.execute("INSERT INTO students (name, age) VALUES ('Jane Smith', 22)")
+        if read_uncommitted:
+            # A dirty read: the row is visible before COMMIT and gone after ROLLBACK
+            assert reader.execute("SELECT COUNT(*) FROM students").fetchone() == (2,)
+        else:
+            with pytest.raises(sqlite3.OperationalError, match="locked"):
+                reader.execute("SELECT COUNT(*) FROM students").fetchone()
+        database.conn.rollback()
+        assert reader.execute("SELECT COUNT(*) FROM students").fetchone() == (1,)
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.release_thread_connection()
+            database.close_connection()
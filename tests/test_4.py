@@ -0,0 +1,153 @@
+import contextlib
+import io
+
+import pytest
+
+from conftest import load_example
+
+
+def quietly(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+@pytest.fixture(params=["trigram", "unicode61", None])
+def search_database(request, open_database, monkeypatch):
+    # A database whose search indexes use the given tokenizer; None is a SQLite without FTS5
+    example = load_example(4)
+    if request.param == "trigram" and example.FTS_TOKENIZER != "trigram":
+        pytest.skip("SQLite has no trigram tokenizer (3.34+)")
+    if request.param == "unicode61" and example.FTS_TOKENIZER is None:
+        pytest.skip("SQLite has no FTS5")
+    monkeypatch.setattr(example, "FTS_TOKENIZER", request.param)
+    database = open_database(4)
+    quietly(database.insert_students_many, [("John Doe", 20), ("Jane Johnson", 22), ("Bob Smith", 23)])
+    quietly(database.insert_courses_many, [("Mathematics", 1), ("Physics", 2), ("Applied Mathematics", 3)])
+    return database, request.param
+
+
+def names(rows):
+    return sorted(row[1] for row in rows)
+
+
+def check_index(database, tokenizer):
+    if tokenizer is not None:
+        for table in ("students", "courses"):
+            database.conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('integrity-check')")
+
+
+def test_search_matches_by_tokenizer(search_database):
+    database, tokenizer = search_database
+    # Substring matches for trigram and the LIKE scan, word prefixes for unicode61
+    expected = ["Jane Johnson", "John Doe"] if tokenizer != "unicode61" else []
+    assert names(database.search_students("ohn")) == expected
+    assert names(database.search_students("joh")) == ["Jane Johnson", "John Doe"]
+    assert names(database.search_students("jane joh")) == ["Jane Johnson"]
+    # unicode61 matches every word, in any order
+    assert names(database.search_students("doe john")) == (["John Doe"] if tokenizer == "unicode61" else [])
+    assert names(database.search_courses("mathematics")) == ["Applied Mathematics", "Mathematics"]
+    # Terms too short for a trigram fall back to LIKE, as do terms without a word
+    assert names(database.search_students("Jo")) == ["Jane Johnson", "John Doe"]
+    assert names(database.search_students("")) == ["Bob Smith", "Jane Johnson", "John Doe"]
+    assert names(database.search_students('"')) == []
+    check_index(database, tokenizer)
+
+
+def test_ranked_and_unranked_search_find_the_same_rows(search_database):
+    database, _ = search_database
+    ranked = list(database.search_students("john"))
+    assert sorted(ranked) == list(database.search_students("john", ranked=False))
+    assert len(list(database.search_students("john", limit=1))) == 1
+
+
+def test_search_follows_inserts_updates_and_deletes(search_database):
+    database, tokenizer = search_database
+    quietly(database.insert_student, "Alex Johnston", 24)
+    quietly(database.insert_course, "Physical Chemistry", 4)
+    assert names(database.search_students("johns")) == ["Alex Johnston", "Jane Johnson"]
+    assert names(database.search_courses("physic")) == ["Physical Chemistry", "Physics"]
+
+    database.conn.execute("UPDATE students SET name = 'Jane Smith' WHERE name = 'Jane Johnson'")
+    database.conn.execute("UPDATE students SET id = 10 WHERE name = 'Alex Johnston'")
+    database.conn.execute("UPDATE courses SET name = 'Biology' WHERE name = 'Physics'")
+    database.conn.execute("DELETE FROM students WHERE name = 'John Doe'")
+    database.conn.execute("DELETE FROM courses WHERE name = 'Applied Mathematics'")
+    database.conn.commit()
+
+    assert [tuple(row) for row in database.search_students("johns")] == [(10, "Alex Johnston", 24)]
+    assert names(database.search_students("smith")) == ["Bob Smith", "Jane Smith"]
+    assert names(database.search_students("john doe")) == []
+    assert names(database.search_courses("physic")) == ["Physical Chemistry"]
+    assert names(database.search_courses("biology")) == ["Biology"]
+    assert names(database.search_courses("mathematics")) == ["Mathematics"]
+    check_index(database, tokenizer)
+
+
+def test_rows_inserted_before_the_search_index_are_indexed(search_database):
+    database, tokenizer = search_database
+    if tokenizer is None:
+        pytest.skip("no search index")
+    for table in ("students", "courses"):
+        database.conn.execute(f"DROP TABLE {table}_fts")
+        for trigger in ("insert", "update", "delete"):
+            database.conn.execute(f"DROP TRIGGER {table}_fts_{trigger}")
+    database.conn.execute("INSERT INTO students (name, age) VALUES ('Alex Johnston', 24)")
+    database.conn.commit()
+    quietly(database.ensure_search_index)
+    assert names(database.search_students("johns")) == ["Alex Johnston", "Jane Johnson"]
+    check_index(database, tokenizer)
+
+
+@pytest.fixture
+def filter_database(open_database):
+    database = open_database(4)
+    quietly(database.insert_students_many, [(f"Student {i}", 18 + i % 10) for i in range(1, 1201)])
+    return database
+
+
+@pytest.mark.parametrize("count", [0, 1, 8, 999, 1000, 1024, 1025])
+def test_filter_students_in_at_the_list_size_edges(filter_database, count):
+    database = filter_database
+    # count distinct values, one of them matching no student; duplicates are dropped first
+    ids = list(range(1, count))
+    rows = list(database.filter_students_in("id", ids + ids[:5] + ([5000] if count else [])))
+    assert [row[0] for row in rows] == ids
+    # Lists longer than SQLite's oldest variable limit (999) go through a temporary table
+    assert database._filter_table_count == (count > 999)
+    assert not database.conn.in_transaction
+
+
+def test_filter_students_in_other_columns(filter_database):
+    database = filter_database
+    assert [row[1] for row in database.filter_students_in("name", ["Student 3", "Student 1", "nobody"])] == \
+        ["Student 1", "Student 3"]
+    ages = list(range(-2000, 20)) + [None]
+    assert {row[2] for row in database.filter_students_in("age", ages)} == {18, 19}
+    with pytest.raises(ValueError):
+        database.filter_students_in("name; DROP TABLE students", ["x"])
+
+
+def test_filter_temp_tables_are_reused(filter_database):
+    database = filter_database
+    ids = list(range(1, 1101))
+    for _ in range(3):
+        assert len(list(database.filter_students_in("id", ids))) == 1100
+    assert database._filter_table_count == 1
+    # Filters iterated at the same time each get their own table, and both are reused afterwards
+    first, second = database.filter_students_in("id", ids), database.filter_students_in("id", ids[:1000])
+    assert (next(first)[0], next(second)[0]) == (1, 1)
+    assert (len(list(first)), len(list(second))) == (1099, 999)
+    assert database._filter_table_count == 2
+    assert sorted(database._filter_tables) == ["temp.filter_values_1", "temp.filter_values_2"]
+    assert database.conn.execute("SELECT COUNT(*) FROM temp.filter_values_1").fetchone()[0] == 0
+    assert not database.conn.in_transaction
+
+
+def test_a_filter_inside_a_transaction_leaves_it_open(filter_database):
+    database = filter_database
+    database.conn.execute("BEGIN")
+    database.conn.execute("INSERT INTO students (name, age) VALUES ('Alex Johnson', 23)")
+    assert len(list(database.filter_students_in("id", range(1, 1202)))) == 1201
+    assert database.conn.in_transaction
+    database.conn.rollback()
+    assert database.conn.execute("SELECT COUNT(*) FROM students").fetchone()[0] == 1200
@@ -0,0 +1,72 @@
+import sqlite3
+
+from conftest import load_example
+
+
+def names(rows):
+    return sorted(row[1] for row in rows)
+
+
+def test_suffix_search_matches_a_scan(open_database):
+    database = open_database(5)
+    database.insert_students_many([("Alex Johnson", 20), ("Jane Smith", 21), ("Ann", 22), ("ANN", 23), (None, 24)])
+    for pattern, operator in [("*son", "GLOB"), ("*nn", "GLOB"), ("%nn", "LIKE"), ("%SON", "LIKE")]:
+        expected = database.conn.execute(f"SELECT * FROM students WHERE name {operator} ?", (pattern,)).fetchall()
+        assert names(database.find_students_by_name(pattern, operator)) == names(expected)
+        sql, params = database._name_query(pattern, operator)
+        assert any("idx_student_names_reversed" in detail for detail in database.query_plan(sql, params))
+
+
+def test_other_connections_write_without_the_udf(open_database):
+    database = open_database(5)
+    database.insert_students_many([("Alex Johnson", 20)])
+    # A connection without reverse(), like the other scripts sharing example.db
+    other = sqlite3.connect(database.db_name)
+    other.execute("INSERT INTO students (name, age) VALUES ('Bob Jackson', 30)")
+    other.execute("UPDATE students SET name = 'Alex Martin' WHERE name = 'Alex Johnson'")
+    other.commit()
+    other.close()
+    assert names(database.find_students_by_name("*son")) == ["Bob Jackson"]
+    assert names(database.find_students_by_name("*tin")) == ["Alex Martin"]
+
+
+def test_dump_restores_without_the_udf(open_database, tmp_path):
+    database = open_database(5)
+    database.insert_students_many([("Alex Johnson", 20)])
+    list(database.find_students_by_name("*son"))
+    restored = sqlite3.connect(str(tmp_path / "restored.db"))
+    restored.executescript("\n".join(database.conn.iterdump()))
+    restored.execute("INSERT INTO students (name, age) VALUES ('Bob Jackson', 30)")
+    restored.close()
+
+
+def test_replaces_an_expression_index_from_an_older_schema(open_database):
+    database = open_database(5)
+    database.conn.execute("CREATE INDEX idx_students_name_reversed ON students (reverse(name) COLLATE NOCASE)")
+    database.ensure_indexes()
+    assert database.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_students_name_reversed'").fetchone() is None
+    assert load_example(5)._reverse("abc") == "cba"
+
+
+def test_a_suffix_search_leaves_the_callers_transaction_open(open_database):
+    database = open_database(5)
+    database.insert_students_many([("Alex Johnson", 20)])
+    database.conn.execute("INSERT INTO students (name, age) VALUES ('Bob Jackson', 30)")
+    assert database.conn.in_transaction
+    assert names(database.find_students_by_name("*son")) == ["Alex Johnson", "Bob Jackson"]
+    assert database.conn.in_transaction
+    other = sqlite3.connect(database.db_name)
+    try:
+        assert other.execute("SELECT name FROM students").fetchall() == [("Alex Johnson",)]
+    finally:
+        other.close()
+    database.conn.rollback()
+    assert names(database.find_students_by_name("*son")) == ["Alex Johnson"]
+
+
+def test_a_suffix_search_outside_a_transaction_saves_the_refresh(open_database):
+    database = open_database(5)
+    database.insert_students_many([("Alex Johnson", 20)])
+    assert names(database.find_students_by_name("*son")) == ["Alex Johnson"]
+    assert not database.conn.in_transaction
+    assert database.conn.execute("SELECT COUNT(*) FROM student_names_reversed_pending").fetchone()[0] == 0
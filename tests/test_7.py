@@ -0,0 +1,258 @@
+import contextlib
+import io
+import random
+import sqlite3
+import sys
+import time
+
+import pytest
+
+
+def test_idle_time_is_not_charged_to_the_previous_statement(open_database):
+    database = open_database(7)
+    slow = []
+    database.enable_instrumentation(slow_query_ms=100, on_slow=slow.append)
+    database.conn.execute("INSERT INTO students (name, age) VALUES ('Alex Johnson', 20)")
+    database.conn.commit()
+    time.sleep(0.3)
+    database.conn.executescript("CREATE TABLE scratch (a); DROP TABLE scratch;")
+    time.sleep(0.3)
+    assert database.conn.execute("SELECT COUNT(*) FROM students").fetchall() == [(1,)]
+    database.disable_instrumentation()
+
+    assert slow == []
+    stats = database.query_stats.statements
+    assert {"COMMIT", "CREATE TABLE scratch (a);", "DROP TABLE scratch;", "SELECT COUNT(*) FROM students"} <= set(stats)
+    assert all(entry["max_ms"] < 100 for entry in stats.values())
+
+
+def test_a_slow_statement_is_still_flagged(open_database):
+    database = open_database(7)
+    slow = []
+    database.enable_instrumentation(slow_query_ms=20, on_slow=slow.append)
+    database.conn.execute("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 1000000) "
+                          "SELECT COUNT(*) FROM c").fetchall()
+    database.disable_instrumentation()
+    assert [query["sql"].startswith("WITH RECURSIVE") for query in slow] == [True]
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_age_group_counts_match_the_case_report(open_database, monkeypatch, use_numpy):
+    database = open_database(7)
+    example = sys.modules[type(database).__module__]
+    if use_numpy and example.numpy is None:
+        pytest.skip("NumPy is not installed")
+    if not use_numpy:
+        monkeypatch.setattr(example, "numpy", None)
+    ages = [17, 17.5, 18, 24, 24.5, 25, 40, None, "John Doe"]
+    database.insert_students_many([(f"Student {i}", age) for i, age in enumerate(ages)])
+    database.insert_courses_many([("Mathematics", i + 1) for i in range(len(ages))] +
+                                 [("Physics", i + 1) for i in range(0, len(ages), 2)] + [(None, 1)])
+
+    expected = {}
+    for name, group in database.conn.execute(
+            "SELECT courses.name, CASE WHEN students.age < 18 THEN 'Under 18' WHEN students.age >= 18 AND students.age < 25 "
+            "THEN '18-24' ELSE '25+' END FROM students JOIN courses ON students.id = courses.student_id"):
+        expected.setdefault(name, {"Under 18": 0, "18-24": 0, "25+": 0})[group] += 1
+    assert database.age_group_counts() == expected
+
+
+def traced_plans(database, method, *args):
+    # Run method and return its rows plus the query plan of every SELECT it executed
+    statements = []
+    database.conn.set_trace_callback(statements.append)
+    try:
+        rows = sorted(method(*args))
+    finally:
+        database.conn.set_trace_callback(None)
+    return rows, [database.query_plan(sql) for sql in statements if sql.startswith("SELECT")]
+
+
+def test_enrollment_reports_do_not_scan_courses(open_database):
+    database = open_database(7)
+    database.insert_students_many([("John Doe", 20), ("Jane Smith", 22)])
+    database.insert_courses_many([("Mathematics", 1), ("Physics", 1)])
+    for method, args in [(database.students_not_enrolled, ()),
+                         (database.students_enrolled_in_all, (["Mathematics", "Physics"],)),
+                         (database.students_enrolled_in_all, (["Mathematics"],))]:
+        _, plans = traced_plans(database, method, *args)
+        assert plans
+        for plan in plans:
+            assert not any(detail.startswith("SCAN courses") for detail in plan), plan
+            assert any(detail.startswith("SEARCH courses USING COVERING INDEX") for detail in plan), plan
+
+
+def test_enrollment_reports(open_database):
+    database = open_database(7)
+    # Two students share a name; only ids tell them apart
+    database.insert_students_many([("John Doe", 20), ("Jane Smith", 22), ("John Doe", 23), ("Alex Johnson", 24)])
+    assert sorted(database.students_enrolled_in_all(["Mathematics"])) == []
+    assert sorted(database.students_not_enrolled()) == [(1, "John Doe"), (2, "Jane Smith"), (3, "John Doe"),
+                                                        (4, "Alex Johnson")]
+
+    database.insert_courses_many([("Mathematics", 1), ("Physics", 1), ("Mathematics", 1),
+                                  ("Mathematics", 2), ("Physics", 3)])
+    assert sorted(database.students_not_enrolled()) == [(4, "Alex Johnson")]
+    assert sorted(database.students_enrolled_in_all(["Mathematics", "Physics"])) == [(1, "John Doe")]
+    assert sorted(database.students_enrolled_in_all(["Physics", "Physics"])) == [(1, "John Doe"), (3, "John Doe")]
+    assert sorted(database.students_enrolled_in_all(["Mathematics", "Chemistry"])) == []
+    # Every student is enrolled in all of no courses
+    assert sorted(database.students_enrolled_in_all([])) == [(1, "John Doe"), (2, "Jane Smith"), (3, "John Doe"),
+                                                             (4, "Alex Johnson")]
+
+
+@pytest.mark.parametrize("recursive_triggers", ["ON", "OFF"])
+@pytest.mark.parametrize("seed", [7, 8, 9])
+def test_course_summary_follows_random_writes_including_replace(open_database, recursive_triggers, seed):
+    database = open_database(7)
+    database.enable_course_summary()
+    # Any connection may write, with either setting
+    database.conn.execute(f"PRAGMA recursive_triggers={recursive_triggers}")
+    rng = random.Random(seed)
+    names = ["Mathematics", "Physics", "Chemistry", None]
+    ages = [None, 17, 20, 23, 30]
+    statements = [
+        lambda: ("INSERT INTO students (name, age) VALUES (?, ?)", ("Student", rng.choice(ages))),
+        lambda: ("INSERT OR REPLACE INTO students (id, name, age) VALUES (?, ?, ?)",
+                 (rng.randint(1, 8), "Student", rng.choice(ages))),
+        lambda: ("REPLACE INTO courses (id, name, student_id) VALUES (?, ?, ?)",
+                 (rng.randint(1, 12), rng.choice(names), rng.randint(1, 8))),
+        lambda: ("INSERT INTO courses (name, student_id) VALUES (?, ?)", (rng.choice(names), rng.randint(1, 8))),
+        lambda: ("UPDATE students SET age = ? WHERE id = ?", (rng.choice(ages), rng.randint(1, 8))),
+        lambda: ("UPDATE OR REPLACE students SET id = ? WHERE id = ?", (rng.randint(1, 8), rng.randint(1, 8))),
+        lambda: ("UPDATE OR REPLACE courses SET id = ?, name = ? WHERE id = ?",
+                 (rng.randint(1, 12), rng.choice(names), rng.randint(1, 12))),
+        lambda: ("DELETE FROM students WHERE id = ?", (rng.randint(1, 8),)),
+        lambda: ("DELETE FROM courses WHERE id = ?", (rng.randint(1, 12),)),
+        lambda: ("INSERT OR IGNORE INTO students (id, name, age) VALUES (?, ?, ?)",
+                 (rng.randint(1, 8), "Student", rng.choice(ages))),
+        lambda: ("INSERT OR IGNORE INTO courses (id, name, student_id) VALUES (?, ?, ?)",
+                 (rng.randint(1, 12), rng.choice(names), rng.randint(1, 8))),
+        lambda: ("UPDATE courses SET student_id = ? WHERE id = ?", (rng.randint(1, 8), rng.randint(1, 12))),
+    ]
+    for _ in range(500):
+        database.conn.execute(*rng.choice(statements)())
+    database.conn.commit()
+    assert database.conn.execute("SELECT COUNT(*) FROM course_age_summary").fetchone()[0] > 0
+    assert database.check_course_summary() == []
+    # The ledgers hold exactly the rows that are counted
+    query = database.conn.execute
+    assert query("SELECT * FROM course_age_summary_students ORDER BY id").fetchall() == \
+        query("SELECT id, age FROM students ORDER BY id").fetchall()
+    assert query("SELECT * FROM course_age_summary_enrollments ORDER BY id").fetchall() == \
+        query("SELECT id, name, student_id FROM courses WHERE name IS NOT NULL ORDER BY id").fetchall()
+
+
+def cached_database(open_database):
+    database = open_database(7)
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.insert_students_many([("John Doe", 20), ("Jane Smith", 22)])
+        database.insert_courses_many([("Mathematics", 1), ("Physics", 2)])
+        database.enable_course_summary()
+    database.enable_result_cache()
+    return database
+
+
+def test_tables_read_come_from_the_statement_plan(open_database):
+    database = cached_database(open_database)
+    assert database._tables_read("SELECT name FROM students WHERE name = ?", ("John Doe",)) == {"students"}
+    assert database._tables_read("SELECT students.name, courses.name FROM students JOIN courses "
+                                 "ON students.id = courses.student_id", ()) == {"students", "courses"}
+    # Statements that write are never cached
+    assert database._tables_read("UPDATE students SET age = age", ()) is None
+
+
+def test_a_write_drops_the_cached_results_of_its_table_only(open_database):
+    database = cached_database(open_database)
+    assert [row[1] for row in database.iter_students()] == ["John Doe", "Jane Smith"]
+    assert len(list(database.iter_courses())) == 2
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.update_student(1, "John Smith")
+    assert database.result_cache_stats()["invalidations"] == 1
+    assert [row[1] for row in database.iter_students()] == ["John Smith", "Jane Smith"]
+    assert len(list(database.iter_courses())) == 2
+    assert database.result_cache_stats()["hits"] == 1  # Only the courses were still cached
+
+
+def test_a_write_through_a_trigger_drops_the_cached_results(open_database):
+    database = cached_database(open_database)
+    assert list(database.average_age_by_course(0)) == [("Mathematics", 20.0), ("Physics", 22.0)]
+    # Inserting a course changes course_age_summary through the summary's triggers
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.insert_course("Mathematics", 2)
+    assert list(database.average_age_by_course(0)) == [("Mathematics", 21.0), ("Physics", 22.0)]
+    assert database.result_cache_stats()["hits"] == 0
+
+
+def test_a_commit_from_another_connection_clears_the_cache(open_database):
+    database = cached_database(open_database)
+    assert len(list(database.iter_students())) == 2
+    assert len(list(database.iter_students())) == 2
+    other = sqlite3.connect(database.db_name)
+    try:
+        other.execute("INSERT INTO students (name, age) VALUES ('Alex Johnson', 23)")
+        other.commit()
+    finally:
+        other.close()
+    assert len(list(database.iter_students())) == 3
+    stats = database.result_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["invalidations"]) == (1, 2, 1)
+
+
+def test_rows_read_inside_a_transaction_are_not_cached(open_database):
+    database = cached_database(open_database)
+    database.conn.execute("BEGIN")
+    database.conn.execute("INSERT INTO students (name, age) VALUES ('Alex Johnson', 23)")
+    assert len(list(database.iter_students())) == 3
+    database.conn.rollback()
+    assert len(list(database.iter_students())) == 2
+
+
+def test_the_cache_evicts_the_least_recently_used_entry_by_count(open_database):
+    cache = sys.modules[type(open_database(7)).__module__].ResultCache(max_entries=2)
+    cache.put("a", [(1,)], {"students"})
+    cache.put("b", [(2,)], {"students"})
+    assert cache.get("a") == [(1,)]
+    cache.put("c", [(3,)], {"courses"})
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.evictions == 1 and cache.keys_by_table == {"students": {"a"}, "courses": {"c"}}
+
+
+def test_the_cache_evicts_by_size(open_database):
+    ResultCache = sys.modules[type(open_database(7)).__module__].ResultCache
+    a, b, c = ([(i, f"Student {i}") for i in range(100)][:] for _ in range(3))
+    size = ResultCache.size(a)
+    assert ResultCache.size(b) == ResultCache.size(c) == size
+    cache = ResultCache(max_bytes=2 * size)
+    cache.put("a", a, {"students"})
+    cache.put("b", b, {"students"})
+    assert cache.bytes == 2 * size
+    cache.put("c", c, {"students"})
+    assert list(cache.entries) == ["b", "c"] and cache.bytes == 2 * size and cache.evictions == 1
+    # A result larger than the whole cache is not stored, and does not evict anything
+    cache.put("d", a * 3, {"students"})
+    assert list(cache.entries) == ["b", "c"]
+    cache.invalidate({"students"})
+    assert cache.entries == {} and cache.bytes == 0 and cache.invalidations == 2
+
+
+def test_instrumentation_wraps_the_connection_only_while_enabled(open_database):
+    database = open_database(7)
+    conn = database.conn
+    assert type(conn) is sqlite3.Connection
+    database.enable_instrumentation()
+    assert database.conn is not conn and database.conn.wrapped is conn
+    cursor = database.conn.cursor()
+    cursor.arraysize = 7
+    assert cursor.execute("SELECT 1 UNION ALL SELECT 2").fetchmany() == [(1,), (2,)]
+    assert [row for row in database.conn.execute("SELECT 3")] == [(3,)]
+    with database.conn:
+        database.conn.execute("INSERT INTO students (name, age) VALUES ('John Doe', 20)")
+    database.disable_instrumentation()
+    assert database.conn is conn and conn.row_factory is None
+    assert {"SELECT ? UNION ALL SELECT ?", "SELECT ?", "COMMIT"} <= set(database.query_stats.statements)
+    assert database.query_stats.statements["SELECT ? UNION ALL SELECT ?"]["rows"] == 2
+    # Nothing is recorded once disabled
+    count = sum(entry["count"] for entry in database.query_stats.statements.values())
+    conn.execute("SELECT 4").fetchall()
+    assert sum(entry["count"] for entry in database.query_stats.statements.values()) == count
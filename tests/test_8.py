@@ -0,0 +1,54 @@
+import contextlib
+import io
+
+import pytest
+
+
+def stats_without_summary(database):
+    avg_age, count, max_age, min_age, sum_age = database.conn.execute(
+        "SELECT AVG(age), COUNT(*), MAX(age), MIN(age), SUM(age) FROM students").fetchone()
+    return {"avg": avg_age, "count": count, "max": max_age, "min": min_age, "sum": sum_age}
+
+
+def assert_summary_matches(database):
+    summary, expected = database.student_age_stats(), stats_without_summary(database)
+    assert summary["count"] == expected["count"]
+    assert summary["max"] == expected["max"] and summary["min"] == expected["min"]
+    assert summary["avg"] == pytest.approx(expected["avg"])
+    assert summary["sum"] == pytest.approx(expected["sum"])
+
+
+def test_age_summary_with_non_integer_ages(open_database):
+    database = open_database(8)
+    ages = [20, 22, None, 20.5, "twenty", "21", 22]
+    database.insert_students_many([(f"Student {i}", age) for i, age in enumerate(ages)])
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        database.enable_age_summary()
+    assert "error" not in output.getvalue()
+    assert database.age_summary
+    assert_summary_matches(database)
+
+    # The triggers accept any age, as students does without the summary
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        database.insert_student("Real Age", 19.5)
+        database.insert_student("Text Age", "thirty")
+    assert "error" not in output.getvalue()
+    assert database.conn.execute("SELECT COUNT(*) FROM students").fetchone()[0] == len(ages) + 2
+    assert_summary_matches(database)
+
+    database.conn.execute("UPDATE students SET age = 'old' WHERE age = 20")
+    database.conn.execute("UPDATE students SET age = 23 WHERE age = 'twenty'")
+    database.conn.execute("DELETE FROM students WHERE age = 20.5")
+    database.conn.commit()
+    assert_summary_matches(database)
+
+    database.conn.execute("DELETE FROM students")
+    database.conn.commit()
+    assert database.student_age_stats() == {"avg": None, "count": 0, "max": None, "min": None, "sum": None}
+
+
+def test_age_statistics_skip_non_integer_ages(open_database):
+    database = open_database(8)
+    database.insert_students_many([("A", 20), ("B", "twenty"), ("C", None), ("D", 26)])
+    assert database.age_histogram() == {20: 1, 25: 1}
+    assert database.age_quantiles((0.5,)) == {0.5: 23.0}
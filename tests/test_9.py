@@ -0,0 +1,152 @@
+import contextlib
+import io
+import json
+import os
+import sqlite3
+
+import pytest
+
+
+def quietly(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        result = function(*args, **kwargs)
+    return result, output.getvalue()
+
+
+def restored_database(open_database, tmp_path, source, **kwargs):
+    quietly(source.dump_parallel, str(tmp_path / "dump"), **kwargs)
+    target = sqlite3.connect(str(tmp_path / "restored.db"))
+    database = open_database(9)
+    database.conn.close()
+    database.conn = target
+    _, output = quietly(database.restore_parallel_dump, str(tmp_path / "dump"), statements_per_transaction=7)
+    return database, output
+
+
+@pytest.mark.parametrize("compression", ["gzip", None])
+def test_values_with_newlines_survive_a_round_trip(open_database, tmp_path, compression):
+    source = open_database(9)
+    names = ["line1\nline2", "crlf\r\nvalue", "semicolon;\nINSERT", "plain", "it's;"] * 20
+    source.insert_students_many([(name, i) for i, name in enumerate(names)])
+    database, output = restored_database(open_database, tmp_path, source, compression=compression)
+    assert "error" not in output
+    assert database.conn.execute("SELECT name, age FROM students ORDER BY id").fetchall() == \
+        [(name, i) for i, name in enumerate(names)]
+
+
+def test_fts5_tables_are_rebuilt_not_copied(open_database, tmp_path):
+    source = open_database(9)
+    source.insert_students_many([("Alex Johnson", 20), ("Jane Smith", 21)])
+    source.conn.executescript("""
+        CREATE VIRTUAL TABLE students_fts USING fts5(name, content='students', content_rowid='id');
+        INSERT INTO students_fts(students_fts) VALUES ('rebuild');
+        CREATE TRIGGER students_fts_insert AFTER INSERT ON students BEGIN
+            INSERT INTO students_fts(rowid, name) VALUES (NEW.id, NEW.name);
+        END;
+        CREATE VIRTUAL TABLE notes USING fts5(body);
+        INSERT INTO notes(rowid, body) VALUES (5, 'transcript received');
+    """)
+    manifest, _ = quietly(source.dump_parallel, str(tmp_path / "dump"))
+    assert not any(table["name"].startswith(("students_fts_", "notes_")) for table in manifest["tables"])
+    database, output = restored_database(open_database, tmp_path, source)
+    assert "error" not in output
+    assert database.conn.execute("SELECT rowid FROM students_fts WHERE students_fts MATCH 'jane'").fetchall() == [(2,)]
+    assert database.conn.execute("SELECT rowid, body FROM notes WHERE notes MATCH 'transcript'").fetchall() == \
+        [(5, "transcript received")]
+    database.conn.execute("INSERT INTO students (name, age) VALUES ('Bob Jackson', 22)")
+    assert database.conn.execute("SELECT COUNT(*) FROM students_fts WHERE students_fts MATCH 'bob'").fetchone() == (1,)
+
+
+def test_a_failing_chunk_is_rolled_back(open_database, tmp_path):
+    source = open_database(9)
+    source.insert_students_many([(f"Student {i}", i) for i in range(20)])
+    quietly(source.dump_parallel, str(tmp_path / "dump"), compression=None)
+    with open(tmp_path / "dump" / "manifest.json") as file:
+        students = next(table for table in json.load(file)["tables"] if table["name"] == "students")
+    path = tmp_path / "dump" / students["file"]
+    lines = path.read_text().splitlines(keepends=True)
+    lines[10] = "INSERT INTO students VALUES(oops);\n"
+    path.write_text("".join(lines))
+
+    target = sqlite3.connect(str(tmp_path / "restored.db"))
+    database = open_database(9)
+    database.conn.close()
+    database.conn = target
+    _, output = quietly(database.restore_parallel_dump, str(tmp_path / "dump"), statements_per_transaction=7)
+    assert "error occurred" in output
+    # The first chunk of 7 committed; the one with the bad statement left nothing behind
+    assert target.execute("SELECT COUNT(*) FROM students").fetchone() == (7,)
+    assert not target.in_transaction
+
+
+def test_readers_are_closed_when_a_table_dump_fails(open_database, tmp_path, monkeypatch):
+    source = open_database(9)
+    source.insert_students_many([("Alex Johnson", 20)])
+
+    def failing_dump(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(source, "_dump_table", failing_dump)
+    _, output = quietly(source.dump_parallel, str(tmp_path / "dump"))
+    assert "disk full" in output
+    # An open reader would still hold a read transaction and block the exclusive lock
+    source.conn.execute("BEGIN EXCLUSIVE")
+    source.conn.rollback()
+    assert os.path.isdir(tmp_path / "dump")
+
+
+STUDENTS = [("John Doe", 20), ('Jane "JJ" Smith, Jr.', None), ("Multi\nLine", 23), ("", 0)]
+
+
+def students(database):
+    return database.conn.execute("SELECT id, name, age FROM students ORDER BY id").fetchall()
+
+
+@pytest.mark.parametrize("file_name", ["students.csv", "students.csv.gz"])
+def test_csv_export_and_import_round_trip(open_database, tmp_path, file_name):
+    database = open_database(9)
+    database.conn.executemany("INSERT INTO students (name, age) VALUES (?, ?)", STUDENTS)
+    database.conn.commit()
+    expected = students(database)
+    csv_file = str(tmp_path / file_name)
+
+    assert quietly(database.export_csv, "students", csv_file)[0] == len(STUDENTS)
+    with open(csv_file, "rb") as file:
+        assert (file.read(2) == b"\x1f\x8b") == file_name.endswith(".gz")
+    database.conn.execute("DELETE FROM students")
+    database.conn.commit()
+    assert quietly(database.import_csv, "students", csv_file)[0] == len(STUDENTS)
+    assert students(database) == expected
+
+    # With explicit columns the ids are assigned anew
+    assert quietly(database.import_csv, "students", csv_file, columns=["name", "age"])[0] == len(STUDENTS)
+    assert students(database)[len(STUDENTS):] == [(len(STUDENTS) + id, name, age) for id, name, age in expected]
+
+
+@pytest.mark.parametrize("content", ["", "id,name,age\r\n"])
+def test_importing_a_csv_without_rows(open_database, tmp_path, content):
+    database = open_database(9)
+    csv_file = tmp_path / "students.csv"
+    csv_file.write_text(content)
+    assert quietly(database.import_csv, "students", str(csv_file))[0] == 0
+    assert students(database) == []
+
+
+@pytest.mark.parametrize("columns, message", [
+    (["name", "nickname"], "table 'students' has no column 'nickname'"),
+    (["name", "email"], "column 'email' is not in the CSV header"),
+    (None, "no column of the CSV header is in table 'students'"),
+])
+def test_importing_unknown_columns_is_an_error(open_database, tmp_path, columns, message):
+    database = open_database(9)
+    csv_file = tmp_path / "students.csv"
+    csv_file.write_text("name,nickname,age\r\nJohn Doe,Johnny,20\r\n" if columns else "nickname\r\nJohnny\r\n")
+    result, output = quietly(database.import_csv, "students", str(csv_file), columns=columns)
+    assert result is None
+    assert message in output
+    assert students(database) == []
+
+
+def test_importing_a_missing_file_is_an_error(open_database, tmp_path):
+    database = open_database(9)
+    result, output = quietly(database.import_csv, "students", str(tmp_path / "missing.csv"))
+    assert result is None and "An error occurred while importing CSV" in output
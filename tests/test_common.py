@@ -0,0 +1,122 @@
+import contextlib
+import io
+import sqlite3
+import threading
+
+import pytest
+
+import common
+from conftest import load_example
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE students (id INTEGER PRIMARY KEY, name TEXT, age INTEGER CHECK (age >= 0))")
+    yield conn
+    conn.close()
+
+
+def test_insert_many_returns_the_id_range(conn):
+    rows = ((f"Student {i}", i) for i in range(25))
+    assert common.insert_many(conn, "INSERT INTO students (name, age) VALUES (?, ?)", rows, 10) == (1, 25)
+    assert common.insert_many(conn, "INSERT INTO students (name, age) VALUES (?, ?)", [("Jane Smith", 22)], 10) == (26, 26)
+    assert common.insert_many(conn, "INSERT INTO students (name, age) VALUES (?, ?)", [], 10) == (None, None)
+    assert conn.execute("SELECT COUNT(*), MIN(id), MAX(id) FROM students").fetchone() == (26, 1, 26)
+
+
+def test_insert_many_rolls_back_only_the_failing_chunk(conn):
+    rows = [(f"Student {i}", i if i != 15 else -1) for i in range(30)]
+    with pytest.raises(sqlite3.IntegrityError):
+        common.insert_many(conn, "INSERT INTO students (name, age) VALUES (?, ?)", rows, 10)
+    assert not conn.in_transaction
+    assert conn.execute("SELECT COUNT(*), MAX(age) FROM students").fetchone() == (10, 9)
+
+
+def test_insert_many_commits_an_open_transaction_first(conn):
+    conn.execute("INSERT INTO students (name, age) VALUES ('John Doe', 20)")
+    assert conn.in_transaction
+    with pytest.raises(sqlite3.IntegrityError):
+        common.insert_many(conn, "INSERT INTO students (name, age) VALUES (?, ?)", [("Bad", -1)], 10)
+    assert conn.execute("SELECT name FROM students").fetchall() == [("John Doe",)]
+
+
+def test_insert_many_holds_the_lock_per_chunk(conn):
+    lock = threading.Lock()
+    committed = []
+
+    def on_commit(count):
+        # Still under the lock, after the chunk's COMMIT
+        assert lock.locked() and not conn.in_transaction
+        committed.append(count)
+
+    common.insert_many(conn, "INSERT INTO students (name, age) VALUES (?, ?)",
+                       ((f"Student {i}", i) for i in range(25)), 10, lock=lock, on_commit=on_commit)
+    assert committed == [10, 10, 5]
+
+
+def test_iter_rows_fetches_arraysize_rows_at_a_time(conn):
+    common.insert_many(conn, "INSERT INTO students (name, age) VALUES (?, ?)", ((f"Student {i}", i) for i in range(25)), 100)
+    fetched = []
+
+    class Cursor(sqlite3.Cursor):
+        def fetchmany(self, size=None):
+            rows = super().fetchmany()
+            fetched.append(len(rows))
+            return rows
+
+    class Connection:
+        def cursor(self):
+            return conn.cursor(Cursor)
+
+    rows = common.iter_rows(Connection(), "SELECT age FROM students WHERE age >= ?", (5,), arraysize=8)
+    assert next(rows) == (5,) and fetched == [8]
+    assert [row[0] for row in rows] == list(range(6, 25))
+    assert fetched == [8, 8, 4, 0]
+
+
+def add_students_and_courses(database):
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.insert_students_many([("John Doe", 20), ("Jane Smith", 22)])
+        database.insert_courses_many([("Math", 1), ("Science", 2)])
+
+
+def test_records_get_a_type_per_result_shape(open_database):
+    example = load_example(3)
+    database = open_database(3, records=True)
+    add_students_and_courses(database)
+
+    students = list(database.iter_students())
+    assert type(students[0]) is example.Student
+    assert students[1].name == "Jane Smith" and students[1][2] == 22
+    courses = list(database.iter_courses())
+    assert type(courses[0]) is example.Course and courses[0].student_id == 1
+
+    # Ad-hoc SELECTs get a generated type, reused for the same columns
+    rows = list(database.iter_query("SELECT s.name, COUNT(*), c.name FROM students s JOIN courses c ON c.student_id = s.id GROUP BY s.id"))
+    assert rows[0]._fields == ("name", "COUNT___", "_2") and rows[0] == ("John Doe", 1, "Math")
+    again = next(database.iter_query("SELECT s.name, COUNT(*), c.name FROM students s JOIN courses c ON c.student_id = s.id GROUP BY s.id"))
+    assert type(again) is type(rows[0])
+
+
+def test_records_follow_a_cursor_that_changes_shape(open_database):
+    database = open_database(3, records=True)
+    add_students_and_courses(database)
+    cursor = database.conn.cursor()
+    assert cursor.execute("SELECT id, name FROM students").fetchone()._fields == ("id", "name")
+    assert cursor.execute("SELECT age FROM students").fetchone()._fields == ("age",)
+
+    # Interleaved cursors switch the cached type back and forth
+    students = database.conn.execute("SELECT * FROM students")
+    courses = database.conn.execute("SELECT * FROM courses")
+    rows = [students.fetchone(), courses.fetchone(), students.fetchone(), courses.fetchone()]
+    assert [type(row).__name__ for row in rows] == ["Student", "Course", "Student", "Course"]
+    assert rows[2].age == 22 and rows[3].name == "Science"
+
+
+def test_records_off_returns_plain_tuples(open_database):
+    database = open_database(3)
+    add_students_and_courses(database)
+    assert database.conn.row_factory is None
+    assert [type(row) for row in database.iter_students()] == [tuple, tuple]
+    assert list(database.iter_courses(2)) == [(2, "Science", 2)]
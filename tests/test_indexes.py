@@ -0,0 +1,42 @@
+import pytest
+
+EXAMPLES = range(3, 13)
+
+
+def students_table(number):
+    return "students1" if number == 10 else "students"
+
+
+def assert_uses_index(plan, table, index):
+    assert not any(detail.startswith(f"SCAN {table}") for detail in plan), plan
+    assert any(detail.startswith(f"SEARCH {table} USING") and index in detail for detail in plan), plan
+
+
+@pytest.mark.parametrize("number", EXAMPLES)
+def test_courses_of_a_student_use_the_student_id_index(open_database, number):
+    database = open_database(number)
+    for sql in ("SELECT * FROM courses WHERE student_id = ?", "DELETE FROM courses WHERE student_id = ?"):
+        assert_uses_index(database.query_plan(sql, (1,)), "courses", "INDEX idx_courses_student_id_name (student_id=?)")
+
+
+@pytest.mark.parametrize("number", EXAMPLES)
+def test_joins_search_courses_by_student_id(open_database, number):
+    database = open_database(number)
+    students = students_table(number)
+    join = f"SELECT {students}.name, courses.name FROM {students} JOIN courses ON {students}.id = courses.student_id"
+    # Every row is read once: only the outer table is scanned, the other side is an index lookup
+    plan = database.query_plan(join)
+    assert len(plan) == 2 and plan[0].startswith("SCAN") and plan[1].startswith("SEARCH"), plan
+    plan = database.query_plan(f"{join} WHERE {students}.name = ?", ("John Doe",))
+    assert_uses_index(plan, students, f"INDEX idx_{students}_name (name=?)")
+    assert_uses_index(plan, "courses", "COVERING INDEX idx_courses_student_id_name (student_id=?)")
+
+
+@pytest.mark.parametrize("number", EXAMPLES)
+def test_name_and_age_filters_use_their_indexes(open_database, number):
+    database = open_database(number)
+    students = students_table(number)
+    assert_uses_index(database.query_plan(f"SELECT * FROM {students} WHERE name = ?", ("John Doe",)),
+                      students, f"INDEX idx_{students}_name (name=?)")
+    assert_uses_index(database.query_plan(f"SELECT COUNT(*), MAX(age) FROM {students} WHERE age >= ?", (18,)),
+                      students, f"COVERING INDEX idx_{students}_age (age>?)")